@@ -2,4 +2,5 @@ from django.contrib import admin
 from .models import *
 # Register your models here.
 admin.site.register(ChatRoom)
-admin.site.register(ChatRoomMembership)
\ No newline at end of file
+admin.site.register(ChatRoomMembership)
+admin.site.register(ModerationTerm)
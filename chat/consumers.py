@@ -1,24 +1,172 @@
 # chat/consumers.py - WebSocket consumer for real-time chat
+import asyncio
 import json
 import logging
+import sys
+import uuid
+from collections import deque
+import redis
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from .models import ChatRoom, ChatRoomMembership
 from .services.redis_service import redis_chat_service
+from .services.reaction_service import apply_reaction, is_valid_emoji
+from .services.message_service import MessageRejected, create_message
+from .services.message_store import MessageStoreUnavailable
+from .idempotency import IdempotentWrite, is_valid_key
+from . import metrics
+from .fanout import (
+    announce_promotion, group_for_channel, group_send_room, room_group_name, room_message_rate,
+    shard_for_channel, user_group_name,
+)
 
 logger = logging.getLogger(__name__)
 
+# Reaction updates for the same message within this window are sent as one frame
+REACTION_COALESCE_SECONDS = getattr(settings, 'CHAT_REACTION_COALESCE_MS', 100) / 1000
+
+# Adaptive batching: once a room delivers more than CHAT_BATCH_THRESHOLD messages per second to a
+# connection, new messages are buffered for CHAT_BATCH_WINDOW_MS and sent as one messages_batch frame
+BATCH_THRESHOLD = getattr(settings, 'CHAT_BATCH_THRESHOLD', 50)
+BATCH_WINDOW_SECONDS = getattr(settings, 'CHAT_BATCH_WINDOW_MS', 30) / 1000
+
+# Each connection gets a bounded outbound queue drained by a writer task that runs only while frames
+# are queued, so a slow client never blocks channel-layer delivery. When the queue is full, presence and typing frames are
+# dropped first; if it is still full the client is disconnected and told to resync.
+OUTBOUND_QUEUE_SIZE = getattr(settings, 'CHAT_OUTBOUND_QUEUE_SIZE', 256)
+DROPPABLE_EVENT_TYPES = {'typing_indicator', 'user_joined', 'user_left'}
+SLOW_CONSUMER_CLOSE_CODE = 4008
+# Presence is refreshed at most once per interval per connection, on client pings
+PRESENCE_HEARTBEAT_SECONDS = getattr(settings, 'CHAT_PRESENCE_HEARTBEAT_SECONDS', 60)
+
+# Sent after a room_access_revoked notification for the room this socket is connected to
+ACCESS_REVOKED_CLOSE_CODE = 4003
+
+# A user's user_left is held back for CHAT_PRESENCE_GRACE_SECONDS after they disconnect; if they
+# reconnect to the room within that window neither user_left nor user_joined is broadcast, so a
+# reconnect storm after a deploy or failover does not also become a presence broadcast storm
+PRESENCE_GRACE_SECONDS = getattr(settings, 'CHAT_PRESENCE_GRACE_SECONDS', 10)
+
+# Server-driven liveness: a socket that sent nothing for CHAT_SERVER_PING_SECONDS is sent a ping frame
+# (clients answer with pong, or any frame); one silent for CHAT_IDLE_TIMEOUT_SECONDS is treated as a
+# dead peer, taken out of its groups and presence and closed. One sweep task per worker checks every
+# socket, so an idle connection costs no timer of its own. 0 turns the sweep off.
+SERVER_PING_SECONDS = getattr(settings, 'CHAT_SERVER_PING_SECONDS', 30)
+IDLE_TIMEOUT_SECONDS = getattr(settings, 'CHAT_IDLE_TIMEOUT_SECONDS', 90)
+IDLE_CLOSE_CODE = 4009
+SWEEP_YIELD_EVERY = 1000  # Sockets checked between yields to the event loop
+
+def redis_call(func):
+    """Run a blocking Redis call off the event loop. These calls never touch the ORM, so they use the
+    shared executor instead of queueing for the one thread sync_to_async uses by default."""
+    return sync_to_async(func, thread_sensitive=False)
+
+
+_held_leaves = set()  # Grace timers, referenced so they are not garbage collected while sleeping
+_live = set()  # Sockets watched by the liveness sweep
+_reaping = set()  # Reaps in progress, referenced for the same reason
+_sweeper = None
+
+
+def hold_user_left(room_id, user_id):
+    task = asyncio.ensure_future(announce_user_left_after_grace(room_id, user_id))
+    _held_leaves.add(task)
+    task.add_done_callback(_held_leaves.discard)
+
+
+async def announce_user_left_after_grace(room_id, user_id):
+    """Broadcast user_left once the grace window passes, unless a reconnect took the marker first"""
+    await asyncio.sleep(PRESENCE_GRACE_SECONDS)
+    try:
+        if await redis_call(redis_chat_service.take_leave_marker)(room_id, user_id):
+            await group_send_room(room_id, {'type': 'user_left', 'user_id': user_id})
+    except Exception as e:
+        logger.error(f"Error announcing user_left: {str(e)}")
+
+
+def watch_liveness(consumer):
+    global _sweeper
+    if SERVER_PING_SECONDS <= 0:
+        return
+    _live.add(consumer)
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.ensure_future(sweep_idle_connections())
+
+
+def unwatch_liveness(consumer):
+    _live.discard(consumer)
+
+
+def reap(consumer):
+    unwatch_liveness(consumer)
+    task = asyncio.ensure_future(consumer.reap_idle())
+    _reaping.add(task)
+    task.add_done_callback(_reaping.discard)
+
+
+async def sweep_idle_connections():
+    """Every half ping interval: ping quiet sockets and reap silent ones. Exits when none are left."""
+    loop = asyncio.get_running_loop()
+    while _live:
+        await asyncio.sleep(SERVER_PING_SECONDS / 2)
+        now = loop.time()
+        for checked, consumer in enumerate(list(_live), 1):
+            if consumer not in _live:  # Left while the sweep yielded
+                continue
+            if IDLE_TIMEOUT_SECONDS > 0 and now - consumer.last_seen >= IDLE_TIMEOUT_SECONDS:
+                reap(consumer)
+            elif now - max(consumer.last_seen, consumer.last_ping) >= SERVER_PING_SECONDS:
+                consumer.last_ping = now
+                await consumer.enqueue({'type': 'ping'})
+            if checked % SWEEP_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+
+
+def connection_footprint():
+    """Mean shallow ChatConsumer.footprint() over the sockets this worker is watching, 0 when there are none"""
+    consumers = list(_live)
+    return sum(consumer.footprint() for consumer in consumers) / len(consumers) if consumers else 0
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    # Per-connection state lives in slots; only the attributes Channels sets on its base classes
+    # (scope, channel layer, groups, ...) still go to the instance dict. The reaction and batch
+    # buffers are created when first used and dropped once flushed.
+    __slots__ = (
+        'room_id', 'space_id', 'room_group_name', 'shard_group_name', 'user_group_name', 'user',
+        'pending_reactions', 'reaction_flush_task', 'batching', 'message_batch', 'batch_flush_task',
+        'rate_window_start', 'rate_window_count', 'outbound', 'writer_task', 'evicted',
+        'last_heartbeat', 'last_seen', 'last_ping', 'left',
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.room_id = None
+        self.space_id = None
         self.room_group_name = None
+        self.shard_group_name = None
+        self.user_group_name = None
         self.user = None
+        self.pending_reactions = None
+        self.reaction_flush_task = None
+        self.batching = False
+        self.message_batch = None
+        self.batch_flush_task = None
+        self.rate_window_start = 0.0
+        self.rate_window_count = 0
+        self.outbound = None
+        self.writer_task = None
+        self.evicted = False
+        self.last_heartbeat = 0.0
+        self.last_seen = 0.0
+        self.last_ping = 0.0
+        self.left = False
 
     async def connect(self):
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'chat_{self.room_id}'
+        self.room_id = self.scope['url_route']['kwargs']['chat_room_id']
         self.user = self.scope['user']
 
         # Check authentication
@@ -27,67 +175,118 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        # Check room membership
-        has_access = await self.check_room_access(self.user, self.room_id)
-        if not has_access:
+        # Check room membership; the space comes from the room, not the URL
+        self.space_id = await self.check_room_access(self.user, self.room_id)
+        if not self.space_id:
             logger.warning(f"User {self.user.user_id} denied access to room {self.room_id}")
             await self.close()
             return
 
-        # Join room group
+        # Join the room group (or this socket's shard of it for very large rooms)
+        online_count = await redis_call(redis_chat_service.get_online_count)(self.room_id)
+        self.room_group_name, promoted = await redis_call(group_for_channel)(
+            self.room_id, self.channel_name, online_count)
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        if promoted:
+            await announce_promotion(self.room_id, self.channel_layer)
+        elif self.room_group_name == room_group_name(self.room_id):
+            # The shard count may be cached from before a promotion whose notice went out before this
+            # socket joined the base group; re-read it now that the socket would receive the notice
+            await self.join_shard()
+
+        # Join the user's own group so notify_user reaches this socket
+        self.user_group_name = user_group_name(self.user.user_id)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.register_connection()
 
-        # Mark user as online
+        # Mark user as online; a reconnect within the grace window takes back its pending user_left
         await self.set_user_online()
+        rejoined = PRESENCE_GRACE_SECONDS > 0 and await redis_call(redis_chat_service.take_leave_marker)(
+            self.room_id, str(self.user.user_id))
 
         # Accept WebSocket connection
         await self.accept()
+        self.start_writer()
+        self.last_seen = asyncio.get_running_loop().time()
+        watch_liveness(self)
+
+        # Join a busy room already batching instead of after the first rate window
+        if await redis_call(room_message_rate)(self.room_id) >= BATCH_THRESHOLD:
+            self.batching = True
+            self.rate_window_start = asyncio.get_running_loop().time()
 
         # Send connection confirmation
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'connection_established',
             'room_id': self.room_id,
             'user_id': str(self.user.user_id)
-        }))
+        })
 
         # Broadcast user joined
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_joined',
-                'user_id': str(self.user.user_id),
-                'user_info': await self.get_user_info(self.user)
-            }
-        )
+        if rejoined:
+            metrics.incr('ws_presence_suppressed')
+        else:
+            await group_send_room(
+                self.room_id,
+                {
+                    'type': 'user_joined',
+                    'user_id': str(self.user.user_id),
+                    'user_info': await self.get_user_info(self.user)
+                }
+            )
 
         logger.info(f"User {self.user.user_id} connected to room {self.room_id}")
 
     async def disconnect(self, close_code):
+        await self.leave()
+
+    async def leave(self):
+        """Leave groups and presence; runs once, whether the client went away or the socket was reaped"""
+        if self.left:
+            return
+        self.left = True
+        unwatch_liveness(self)
+        for task in (self.reaction_flush_task, self.batch_flush_task):
+            if task:
+                task.cancel()
+        self.stop_writer()
+
+        if self.user_group_name:
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+            await self.unregister_connection()
+
         if self.room_group_name and self.user:
-            # Mark user as offline
-            await self.set_user_offline()
+            # Mark user as offline, holding back user_left in case they reconnect
+            hold = PRESENCE_GRACE_SECONDS > 0
+            held = await self.set_user_offline(leaving=hold) and hold
 
             # Leave room group
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
+            if self.shard_group_name:
+                await self.channel_layer.group_discard(self.shard_group_name, self.channel_name)
 
             # Broadcast user left
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'user_left',
-                    'user_id': str(self.user.user_id)
-                }
-            )
+            if held:
+                hold_user_left(self.room_id, str(self.user.user_id))
+            else:
+                await group_send_room(
+                    self.room_id,
+                    {
+                        'type': 'user_left',
+                        'user_id': str(self.user.user_id)
+                    }
+                )
 
             logger.info(f"User {self.user.user_id} disconnected from room {self.room_id}")
 
     async def receive(self, text_data):
+        self.last_seen = asyncio.get_running_loop().time()
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
@@ -96,25 +295,32 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.handle_typing_start()
             elif message_type == 'typing_stop':
                 await self.handle_typing_stop()
+            elif message_type == 'send_message':
+                await self.handle_send_message(data)
+            elif message_type in ('reaction_add', 'reaction_remove'):
+                await self.handle_reaction(data, add=message_type == 'reaction_add')
             elif message_type == 'ping':
-                await self.send(text_data=json.dumps({'type': 'pong'}))
+                await self.heartbeat()
+                await self.send_event({'type': 'pong'})
+            elif message_type == 'pong':
+                await self.heartbeat()
             else:
                 logger.warning(f"Unknown message type: {message_type}")
 
         except json.JSONDecodeError:
             logger.error(f"Invalid JSON received from user {self.user.user_id}")
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': 'Invalid JSON format'
-            }))
+            })
         except Exception as e:
             logger.error(f"Error processing message from user {self.user.user_id}: {str(e)}")
 
     async def handle_typing_start(self):
         """Handle user starting to type"""
         await self.set_user_typing(True)
-        await self.channel_layer.group_send(
-            self.room_group_name,
+        await group_send_room(
+            self.room_id,
             {
                 'type': 'typing_indicator',
                 'user_id': str(self.user.user_id),
@@ -126,8 +332,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def handle_typing_stop(self):
         """Handle user stopping typing"""
         await self.set_user_typing(False)
-        await self.channel_layer.group_send(
-            self.room_group_name,
+        await group_send_room(
+            self.room_id,
             {
                 'type': 'typing_indicator',
                 'user_id': str(self.user.user_id),
@@ -135,67 +341,310 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }
         )
 
+    async def handle_reaction(self, data, add):
+        """Handle a user adding or removing a reaction"""
+        emoji = data.get('emoji')
+        try:
+            message_id = str(uuid.UUID(str(data.get('message_id'))))
+        except ValueError:
+            message_id = None
+        if not message_id or not is_valid_emoji(emoji):
+            await self.send_event({
+                'type': 'error',
+                'message': 'Reaction requires a message_id and an emoji'
+            })
+            return
+
+        result = await sync_to_async(apply_reaction)(self.room_id, message_id, str(self.user.user_id), emoji, add)
+        if result and result['changed']:
+            await group_send_room(
+                self.room_id,
+                {
+                    'type': 'reaction_delta',
+                    'message_id': message_id,
+                    'emoji': emoji,
+                    'count': result['count'],
+                }
+            )
+
+    async def handle_send_message(self, data):
+        """Create a message; a retried send with the same client_msg_id is acknowledged, not stored twice"""
+        client_msg_id = data.get('client_msg_id')
+        if client_msg_id is not None and not is_valid_key(client_msg_id):
+            await self.send_event({
+                'type': 'error',
+                'message': 'client_msg_id must be 1-255 printable ASCII characters'
+            })
+            return
+        payload = {field: data.get(field) for field in ('content', 'reply_to', 'media')}
+        await self.send_event(await self.store_message(payload, client_msg_id))
+
+    # Outbound frames
+    def start_writer(self):
+        """Create the outbound queue; its writer task is started by the first frame queued"""
+        self.outbound = deque()
+        metrics.adjust_gauge('ws_connections', 1)
+
+    def stop_writer(self):
+        if self.outbound is None:
+            return
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+            self.writer_task = None
+        metrics.adjust_gauge('ws_outbound_queued', -len(self.outbound))
+        metrics.adjust_gauge('ws_connections', -1)
+        self.outbound = None
+
+    async def write_outbound(self):
+        """Writer task: send queued frames in order, then exit until the next frame is queued"""
+        try:
+            while self.outbound:
+                frame = self.outbound.popleft()
+                metrics.adjust_gauge('ws_outbound_queued', -1)
+                await self.send(text_data=json.dumps(frame))
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.error(f"Outbound writer failed for user {self.user.user_id}: {str(e)}")
+        self.writer_task = None
+
+    async def enqueue(self, frame):
+        """Queue a frame for the writer task, applying the overflow policy when the queue is full"""
+        if self.outbound is None or self.evicted:
+            return
+        if len(self.outbound) >= OUTBOUND_QUEUE_SIZE:
+            if frame['type'] in DROPPABLE_EVENT_TYPES:
+                metrics.incr('ws_events_dropped')
+                return
+            # Make room by shedding queued presence/typing frames
+            kept = deque(queued for queued in self.outbound if queued['type'] not in DROPPABLE_EVENT_TYPES)
+            dropped = len(self.outbound) - len(kept)
+            if dropped:
+                self.outbound = kept
+                metrics.incr('ws_events_dropped', dropped)
+                metrics.adjust_gauge('ws_outbound_queued', -dropped)
+            else:
+                await self.evict_slow_client()
+                return
+
+        self.outbound.append(frame)
+        metrics.adjust_gauge('ws_outbound_queued', 1)
+        if self.writer_task is None:
+            self.writer_task = asyncio.ensure_future(self.write_outbound())
+
+    async def evict_slow_client(self):
+        """Disconnect a client that cannot keep up; it should reload history on reconnect"""
+        self.evicted = True
+        metrics.incr('ws_slow_clients_evicted')
+        logger.warning(f"Evicting slow client {self.user.user_id} in room {self.room_id} "
+                       f"({len(self.outbound)} frames queued)")
+        self.stop_writer()
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE, reason='resync')
+
+    async def send_event(self, frame):
+        """Queue a frame, flushing any buffered batch first so ordering is preserved"""
+        if self.message_batch:
+            await self.flush_batch()
+        await self.enqueue(frame)
+
+    def track_event_rate(self):
+        """Count room events per one-second window and switch batching on or off"""
+        now = asyncio.get_running_loop().time()
+        if now - self.rate_window_start >= 1.0:
+            rate = self.rate_window_count / max(now - self.rate_window_start, 1.0)
+            if not self.batching and rate >= BATCH_THRESHOLD:
+                self.batching = True
+                logger.debug(f"Batching enabled for room {self.room_id} at {rate:.0f} events/s")
+            elif self.batching and rate < BATCH_THRESHOLD / 2:  # Hysteresis so we don't flap
+                self.batching = False
+            self.rate_window_start = now
+            self.rate_window_count = 0
+        self.rate_window_count += 1
+
+    async def flush_batch(self):
+        """Send buffered messages as one messages_batch frame"""
+        if self.batch_flush_task and self.batch_flush_task is not asyncio.current_task():
+            self.batch_flush_task.cancel()
+        self.batch_flush_task = None
+        messages, self.message_batch = self.message_batch, None
+        if messages:
+            await self.enqueue({
+                'type': 'messages_batch',
+                'messages': messages
+            })
+
+    async def flush_batch_later(self):
+        await asyncio.sleep(BATCH_WINDOW_SECONDS)
+        await self.flush_batch()
+
     # WebSocket message handlers
     async def new_message(self, event):
-        """Send new message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'new_message',
-            'message': event['message']
-        }))
+        """Send new message to WebSocket, batched while the room is busy"""
+        self.track_event_rate()
+        if not self.batching and not self.message_batch:
+            await self.send_event({
+                'type': 'new_message',
+                'message': event['message']
+            })
+            return
+
+        if self.message_batch is None:
+            self.message_batch = []
+        self.message_batch.append(event['message'])
+        if self.batch_flush_task is None:
+            self.batch_flush_task = asyncio.ensure_future(self.flush_batch_later())
 
     async def message_updated(self, event):
         """Send message update to WebSocket"""
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'message_updated',
             'message': event['message']
-        }))
+        })
 
     async def message_deleted(self, event):
         """Send message deletion to WebSocket"""
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'message_deleted',
             'message_id': event['message_id']
-        }))
+        })
+
+    async def reaction_delta(self, event):
+        """Coalesce reaction count changes into one frame per window"""
+        if self.pending_reactions is None:
+            self.pending_reactions = {}
+        self.pending_reactions.setdefault(event['message_id'], {})[event['emoji']] = event['count']
+        if self.reaction_flush_task is None:
+            self.reaction_flush_task = asyncio.ensure_future(self.flush_reactions())
+
+    async def flush_reactions(self):
+        """Send the latest counts for every message that changed during the window"""
+        await asyncio.sleep(REACTION_COALESCE_SECONDS)
+        reactions, self.pending_reactions = self.pending_reactions, None
+        self.reaction_flush_task = None
+        if reactions:
+            await self.send_event({
+                'type': 'reaction_delta',
+                'reactions': reactions
+            })
+
+    async def user_notification(self, event):
+        """Deliver an event sent to this user through notify_user"""
+        frame = event['event']
+        if frame.get('type') == 'room_access_revoked' and str(frame.get('room_id')) == str(self.room_id):
+            await self.close_access_revoked(frame)
+            return
+        await self.send_event(frame)
+
+    async def fanout_promoted(self, event):
+        """The room was sharded, so publishers stopped sending to the base group this socket is in"""
+        await self.join_shard()
+
+    async def join_shard(self):
+        """Also join this socket's shard once its room is sharded. Staying in the base group is harmless:
+        each event goes to either the base group or the shards, so it still arrives once."""
+        if self.shard_group_name or self.room_group_name != room_group_name(self.room_id):
+            return
+        shards = await redis_call(redis_chat_service.get_fanout_shards)(self.room_id)
+        if shards <= 1:
+            return
+        self.shard_group_name = shard_for_channel(self.room_id, self.channel_name, shards)
+        await self.channel_layer.group_add(self.shard_group_name, self.channel_name)
+
+    async def reap_idle(self):
+        """Take a peer that stopped answering pings out of its groups and presence, then close it"""
+        metrics.incr('ws_idle_reaped')
+        logger.info(f"Reaping idle socket of user {self.user.user_id} in room {self.room_id}")
+        await self.leave()
+        await self.close(code=IDLE_CLOSE_CODE, reason='idle_timeout')
+
+    def footprint(self):
+        """
+        Shallow size of the consumer, its instance dict, buffers and tasks. The frames and messages they
+        hold, group memberships and the channel layer inbox are not counted; bench_chat_ws reports RSS
+        per connection for the full cost.
+        """
+        owned = (self.__dict__, self.outbound, self.pending_reactions, self.message_batch,
+                 self.writer_task, self.reaction_flush_task, self.batch_flush_task)
+        return sys.getsizeof(self) + sum(sys.getsizeof(value) for value in owned if value is not None)
+
+    async def close_access_revoked(self, frame):
+        """Tell the client it was removed from this room and close the socket"""
+        self.evicted = True
+        self.stop_writer()
+        await self.send(text_data=json.dumps(frame))
+        await self.close(code=ACCESS_REVOKED_CLOSE_CODE, reason='access_revoked')
 
     async def user_joined(self, event):
         """Send user joined notification"""
         if event['user_id'] != str(self.user.user_id):  # Don't send to self
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'user_joined',
                 'user_id': event['user_id'],
                 'user_info': event['user_info']
-            }))
+            })
 
     async def user_left(self, event):
         """Send user left notification"""
         if event['user_id'] != str(self.user.user_id):  # Don't send to self
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'user_left',
                 'user_id': event['user_id']
-            }))
+            })
 
     async def typing_indicator(self, event):
         """Send typing indicator"""
         if event['user_id'] != str(self.user.user_id):  # Don't send to self
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'typing_indicator',
                 'user_id': event['user_id'],
                 'user_info': event.get('user_info'),
                 'is_typing': event['is_typing']
-            }))
+            })
 
     # Helper methods
     @database_sync_to_async
     def check_room_access(self, user, room_id):
-        """Check if user has access to the chat room"""
+        """Space id of the chat room if the user is a member, else None"""
+        space_id = ChatRoomMembership.objects.filter(
+            chat_room__id=room_id,
+            user=user
+        ).values_list('chat_room__space_id', flat=True).first()
+        return str(space_id) if space_id else None
+
+    @database_sync_to_async
+    def store_message(self, payload, client_msg_id):
+        """Frame acknowledging (or refusing) a send_message"""
         try:
-            ChatRoomMembership.objects.get(
-                chat_room__id=room_id,
-                user=user
-            )
-            return True
-        except ChatRoomMembership.DoesNotExist:
-            return False
+            write = IdempotentWrite(self.user.user_id, f"message:{self.room_id}", client_msg_id, payload)
+        except redis.ResponseError:
+            return {'type': 'error', 'client_msg_id': client_msg_id, 'message': 'Error creating message'}
+        outcome = write.outcome
+        if outcome == 'replay':
+            return {'type': 'message_ack', 'client_msg_id': client_msg_id,
+                    'message': write.previous['body'], 'replayed': True}
+        if outcome is not None:
+            reason = ('client_msg_id was already used for a different message' if outcome == 'mismatch'
+                      else 'A message with this client_msg_id is still being sent')
+            return {'type': 'error', 'client_msg_id': client_msg_id, 'message': reason}
+
+        try:
+            chat_room = ChatRoom.objects.get(id=self.room_id)
+            message_data, queued = create_message(chat_room, self.user.user_id, payload)
+        except MessageRejected as e:
+            write.release()
+            return {'type': 'error', 'client_msg_id': client_msg_id, 'message': str(e)}
+        except MessageStoreUnavailable as e:
+            write.release()
+            logger.warning(f"Message store unavailable, message not created: {str(e)}")
+            return {'type': 'error', 'client_msg_id': client_msg_id,
+                    'message': 'Message storage temporarily unavailable', 'retry_after': e.retry_after}
+        except Exception as e:
+            write.release()
+            logger.error(f"Error creating message: {str(e)}")
+            return {'type': 'error', 'client_msg_id': client_msg_id, 'message': 'Error creating message'}
+
+        write.complete(202 if queued else 201, message_data)
+        return {'type': 'message_ack', 'client_msg_id': client_msg_id, 'message': message_data}
 
     @database_sync_to_async
     def get_user_info(self, user):
@@ -209,23 +658,54 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def set_user_online(self):
         """Mark user as online in Redis"""
         try:
-            redis_chat_service.set_user_online(self.room_id, str(self.user.user_id))
+            await redis_call(redis_chat_service.set_user_online)(self.room_id, str(self.user.user_id), self.space_id)
+            self.last_heartbeat = asyncio.get_running_loop().time()
         except Exception as e:
             logger.error(f"Error setting user online: {str(e)}")
 
-    async def set_user_offline(self):
-        """Mark user as offline in Redis"""
+    async def register_connection(self):
+        """Add this socket to the user's connection registry"""
         try:
-            redis_chat_service.set_user_offline(self.room_id, str(self.user.user_id))
+            await redis_call(redis_chat_service.register_connection)(
+                str(self.user.user_id), self.channel_name, self.room_id)
+        except Exception as e:
+            logger.error(f"Error registering connection: {str(e)}")
+
+    async def unregister_connection(self):
+        """Remove this socket from the user's connection registry"""
+        try:
+            await redis_call(redis_chat_service.unregister_connection)(
+                str(self.user.user_id), self.channel_name, self.room_id)
+        except Exception as e:
+            logger.error(f"Error unregistering connection: {str(e)}")
+
+    async def set_user_offline(self, leaving=False):
+        """Mark user as offline in Redis; True when it was recorded"""
+        try:
+            return await redis_call(redis_chat_service.set_user_offline)(
+                self.room_id, str(self.user.user_id), self.space_id, leaving)
         except Exception as e:
             logger.error(f"Error setting user offline: {str(e)}")
+            return False
+
+    async def heartbeat(self):
+        """Refresh room and space presence, at most once per PRESENCE_HEARTBEAT_SECONDS"""
+        now = asyncio.get_running_loop().time()
+        if now - self.last_heartbeat < PRESENCE_HEARTBEAT_SECONDS:
+            return
+        self.last_heartbeat = now
+        try:
+            await redis_call(redis_chat_service.presence_heartbeat)(
+                self.room_id, str(self.user.user_id), self.space_id, self.channel_name)
+        except Exception as e:
+            logger.error(f"Error refreshing presence: {str(e)}")
 
     async def set_user_typing(self, is_typing):
         """Set user typing status in Redis"""
         try:
             if is_typing:
-                redis_chat_service.set_user_typing(self.room_id, str(self.user.user_id))
+                await redis_call(redis_chat_service.set_user_typing)(self.room_id, str(self.user.user_id))
             else:
-                redis_chat_service.unset_user_typing(self.room_id, str(self.user.user_id))
+                await redis_call(redis_chat_service.unset_user_typing)(self.room_id, str(self.user.user_id))
         except Exception as e:
             logger.error(f"Error setting typing status: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,137 @@
+# chat/fanout.py - Room group naming and (optionally sharded) fan-out over the channel layer
+import asyncio
+import logging
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .services.redis_service import redis_chat_service
+
+logger = logging.getLogger(__name__)
+
+# Rooms with at least CHAT_FANOUT_LARGE_ROOM_ONLINE online users are split into CHAT_FANOUT_SHARDS
+# channel-layer groups. Each socket joins one shard picked by hashing its channel name, so a single
+# group_send only touches 1/N of the members, and with several channel-layer hosts the shard groups
+# land on different Redis nodes. Once a room is sharded, publishers send to the shards only; sockets
+# that joined the base group before the promotion are told to also join their shard.
+FANOUT_SHARDS = getattr(settings, 'CHAT_FANOUT_SHARDS', 8)
+LARGE_ROOM_ONLINE = getattr(settings, 'CHAT_FANOUT_LARGE_ROOM_ONLINE', 1000)
+SHARD_CACHE_SECONDS = 1.0
+# A room is also sharded once its deliveries per second (messages/s from the throughput meter
+# times online users) reach CHAT_FANOUT_HOT_ROOM_DELIVERIES, however few users it has
+HOT_ROOM_DELIVERIES = getattr(settings, 'CHAT_FANOUT_HOT_ROOM_DELIVERIES', 20000)
+RATE_CACHE_SECONDS = 1.0
+
+_shard_cache: Dict[str, tuple] = {}
+_rate_cache: Dict[str, tuple] = {}
+
+
+def room_group_name(room_id) -> str:
+    return f"chat_{room_id}"
+
+
+def shard_group_name(room_id, shard: int) -> str:
+    return f"chat_{room_id}_s{shard}"
+
+
+def user_group_name(user_id) -> str:
+    """Group every socket of one user joins, whatever room it is connected to"""
+    return f"user_{user_id}"
+
+
+def cached_shard_count(room_id) -> Optional[int]:
+    """Shard count for a room from the process cache, None when it has to be read again"""
+    cached = _shard_cache.get(str(room_id))
+    return cached[0] if cached and cached[1] > time.monotonic() else None
+
+
+def room_shard_count(room_id) -> int:
+    """Shard count for a room, cached briefly per process to keep it off the send path"""
+    shards = cached_shard_count(room_id)
+    if shards is not None:
+        return shards
+    shards = redis_chat_service.get_fanout_shards(str(room_id))
+    _shard_cache[str(room_id)] = (shards, time.monotonic() + SHARD_CACHE_SECONDS)
+    return shards
+
+
+def room_message_rate(room_id) -> float:
+    """Messages per second a room is sending now, cached briefly per process"""
+    room_id = str(room_id)
+    cached = _rate_cache.get(room_id)
+    now = time.monotonic()
+    if cached and cached[1] > now:
+        return cached[0]
+    rate = redis_chat_service.get_room_message_rates([room_id]).get(room_id, 0.0)
+    _rate_cache[room_id] = (rate, now + RATE_CACHE_SECONDS)
+    return rate
+
+
+def needs_sharding(room_id, online_count: int) -> bool:
+    if online_count >= LARGE_ROOM_ONLINE:
+        return True
+    return online_count > FANOUT_SHARDS and online_count * room_message_rate(room_id) >= HOT_ROOM_DELIVERIES
+
+
+def shard_for_channel(room_id, channel_name: str, shards: int) -> str:
+    return shard_group_name(room_id, zlib.crc32(channel_name.encode()) % shards)
+
+
+def group_for_channel(room_id, channel_name: str, online_count: int = 0) -> Tuple[str, bool]:
+    """Group a socket should join, and whether this call promoted the room to sharded fan-out
+    because it got large or busy"""
+    shards = room_shard_count(room_id)
+    promoted = False
+    if shards <= 1 and FANOUT_SHARDS > 1 and needs_sharding(room_id, online_count):
+        shards = redis_chat_service.promote_fanout(str(room_id), FANOUT_SHARDS)
+        _shard_cache[str(room_id)] = (shards, time.monotonic() + SHARD_CACHE_SECONDS)
+        promoted = shards > 1
+    if shards <= 1:
+        return room_group_name(room_id), promoted
+    return shard_for_channel(room_id, channel_name, shards), promoted
+
+
+def room_groups(room_id, shards: int = None) -> List[str]:
+    """Every group a room event must reach: the base group, or each shard once the room is sharded"""
+    if shards is None:
+        shards = room_shard_count(room_id)
+    if shards <= 1:
+        return [room_group_name(room_id)]
+    return [shard_group_name(room_id, shard) for shard in range(shards)]
+
+
+async def announce_promotion(room_id, channel_layer=None):
+    """Tell sockets in a newly sharded room's base group to join their shard"""
+    channel_layer = channel_layer or get_channel_layer()
+    await channel_layer.group_send(room_group_name(room_id), {'type': 'fanout_promoted'})
+
+
+async def group_send_room(room_id, event, channel_layer=None):
+    """Publish an event once per shard group of a room"""
+    channel_layer = channel_layer or get_channel_layer()
+    shards = cached_shard_count(room_id)
+    if shards is None:  # Reading it blocks, so not on the event loop
+        shards = await sync_to_async(room_shard_count, thread_sensitive=False)(room_id)
+    groups = room_groups(room_id, shards)
+    if len(groups) == 1:
+        await channel_layer.group_send(groups[0], event)
+        return
+    await asyncio.gather(*(channel_layer.group_send(group, event) for group in groups))
+
+
+def group_send_room_sync(room_id, event):
+    """group_send_room for synchronous views"""
+    async_to_sync(group_send_room)(room_id, event)
+
+
+async def notify_user(user_id, event, channel_layer=None):
+    """Deliver an event to every open socket of a user, on any worker, with one group_send"""
+    channel_layer = channel_layer or get_channel_layer()
+    await channel_layer.group_send(user_group_name(user_id), {'type': 'user_notification', 'event': event})
+
+
+def notify_user_sync(user_id, event):
+    """notify_user for synchronous views"""
+    async_to_sync(notify_user)(user_id, event)
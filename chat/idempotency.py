@@ -0,0 +1,93 @@
+# chat/idempotency.py - Replaying retried creates that carry a client-supplied idempotency key
+import hashlib
+import json
+from typing import Optional
+from rest_framework import status
+from rest_framework.response import Response
+from .services.redis_service import redis_chat_service
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def is_valid_key(key) -> bool:
+    return isinstance(key, str) and 0 < len(key) <= MAX_KEY_LENGTH and key.isprintable() and key.isascii()
+
+
+def request_fingerprint(payload) -> str:
+    """Hash of the request body, so a key reused for a different request is refused, not replayed"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotentWrite:
+    """
+    One create guarded by a client key: claim the key, run the write only when the claim is ours,
+    then either keep the response for replay (complete) or give the key back (release).
+    Without a key every step is a no-op and the write always runs.
+    """
+    __slots__ = ('user_id', 'scope', 'key', 'fingerprint', 'previous')
+
+    def __init__(self, user_id, scope: str, key: Optional[str], payload):
+        self.user_id = str(user_id)
+        self.scope = scope
+        self.key = key
+        self.fingerprint = request_fingerprint(payload) if key else None
+        self.previous = (redis_chat_service.claim_idempotency_key(self.user_id, scope, key, self.fingerprint)
+                         if key else None)
+
+    @property
+    def outcome(self) -> Optional[str]:
+        """None when the write should run, else 'replay', 'in_progress' or 'mismatch'"""
+        if self.previous is None:
+            return None
+        if self.previous.get('fingerprint') != self.fingerprint:
+            return 'mismatch'
+        return 'replay' if self.previous.get('state') == 'done' else 'in_progress'
+
+    def complete(self, status_code: int, body) -> None:
+        if self.key and self.previous is None:
+            redis_chat_service.store_idempotent_response(
+                self.user_id, self.scope, self.key, self.fingerprint, status_code, body)
+
+    def release(self) -> None:
+        if self.key and self.previous is None:
+            redis_chat_service.release_idempotency_key(self.user_id, self.scope, self.key)
+
+    # DRF views
+    def replay(self) -> Optional[Response]:
+        """The response for a request that must not run again, or None"""
+        outcome = self.outcome
+        if outcome is None:
+            return None
+        if outcome == 'mismatch':
+            return Response(
+                {"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if outcome == 'in_progress':
+            return Response(
+                {"error": f"A request with this {IDEMPOTENCY_HEADER} is still in progress"},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': '1'}
+            )
+        return Response(self.previous['body'], status=self.previous['status'],
+                        headers={'Idempotent-Replayed': 'true'})
+
+    def finish(self, response: Response) -> Response:
+        """Keep a successful response for replay; let the client retry anything else"""
+        if status.is_success(response.status_code):
+            self.complete(response.status_code, response.data)
+        else:
+            self.release()
+        return response
+
+
+def begin_request(request, scope: str, payload):
+    """IdempotentWrite for a DRF request, or a 400 Response when its Idempotency-Key is malformed"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is not None and not is_valid_key(key):
+        return Response(
+            {"error": f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} printable ASCII characters"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return IdempotentWrite(request.user.user_id, scope, key, payload)
@@ -0,0 +1,389 @@
+# chat/management/commands/bench_chat_ws.py
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from channels.layers import channel_layers
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from chat import consumers
+from chat.consumers import connection_footprint
+from chat.fanout import group_send_room
+from chat.models import ChatRoom, ChatRoomMembership
+from chat.management.commands.bench_fanout import percentile
+from chat import metrics
+from outh.models import User
+from space.models import Space, SpaceMembership
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+
+BENCH_PREFIX = 'wsbench'
+# Allocations made by the simulated clients rather than the server side of their sockets
+CLIENT_SIDE = [
+    tracemalloc.Filter(False, '*/asgiref/testing.py', all_frames=True),
+    tracemalloc.Filter(False, '*/channels/testing/*', all_frames=True),
+    tracemalloc.Filter(False, __file__, all_frames=True),
+]
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux), 0 where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+async def next_frame(communicator, wait=0.5):
+    """The next frame a socket received, or None after wait seconds without one. receive_from(timeout=...)
+    is not used for polling because on a timeout it cancels the application, closing the socket."""
+    if await communicator.receive_nothing(timeout=wait, interval=0.01):
+        return None
+    return json.loads(await communicator.receive_from())
+
+
+class Command(BaseCommand):
+    help = 'Load-test ChatConsumer in-process: N authenticated sockets across M rooms, driven message/typing rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=500, help='Simulated sockets')
+        parser.add_argument('--rooms', type=int, default=10, help='Rooms the sockets are spread across')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to drive traffic')
+        parser.add_argument('--message-rate', type=float, default=5, help='Messages per second per room')
+        parser.add_argument('--typing-rate', type=float, default=0.2, help='typing_start frames per second per client')
+        parser.add_argument('--connect-concurrency', type=int, default=100, help='Sockets connecting at once')
+        parser.add_argument('--drain-timeout', type=float, default=5, help='Seconds to wait for in-flight events')
+        parser.add_argument('--max-retries', type=int, default=20,
+                            help='Times a socket turned away by connect admission retries, after the suggested delay')
+        parser.add_argument('--reconnect-storm', action='store_true',
+                            help='After the traffic phase, drop every socket but the observers and reconnect them all at once')
+        parser.add_argument('--storm-observers', type=int, default=10,
+                            help='Sockets that stay connected through the storm and count presence broadcasts')
+        parser.add_argument('--storm-settle', type=float, default=None,
+                            help='Seconds to keep counting presence frames after the storm (default: presence grace + 1)')
+        parser.add_argument('--no-batching', action='store_true',
+                            help='Send every message as its own frame however busy the room is, to compare against batching')
+        parser.add_argument('--layer', choices=['settings', 'memory'], default='settings',
+                            help="'settings' uses CHANNEL_LAYERS (Redis); 'memory' runs without Redis")
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Also trace Python allocations made while connecting, to break the server-side cost '
+                                 'of a connection down by source file. Slow: use a few hundred clients and a low '
+                                 '--connect-concurrency. Inflates the RSS figure')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the generated users, space and rooms')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable results only')
+
+    def handle(self, *args, **options):
+        if options['layer'] == 'memory':
+            settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+            channel_layers.backends.clear()
+        if options['no_batching']:
+            consumers.BATCH_THRESHOLD = float('inf')
+
+        rooms, users = self.create_fixtures(options['clients'], options['rooms'])
+        try:
+            result = asyncio.run(self.run(rooms, users, options))
+        finally:
+            if not options['keep_data']:
+                User.objects.filter(user_id__in=[user.user_id for user in users]).delete()
+
+        if not options['json']:
+            self.stdout.write(
+                f"clients={result['clients']} rooms={result['rooms']} "
+                f"connect {result['connect']['per_second']:.0f}/s (p99 {result['connect']['latency_ms']['p99']:.1f}ms, "
+                f"{result['connect']['failed']} failed) | fan-out p50={result['fanout_ms']['p50']:.1f}ms "
+                f"p99={result['fanout_ms']['p99']:.1f}ms | dropped={result['events']['dropped']} | "
+                f"cpu {result['cpu']['seconds']:.2f}s ({result['cpu']['ms_per_1k_messages']:.1f} ms/1k msgs) | "
+                f"{result['memory']['bytes_per_connection']:.0f} B/conn RSS "
+                f"({result['memory']['consumer_shallow_bytes']:.0f} B shallow consumer state)"
+            )
+            if result['memory']['traced_bytes_per_connection'] is not None:
+                top = ', '.join(f"{os.path.join(*source['file'].split(os.sep)[-2:])} {source['bytes_per_connection']:.0f} B"
+                                for source in result['memory']['traced_top'])
+                self.stdout.write(f"traced: {result['memory']['traced_bytes_per_connection']:.0f} B/conn "
+                                  f"server side | {top}")
+            if 'storm' in result:
+                storm = result['storm']
+                self.stdout.write(
+                    f"storm: {storm['reconnected']}/{storm['sockets']} back in {storm['seconds']:.1f}s, "
+                    f"{storm['rejected']} turned away (retry p50={storm['retry_after_ms']['p50']:.0f}ms "
+                    f"max={storm['retry_after_ms']['max']:.0f}ms) | presence frames seen by observers: "
+                    f"{storm['presence_frames']} ({storm['presence_suppressed']} broadcasts suppressed)"
+                )
+        self.stdout.write(json.dumps(result, indent=None if options['json'] else 2))
+
+    def create_fixtures(self, clients, room_count):
+        run_id = uuid.uuid4().hex[:8]
+        users = User.objects.bulk_create([
+            User(username=f"{BENCH_PREFIX}-{run_id}-{index}", email=f"{BENCH_PREFIX}-{run_id}-{index}@example.invalid")
+            for index in range(clients)
+        ])
+        # Space (and with it rooms and memberships) cascade from the first user
+        space = Space.objects.create(name=f"{BENCH_PREFIX}-{run_id}", created_by=users[0])
+        SpaceMembership.objects.bulk_create([SpaceMembership(user=user, space=space) for user in users])
+        rooms = ChatRoom.objects.bulk_create([
+            ChatRoom(name=f"{BENCH_PREFIX}-{index}", space=space) for index in range(room_count)
+        ])
+        ChatRoomMembership.objects.bulk_create([
+            ChatRoomMembership(chat_room=rooms[index % room_count], user=user) for index, user in enumerate(users)
+        ])
+        return rooms, users
+
+    async def run(self, rooms, users, options):
+        from galileo.asgi import application
+
+        room_count = len(rooms)
+        clients = []
+        connect_latencies = []
+        failed_connects = 0
+        admission = {'rejected': 0, 'retry_after': []}
+        tokens = await sync_to_async(lambda: [str(AccessToken.for_user(user)) for user in users])()
+
+        if options['trace_memory']:
+            tracemalloc.start(10)
+        gc.collect()
+        rss_before = rss_bytes()
+        traced_before = tracemalloc.take_snapshot() if options['trace_memory'] else None
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def open_socket(path):
+            """Connect like a well-behaved client: when turned away, wait the suggested delay and retry"""
+            for _ in range(options['max_retries'] + 1):
+                communicator = WebsocketCommunicator(application, path)
+                try:
+                    connected, _ = await communicator.connect(timeout=10)
+                    if not connected:
+                        return None
+                    frame = await communicator.receive_json_from(timeout=10)
+                except Exception:
+                    return None
+                if frame['type'] != 'connection_rejected':
+                    return communicator  # connection_established
+                admission['rejected'] += 1
+                admission['retry_after'].append(frame['retry_after_ms'] / 1000)
+                try:
+                    await communicator.wait(timeout=1)
+                except Exception:
+                    pass
+                await asyncio.sleep(frame['retry_after_ms'] / 1000)
+            return None
+
+        def socket_path(index):
+            room = rooms[index % room_count]
+            return str(room.id), f"/ws/chat/{room.space_id}/{room.id}/?token={tokens[index]}"
+
+        async def connect(index, user):
+            nonlocal failed_connects
+            room_id, path = socket_path(index)
+            async with semaphore:
+                started = time.perf_counter()
+                communicator = await open_socket(path)
+                if communicator is None:
+                    failed_connects += 1
+                    return
+                connect_latencies.append(time.perf_counter() - started)
+                clients.append((room_id, communicator, index))
+
+        connect_started = time.perf_counter()
+        await asyncio.gather(*(connect(index, user) for index, user in enumerate(users)))
+        connect_seconds = time.perf_counter() - connect_started
+        gc.collect()
+        # Server and simulated clients share this process, so RSS is an upper bound for the server side
+        rss_after = rss_bytes()
+        consumer_shallow_bytes = connection_footprint()
+        traced, traced_bytes = [], None
+        if traced_before is not None:
+            traced = tracemalloc.take_snapshot().filter_traces(CLIENT_SIDE).compare_to(
+                traced_before.filter_traces(CLIENT_SIDE), 'filename')
+            traced_bytes = sum(stat.size_diff for stat in traced)
+            tracemalloc.stop()
+
+        members = {}
+        for room_id, _, _ in clients:
+            members[room_id] = members.get(room_id, 0) + 1
+
+        dropped_before = metrics.snapshot()['counters'].get('ws_events_dropped', 0)
+        fanout_latencies = []
+        received = {'messages': 0, 'typing': 0, 'other': 0}
+        published = 0
+        stop = asyncio.Event()
+
+        async def reader(communicator):
+            while not stop.is_set():
+                try:
+                    frame = await next_frame(communicator)
+                except Exception:
+                    return
+                if frame is None:
+                    continue
+                now = time.perf_counter()
+                if frame['type'] == 'new_message':
+                    batch = [frame['message']]
+                elif frame['type'] == 'messages_batch':
+                    batch = frame['messages']
+                else:
+                    received['typing' if frame['type'] == 'typing_indicator' else 'other'] += 1
+                    continue
+                for message in batch:
+                    received['messages'] += 1
+                    fanout_latencies.append(now - message['sent_at'])
+
+        async def publisher(room_id):
+            nonlocal published
+            interval = 1 / options['message_rate']
+            deadline = time.perf_counter() + options['duration']
+            while time.perf_counter() < deadline:
+                await group_send_room(room_id, {
+                    'type': 'new_message',
+                    'message': {'id': str(uuid.uuid4()), 'room': room_id, 'content': 'bench', 'sent_at': time.perf_counter()},
+                })
+                published += members.get(room_id, 0)
+                await asyncio.sleep(interval)
+
+        async def typist(communicator):
+            if options['typing_rate'] <= 0:
+                return
+            interval = 1 / options['typing_rate']
+            deadline = time.perf_counter() + options['duration']
+            await asyncio.sleep(random.random() * interval)  # Spread the first frames
+            while time.perf_counter() < deadline:
+                await communicator.send_json_to({'type': 'typing_start'})
+                await asyncio.sleep(interval)
+
+        readers = [asyncio.ensure_future(reader(communicator)) for _, communicator, _ in clients]
+        drive_started = time.perf_counter()
+        cpu_started = time.process_time()
+        await asyncio.gather(
+            *(publisher(room_id) for room_id in members),
+            *(typist(communicator) for _, communicator, _ in clients),
+        )
+        drive_seconds = time.perf_counter() - drive_started
+
+        drain_deadline = time.perf_counter() + options['drain_timeout']
+        while received['messages'] < published and time.perf_counter() < drain_deadline:
+            await asyncio.sleep(0.1)
+        stop.set()
+        await asyncio.gather(*readers, return_exceptions=True)
+        # Server and simulated clients share this process, so this is an upper bound for the server side
+        cpu_seconds = time.process_time() - cpu_started
+        connect_rejected = admission['rejected']
+
+        storm = None
+        if options['reconnect_storm']:
+            storm = await self.reconnect_storm(clients, open_socket, socket_path, admission, options)
+        await asyncio.gather(*(communicator.disconnect() for _, communicator, _ in clients), return_exceptions=True)
+
+        to_ms = lambda values: {
+            'p50': (percentile(values, 50) or 0) * 1000,
+            'p95': (percentile(values, 95) or 0) * 1000,
+            'p99': (percentile(values, 99) or 0) * 1000,
+            'max': (max(values) if values else 0) * 1000,
+            'mean': (statistics.fmean(values) if values else 0) * 1000,
+        }
+        connected = len(clients)
+        per_connection = lambda size: size / connected if connected else 0
+        result = {
+            'clients': len(users),
+            'rooms': room_count,
+            'layer': options['layer'],
+            'duration_s': drive_seconds,
+            'connect': {
+                'connected': connected,
+                'failed': failed_connects,
+                'seconds': connect_seconds,
+                'per_second': connected / connect_seconds if connect_seconds else 0,
+                'latency_ms': to_ms(connect_latencies),
+                'rejected': connect_rejected,
+            },
+            'fanout_ms': to_ms(fanout_latencies),
+            'events': {
+                'messages_expected': published,
+                'messages_received': received['messages'],
+                'dropped': published - received['messages'],
+                'shed_by_server': metrics.snapshot()['counters'].get('ws_events_dropped', 0) - dropped_before,
+                'typing_received': received['typing'],
+                'messages_per_second': received['messages'] / drive_seconds if drive_seconds else 0,
+            },
+            'cpu': {
+                'seconds': cpu_seconds,
+                'ms_per_1k_messages': cpu_seconds * 1e6 / received['messages'] if received['messages'] else 0,
+                'batching': not options['no_batching'],
+            },
+            'memory': {
+                'rss_delta_bytes': rss_after - rss_before,
+                'bytes_per_connection': per_connection(rss_after - rss_before),
+                'traced_bytes_per_connection': per_connection(traced_bytes) if traced_bytes is not None else None,
+                'traced_top': [
+                    {'file': stat.traceback[0].filename, 'bytes_per_connection': per_connection(stat.size_diff)}
+                    for stat in traced[:5]
+                ],
+                'consumer_shallow_bytes': consumer_shallow_bytes,
+            },
+        }
+        if storm is not None:
+            result['storm'] = storm
+        return result
+
+    async def reconnect_storm(self, clients, open_socket, socket_path, admission, options):
+        """
+        Drop every socket except a few observers and reconnect them all at once, as after a deploy.
+        Reports how long the room took to fill again, how many connects admission control turned
+        away and the retry delays it suggested, and the presence frames the observers saw.
+        """
+        from chat.consumers import PRESENCE_GRACE_SECONDS
+        observers, stormers = clients[:options['storm_observers']], clients[options['storm_observers']:]
+        presence = {'frames': 0}
+        stop = asyncio.Event()
+
+        async def observe(communicator):
+            while not stop.is_set():
+                try:
+                    frame = await next_frame(communicator)
+                except Exception:
+                    return
+                if frame is not None and frame['type'] in ('user_joined', 'user_left'):
+                    presence['frames'] += 1
+
+        watchers = [asyncio.ensure_future(observe(communicator)) for _, communicator, _ in observers]
+        suppressed_before = metrics.snapshot()['counters'].get('ws_presence_suppressed', 0)
+        rejected_before = admission['rejected']
+        delays_before = len(admission['retry_after'])
+
+        await asyncio.gather(*(communicator.disconnect() for _, communicator, _ in stormers), return_exceptions=True)
+        started = time.perf_counter()
+
+        async def reconnect(index):
+            room_id, path = socket_path(index)
+            communicator = await open_socket(path)
+            return (room_id, communicator, index) if communicator else None
+
+        reconnected = [client for client in await asyncio.gather(*(reconnect(index) for _, _, index in stormers)) if client]
+        seconds = time.perf_counter() - started
+        clients[:] = observers + reconnected
+
+        settle = options['storm_settle'] if options['storm_settle'] is not None else PRESENCE_GRACE_SECONDS + 1
+        await asyncio.sleep(settle)
+        stop.set()
+        await asyncio.gather(*watchers, return_exceptions=True)
+
+        delays = admission['retry_after'][delays_before:]
+        return {
+            'sockets': len(stormers),
+            'reconnected': len(reconnected),
+            'seconds': seconds,
+            'rejected': admission['rejected'] - rejected_before,
+            'retry_after_ms': {
+                'p50': (percentile(delays, 50) or 0) * 1000,
+                'p99': (percentile(delays, 99) or 0) * 1000,
+                'max': (max(delays) if delays else 0) * 1000,
+            },
+            'presence_frames': presence['frames'],
+            'presence_suppressed': metrics.snapshot()['counters'].get('ws_presence_suppressed', 0) - suppressed_before,
+            'settle_s': settle,
+        }
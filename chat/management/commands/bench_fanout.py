@@ -0,0 +1,116 @@
+# chat/management/commands/bench_fanout.py
+from django.core.management.base import BaseCommand, CommandError
+from channels_redis.core import RedisChannelLayer
+from chat import fanout
+from chat.fanout import group_send_room, room_group_name, shard_for_channel
+import asyncio
+import json
+import statistics
+import time
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark room fan-out over the Redis channel layer, unsharded vs sharded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hosts', default='127.0.0.1:6379', help='Comma-separated Redis host:port list for the channel layer')
+        parser.add_argument('--consumers', type=int, default=2000, help='Simulated sockets in the room')
+        parser.add_argument('--messages', type=int, default=100, help='Messages published per run')
+        parser.add_argument('--rate', type=float, default=50, help='Messages published per second')
+        parser.add_argument('--shards', default='1,8', help='Comma-separated shard counts to compare')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for deliveries after publishing')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable results only')
+
+    def handle(self, *args, **options):
+        hosts = []
+        for host in options['hosts'].split(','):
+            name, _, port = host.rpartition(':')
+            if not name:
+                raise CommandError(f"Invalid host '{host}', expected host:port")
+            hosts.append((name, int(port)))
+
+        results = []
+        for shards in [int(value) for value in options['shards'].split(',')]:
+            result = asyncio.run(self.run(hosts, shards, options))
+            results.append(result)
+            if not options['json']:
+                self.stdout.write(
+                    f"shards={shards:<3} sends/msg={result['group_sends_per_message']} delivered={result['delivered']}/{result['expected']} "
+                    f"publish p50={result['publish_ms']['p50']:.2f}ms p99={result['publish_ms']['p99']:.2f}ms "
+                    f"fan-out p50={result['latency_ms']['p50']:.2f}ms p99={result['latency_ms']['p99']:.2f}ms"
+                )
+
+        self.stdout.write(json.dumps({'hosts': options['hosts'], 'runs': results}, indent=None if options['json'] else 2))
+
+    async def run(self, hosts, shards, options):
+        layer = RedisChannelLayer(hosts=hosts, prefix='benchfanout', capacity=options['messages'] * 2)
+        room_id = 'bench'
+        consumers = options['consumers']
+        messages = options['messages']
+
+        # Publish through the real send path with the shard count pinned, as every worker would see it
+        fanout._shard_cache[room_id] = (shards, float('inf'))
+        channels = await asyncio.gather(*(layer.new_channel() for _ in range(consumers)))
+        groups = {}
+        for channel in channels:
+            if shards <= 1:
+                group = room_group_name(room_id)
+            else:
+                group = shard_for_channel(room_id, channel, shards)
+            groups.setdefault(group, []).append(channel)
+        await asyncio.gather(*(layer.group_add(group, channel) for group, members in groups.items() for channel in members))
+
+        latencies = []
+
+        async def receive(channel):
+            for _ in range(messages):
+                event = await layer.receive(channel)
+                latencies.append(time.perf_counter() - event['sent_at'])
+
+        receivers = [asyncio.ensure_future(receive(channel)) for channel in channels]
+
+        publish_times = []
+        interval = 1 / options['rate'] if options['rate'] > 0 else 0
+        for index in range(messages):
+            event = {'type': 'new_message', 'message': {'id': index}, 'sent_at': time.perf_counter()}
+            started = time.perf_counter()
+            await group_send_room(room_id, event, channel_layer=layer)
+            publish_times.append(time.perf_counter() - started)
+            if interval:
+                await asyncio.sleep(interval)
+
+        done, pending = await asyncio.wait(receivers, timeout=options['timeout'])
+        for task in pending:
+            task.cancel()
+
+        await asyncio.gather(*(layer.group_discard(group, channel) for group, members in groups.items() for channel in members))
+        await layer.flush()
+        group_sends = len(fanout.room_groups(room_id))
+        fanout._shard_cache.pop(room_id, None)
+
+        to_ms = lambda values: {
+            'p50': (percentile(values, 50) or 0) * 1000,
+            'p95': (percentile(values, 95) or 0) * 1000,
+            'p99': (percentile(values, 99) or 0) * 1000,
+            'mean': (statistics.fmean(values) if values else 0) * 1000,
+        }
+        return {
+            'shards': shards,
+            'groups': len(groups),
+            'group_sends_per_message': group_sends,
+            'consumers': consumers,
+            'messages': messages,
+            'expected': consumers * messages,
+            'delivered': len(latencies),
+            'dropped': consumers * messages - len(latencies),
+            'publish_ms': to_ms(publish_times),
+            'latency_ms': to_ms(latencies),
+        }
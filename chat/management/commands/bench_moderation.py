@@ -0,0 +1,110 @@
+# chat/management/commands/bench_moderation.py
+from django.core.management.base import BaseCommand
+from chat.services.moderation_service import ModerationAutomaton
+from chat.management.commands.bench_fanout import percentile
+import json
+import random
+import re
+import string
+import time
+import tracemalloc
+
+ACTIONS = ['block', 'mask', 'flag']
+
+
+def random_word(rng, min_length=3, max_length=12):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_length, max_length)))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the moderation automaton against a per-term scan: compile time, memory and scan latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--terms', type=int, default=10000, help='Terms in the list')
+        parser.add_argument('--lengths', default='200,2000', help='Comma-separated content lengths to scan')
+        parser.add_argument('--iterations', type=int, default=1000, help='Scans per content length')
+        parser.add_argument('--hit-rate', type=float, default=0.01, help='Fraction of content words that are terms')
+        parser.add_argument('--baseline-iterations', type=int, default=20,
+                            help='Scans per length with one regex search per term (0 to skip)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', action='store_true', help='Print machine-readable results only')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        terms = list({random_word(rng): None for _ in range(options['terms'])})
+        term_list = [(term, rng.choice(ACTIONS)) for term in terms]
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        automaton = ModerationAutomaton(term_list)
+        compile_seconds = time.perf_counter() - started
+        memory_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        patterns = [re.compile(rf"\b{re.escape(term)}\b", re.IGNORECASE) for term in terms]
+        runs = []
+        for length in [int(value) for value in options['lengths'].split(',')]:
+            contents = [self.content(rng, terms, length, options['hit_rate']) for _ in range(50)]
+            latencies = []
+            matches = 0
+            for index in range(options['iterations']):
+                content = contents[index % len(contents)]
+                started = time.perf_counter()
+                result = automaton.moderate(content)
+                latencies.append(time.perf_counter() - started)
+                matches += len(result.matches)
+
+            baseline = []
+            for index in range(options['baseline_iterations']):
+                content = contents[index % len(contents)]
+                started = time.perf_counter()
+                for pattern in patterns:
+                    pattern.search(content)
+                baseline.append(time.perf_counter() - started)
+
+            run = {
+                'content_length': length,
+                'scans': len(latencies),
+                'matches_per_scan': matches / len(latencies) if latencies else 0,
+                'scans_per_second': len(latencies) / sum(latencies) if latencies else 0,
+                'latency_ms': {
+                    'p50': (percentile(latencies, 50) or 0) * 1000,
+                    'p95': (percentile(latencies, 95) or 0) * 1000,
+                    'p99': (percentile(latencies, 99) or 0) * 1000,
+                },
+                'per_term_regex_ms': {
+                    'p50': (percentile(baseline, 50) or 0) * 1000,
+                    'p99': (percentile(baseline, 99) or 0) * 1000,
+                } if baseline else None,
+            }
+            runs.append(run)
+            if not options['json']:
+                line = (f"length={length:<6} automaton p50={run['latency_ms']['p50']:.3f}ms "
+                        f"p99={run['latency_ms']['p99']:.3f}ms ({run['scans_per_second']:.0f}/s)")
+                if baseline:
+                    line += f" | per-term regex p50={run['per_term_regex_ms']['p50']:.3f}ms"
+                self.stdout.write(line)
+
+        result = {
+            'terms': len(term_list),
+            'states': len(automaton),
+            'compile_ms': compile_seconds * 1000,
+            'memory_bytes': memory_bytes,
+            'runs': runs,
+        }
+        if not options['json']:
+            self.stdout.write(f"terms={len(term_list)} states={len(automaton)} compile={compile_seconds * 1000:.0f}ms "
+                              f"memory={memory_bytes / 1024 / 1024:.1f}MiB")
+        self.stdout.write(json.dumps(result, indent=None if options['json'] else 2))
+
+    def content(self, rng, terms, length, hit_rate):
+        """Words separated by spaces and punctuation, with hit_rate of them drawn from the term list"""
+        words = []
+        size = 0
+        while size < length:
+            word = rng.choice(terms) if rng.random() < hit_rate else random_word(rng, 2, 9)
+            if rng.random() < 0.3:
+                word = word.capitalize()
+            words.append(word + rng.choice(['', '', '', ',', '.', '!']))
+            size += len(words[-1]) + 1
+        return ' '.join(words)[:length]
@@ -0,0 +1,396 @@
+# chat/management/commands/bench_redis_service.py
+from django.core.management.base import BaseCommand, CommandError
+from chat.services.redis_service import RedisChatService, room_key, space_key, user_key
+from chat.management.commands.bench_fanout import percentile
+from datetime import datetime, timedelta
+import inspect
+import json
+import random
+import statistics
+import time
+import uuid
+
+BENCH_PREFIX = 'svcbench'
+SEED_CHUNK = 1000
+STREAM_GROUP = 'svcbench'
+IDEMPOTENCY_KEYS = 100  # Distinct keys cycled through by the idempotency cases
+
+
+class RoundTripCounter:
+    """
+    Counts network round trips made through a client: every direct command, every pipeline
+    execute and every command a pipeline runs immediately (SCRIPT EXISTS/LOAD before scripts).
+    Installed as instance attributes so the shared client and its registered scripts are counted as-is.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.count = 0
+
+    def install(self):
+        execute_command = self.client.execute_command
+        pipeline = self.client.pipeline
+
+        def counted_execute_command(*args, **options):
+            self.count += 1
+            return execute_command(*args, **options)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute, immediate = pipe.execute, pipe.immediate_execute_command
+
+            def counted_execute(*args, **kwargs):
+                if pipe.command_stack or pipe.watching:
+                    self.count += 1
+                return execute(*args, **kwargs)
+
+            def counted_immediate(*args, **options):
+                self.count += 1
+                return immediate(*args, **options)
+
+            pipe.execute = counted_execute
+            pipe.immediate_execute_command = counted_immediate
+            return pipe
+
+        self.client.execute_command = counted_execute_command
+        self.client.pipeline = counted_pipeline
+
+    def uninstall(self):
+        del self.client.execute_command
+        del self.client.pipeline
+
+
+def public_methods(service):
+    return sorted(name for name, _ in inspect.getmembers(type(service), inspect.isfunction) if not name.startswith('_'))
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every public RedisChatService method: ops/s, latency percentiles and round trips per call. '
+            'Seeds and removes its own keys but also touches the shared work sets; use a local Redis')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=100, help='Rooms to seed')
+        parser.add_argument('--users', type=int, default=2000, help='Users to seed')
+        parser.add_argument('--members', type=int, default=200, help='Members per room')
+        parser.add_argument('--online', type=int, default=50, help='Online users per room')
+        parser.add_argument('--messages', type=int, default=100, help='Cached recent messages per room')
+        parser.add_argument('--iterations', type=int, default=500, help='Timed calls per method')
+        parser.add_argument('--methods', default='', help='Comma-separated methods to run (default: all)')
+        parser.add_argument('--fake', action='store_true', help='Run against fakeredis instead of REDIS_URL')
+        parser.add_argument('--baseline', help='JSON output of an earlier run; fail if any method needs more round trips')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the seeded keys')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable results only')
+
+    def handle(self, *args, **options):
+        client = None
+        if options['fake']:
+            try:
+                import fakeredis
+            except ImportError:
+                raise CommandError('--fake needs the fakeredis package')
+            client = fakeredis.FakeRedis(decode_responses=True)
+        service = RedisChatService(client)
+        if not service.health_check()['status'] == 'healthy':
+            raise CommandError('Redis is not reachable; start it or pass --fake')
+
+        fixtures = self.seed(service, options)
+        counter = RoundTripCounter(service.redis_client)
+        counter.install()
+        try:
+            cases = self.cases(service, fixtures, options)
+            selected = [name for name in options['methods'].split(',') if name] or list(cases)
+            unknown = set(selected) - set(cases)
+            if unknown:
+                raise CommandError(f"No benchmark for: {', '.join(sorted(unknown))}")
+            results = [self.run_case(name, cases[name], counter, options['iterations']) for name in selected]
+        finally:
+            counter.uninstall()
+            if not options['keep_data']:
+                self.cleanup(service, fixtures)
+
+        uncovered = sorted(set(public_methods(service)) - set(cases))
+        output = {
+            'backend': 'fakeredis' if options['fake'] else 'redis',
+            'cardinalities': {key: options[key] for key in ('rooms', 'users', 'members', 'online', 'messages')},
+            'iterations': options['iterations'],
+            'methods': results,
+            'uncovered': uncovered,
+        }
+        if not options['json']:
+            for result in results:
+                self.stdout.write(
+                    f"{result['method']:<28} {result['ops_per_second']:>9.0f} ops/s  "
+                    f"p50={result['latency_ms']['p50']:.3f}ms p95={result['latency_ms']['p95']:.3f}ms "
+                    f"p99={result['latency_ms']['p99']:.3f}ms  round trips={result['round_trips']['mean']:.1f} "
+                    f"(max {result['round_trips']['max']})"
+                )
+            for name in uncovered:
+                self.stdout.write(self.style.WARNING(f"{name:<28} not benchmarked"))
+        self.stdout.write(json.dumps(output, indent=None if options['json'] else 2))
+
+        if options['baseline']:
+            self.compare(results, options['baseline'], quiet=options['json'])
+
+    def seed(self, service, options):
+        """Rooms, members, presence, recent messages, reactions, stats and streams at the requested sizes"""
+        run_id = uuid.uuid4().hex[:8]
+        rooms = [f"{BENCH_PREFIX}-{run_id}-room-{index}" for index in range(options['rooms'])]
+        users = [f"{BENCH_PREFIX}-{run_id}-user-{index}" for index in range(options['users'])]
+        fixtures = {'run_id': run_id, 'space': f"{BENCH_PREFIX}-{run_id}-space", 'rooms': rooms, 'users': users,
+                    'members': {}, 'messages': {}, 'extra_rooms': []}
+        for room_id in rooms:
+            fixtures['members'][room_id] = random.sample(users, min(options['members'], len(users)))
+            fixtures['messages'][room_id] = self.seed_room(service, room_id, fixtures['members'][room_id], options)
+
+        pipe = service.redis_client.pipeline(transaction=False)
+        now = time.time()
+        for room_id in rooms:
+            for user_id in fixtures['members'][room_id]:
+                pipe.zadd(user_key(user_id, 'rooms', 'activity'), {room_id: now - random.random() * 86400})
+                pipe.hset(user_key(user_id, 'rooms', 'read'), room_id, random.randint(0, 1000))
+                if len(pipe.command_stack) >= SEED_CHUNK:
+                    pipe.execute()
+        online = {user_id for room_id in rooms for user_id in fixtures['members'][room_id][:options['online']]}
+        for user_id in online:
+            pipe.zadd(space_key(fixtures['space'], 'online'), {user_id: now})
+            pipe.hset(space_key(fixtures['space'], 'online', 'connections'), user_id, 1)
+        pipe.execute()
+        service.ensure_stream_group(rooms[0], STREAM_GROUP)
+        return fixtures
+
+    def seed_room(self, service, room_id, members, options):
+        pipe = service.redis_client.pipeline(transaction=False)
+        now = datetime.now()
+        messages = []
+        for index in range(options['messages']):
+            message = {
+                'id': str(uuid.uuid4()),
+                'room': room_id,
+                'user': random.choice(members),
+                'content': 'x' * random.randint(20, 200),
+                'media': [],
+                'reply_to': None,
+                'created_at': (now - timedelta(seconds=index)).isoformat(),
+            }
+            messages.append(message['id'])
+            pipe.setex(room_key(room_id, 'message', message['id']), service.default_ttl, json.dumps(message))
+            pipe.rpush(room_key(room_id, 'messages', 'recent'), json.dumps(message))
+            if index % 5 == 0:
+                pipe.hset(room_key(room_id, 'message', message['id'], 'reactions'),
+                          mapping={emoji: random.randint(1, 20) for emoji in ('👍', '❤️', '😂')})
+                pipe.sadd(room_key(room_id, 'message', message['id'], 'reactors'), service.REACTORS_LOADED)
+        pipe.expire(room_key(room_id, 'messages', 'recent'), service.default_ttl)
+        online = members[:options['online']]
+        if online:
+            pipe.hset(room_key(room_id, 'online_users'), mapping={user_id: now.isoformat() for user_id in online})
+        if members:
+            pipe.hset(room_key(room_id, 'typing_users'), mapping={user_id: now.isoformat() for user_id in members[:3]})
+        pipe.set(room_key(room_id, 'stats', 'message_total'), random.randint(1000, 100000))
+        pipe.set(room_key(room_id, 'stats', 'message_count', 'pending'), random.randint(0, 50))
+        pipe.hset(room_key(room_id, 'last_message'), mapping={
+            'id': messages[0] if messages else '', 'user': members[0] if members else '', 'content': 'hello',
+            'has_media': 0, 'created_at': now.isoformat(),
+        })
+        pipe.execute()
+        return messages
+
+    def cases(self, service, fixtures, options):
+        """method -> (setup, call); setup(i) runs untimed and returns the call's arguments"""
+        rooms, users, members, messages = fixtures['rooms'], fixtures['users'], fixtures['members'], fixtures['messages']
+        stream_room = rooms[0]
+
+        def room(i):
+            return rooms[i % len(rooms)]
+
+        def member(i):
+            room_id = room(i)
+            return room_id, members[room_id][i % len(members[room_id])]
+
+        def message(i):
+            room_id = room(i)
+            return room_id, messages[room_id][i % len(messages[room_id])] if messages[room_id] else str(uuid.uuid4())
+
+        def new_message(room_id, user_id):
+            return {'id': str(uuid.uuid4()), 'room': room_id, 'user': user_id, 'content': 'x' * 120, 'media': [],
+                    'reply_to': None, 'created_at': datetime.now().isoformat()}
+
+        def enqueued(i):
+            service.enqueue_message(stream_room, new_message(stream_room, users[0]))
+            return ([stream_room], STREAM_GROUP, 'bench', 10, 1)
+
+        def read_entries(i):
+            enqueued(i)
+            entries = service.read_message_streams([stream_room], STREAM_GROUP, 'bench', count=10, block_ms=1)
+            return (stream_room, STREAM_GROUP, [entry_id for entry_id, _ in entries.get(stream_room, [])])
+
+        def fresh_room(i):
+            room_id = f"{BENCH_PREFIX}-{fixtures['run_id']}-cleanup-{i}"
+            fixtures['extra_rooms'].append(room_id)
+            self.seed_room(service, room_id, members[room(i)], options)
+            return (room_id,)
+
+        def dirty_reactions(i):
+            for room_id, message_id in [message(i + offset) for offset in range(20)]:
+                service.redis_client.hincrby(service.REACTIONS_DIRTY_KEY, f"{room_id}:{message_id}", 1)
+            return (20,)
+
+        def dirty_counts(i):
+            for offset in range(20):
+                service.increment_message_count(room(i + offset))
+            return (20,)
+
+        def registered(i):
+            room_id, user_id = member(i)
+            service.register_connection(user_id, f"bench.{i}", room_id)
+            return (user_id, f"bench.{i}", room_id)
+
+        def online(i):
+            room_id, user_id = member(i)
+            service.set_user_online(room_id, user_id, fixtures['space'])
+            return (room_id, user_id, fixtures['space'])
+
+        def left(i):
+            room_id, user_id = member(i)
+            service.set_user_online(room_id, user_id, fixtures['space'])
+            service.set_user_offline(room_id, user_id, fixtures['space'], leaving=True)
+            return (room_id, user_id)
+
+        return {
+            'health_check': (lambda i: (), service.health_check),
+            'cache_message': (lambda i: (room(i), new_message(*member(i))), service.cache_message),
+            'get_cached_messages': (lambda i: (room(i), 50), service.get_cached_messages),
+            'invalidate_message': (message, service.invalidate_message),
+            'invalidate_recent_messages': (fresh_room, service.invalidate_recent_messages),
+            'enqueue_message': (lambda i: (stream_room, new_message(stream_room, users[0])), service.enqueue_message),
+            'get_stream_rooms': (lambda i: (), service.get_stream_rooms),
+            'ensure_stream_group': (lambda i: (stream_room, STREAM_GROUP), service.ensure_stream_group),
+            'read_message_streams': (enqueued, service.read_message_streams),
+            'claim_stale_messages': (lambda i: (stream_room, STREAM_GROUP, 'bench-claimer', 0, 10),
+                                     service.claim_stale_messages),
+            'ack_messages': (read_entries, service.ack_messages),
+            'get_stream_lag': (lambda i: (rooms[:50],), service.get_stream_lag),
+            'retire_drained_streams': (lambda i: ([stream_room], STREAM_GROUP), service.retire_drained_streams),
+            'record_persist_metrics': (lambda i: (10, 0), service.record_persist_metrics),
+            'get_persist_metrics': (lambda i: (), service.get_persist_metrics),
+            'register_connection': (lambda i: (member(i)[1], f"bench.{i}", room(i)), service.register_connection),
+            'unregister_connection': (registered, service.unregister_connection),
+            'get_user_connections': (lambda i: (member(i)[1],), service.get_user_connections),
+            'set_user_online': (lambda i: (*member(i), fixtures['space']), service.set_user_online),
+            'presence_heartbeat': (lambda i: (*member(i), fixtures['space'], f"bench.{i}"), service.presence_heartbeat),
+            'set_user_offline': (online, service.set_user_offline),
+            'take_leave_marker': (left, service.take_leave_marker),
+            'get_online_count': (lambda i: (room(i),), service.get_online_count),
+            'get_online_users': (lambda i: (room(i),), service.get_online_users),
+            'get_space_online_users': (lambda i: (fixtures['space'],), service.get_space_online_users),
+            'get_space_presence': (lambda i: (fixtures['space'], rooms[:20]), service.get_space_presence),
+            'set_user_typing': (member, service.set_user_typing),
+            'unset_user_typing': (member, service.unset_user_typing),
+            'get_typing_users': (lambda i: (room(i),), service.get_typing_users),
+            'react': (lambda i: (*message(i), member(i)[1], '👍', i % 2 == 0), service.react),
+            'seed_reactions': (lambda i: (*message(i), {'🎉': 1}, [f"{member(i)[1]}:🎉"]), service.seed_reactions),
+            'get_reaction_counts': (lambda i: (room(i), messages[room(i)][:50]), service.get_reaction_counts),
+            'take_dirty_reactions': (dirty_reactions, service.take_dirty_reactions),
+            'clear_dirty_reactions': (lambda i: ({message(i + offset): '1' for offset in range(20)},),
+                                      service.clear_dirty_reactions),
+            'get_fanout_shards': (lambda i: (room(i),), service.get_fanout_shards),
+            'promote_fanout': (lambda i: (room(i), 1), service.promote_fanout),
+            'record_room_activity': (lambda i: (room(i), new_message(*member(i)), members[room(i)]),
+                                     service.record_room_activity),
+            'mark_room_read': (member, service.mark_room_read),
+            'record_throughput': (lambda i: member(i), service.record_throughput),
+            'get_room_throughput': (lambda i: ([room(i + offset) for offset in range(20)],), service.get_room_throughput),
+            'get_room_message_rates': (lambda i: ([room(i)],), service.get_room_message_rates),
+            'get_hot_rooms': (lambda i: (20,), service.get_hot_rooms),
+            'get_room_summaries': (lambda i: (member(i)[1], rooms[:50]), service.get_room_summaries),
+            'increment_message_count': (lambda i: (room(i),), service.increment_message_count),
+            'take_pending_counts': (dirty_counts, service.take_pending_counts),
+            'restore_pending_counts': (lambda i: ({room(i): 1},), service.restore_pending_counts),
+            'set_message_totals': (lambda i: ({room(i): 1000 + i},), service.set_message_totals),
+            'get_room_stats': (lambda i: (room(i),), service.get_room_stats),
+            'get_rooms_stats': (lambda i: (rooms[:50],), service.get_rooms_stats),
+            'get_message_totals': (lambda i: (rooms[:50],), service.get_message_totals),
+            'cleanup_room': (fresh_room, service.cleanup_room),
+            'record_member_change': (lambda i: (fixtures['space'], 'add', member(i)[1], f"user{i}"),
+                                     service.record_member_change),
+            'get_member_changes': (lambda i: (fixtures['space'], max(i - 5, 0)), service.get_member_changes),
+            'record_mentions': (lambda i: (fixtures['space'], members[room(i)][:3],
+                                           {'room_id': room(i), 'message_id': str(uuid.uuid4()), 'content': 'x' * 140},
+                                           time.time()), service.record_mentions),
+            'get_mentions': (lambda i: (member(i)[1], fixtures['space'], 50), service.get_mentions),
+            'get_moderation_version': (lambda i: (fixtures['space'],), service.get_moderation_version),
+            'bump_moderation_version': (lambda i: (fixtures['space'],), service.bump_moderation_version),
+            'flag_content': (lambda i: (fixtures['space'], {'kind': 'message', 'id': str(uuid.uuid4()), 'terms': ['x']}),
+                             service.flag_content),
+            'get_flagged_content': (lambda i: (fixtures['space'], 50), service.get_flagged_content),
+            'check_rate_limit': (lambda i: (member(i)[1], 'bench', 10 ** 9), service.check_rate_limit),
+            'claim_idempotency_key': (lambda i: (users[0], 'bench', f"k{i % IDEMPOTENCY_KEYS}", 'f'), service.claim_idempotency_key),
+            'store_idempotent_response': (lambda i: (users[0], 'bench', f"k{i % IDEMPOTENCY_KEYS}", 'f', 201,
+                                                     new_message(room(i), users[0])), service.store_idempotent_response),
+            'release_idempotency_key': (lambda i: (users[0], 'bench', f"k{i % IDEMPOTENCY_KEYS}"), service.release_idempotency_key),
+            'cache_search_results': (lambda i: (f"query {i % 10}", room(i), [{'id': str(uuid.uuid4())}] * 20),
+                                     service.cache_search_results),
+            'get_cached_search_results': (lambda i: (f"query {i % 10}", room(i)), service.get_cached_search_results),
+        }
+
+    def run_case(self, name, case, counter, iterations):
+        setup, call = case
+        latencies = []
+        round_trips = []
+        for i in range(iterations):
+            args = setup(i)
+            counter.count = 0
+            started = time.perf_counter()
+            call(*args)
+            latencies.append(time.perf_counter() - started)
+            round_trips.append(counter.count)
+        total = sum(latencies)
+        return {
+            'method': name,
+            'ops_per_second': iterations / total if total else 0,
+            'latency_ms': {
+                'p50': percentile(latencies, 50) * 1000,
+                'p95': percentile(latencies, 95) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'max': max(latencies) * 1000,
+            },
+            'round_trips': {'mean': statistics.fmean(round_trips), 'max': max(round_trips)},
+        }
+
+    def compare(self, results, path, quiet=False):
+        with open(path) as baseline_file:
+            baseline = {result['method']: result for result in json.load(baseline_file)['methods']}
+        regressions = []
+        for result in results:
+            before = baseline.get(result['method'])
+            if before and result['round_trips']['max'] > before['round_trips']['max']:
+                regressions.append(f"{result['method']}: {before['round_trips']['max']} -> {result['round_trips']['max']}")
+        if regressions:
+            raise CommandError(f"Round trips per call regressed: {'; '.join(regressions)}")
+        if not quiet:
+            self.stdout.write(self.style.SUCCESS('No round-trip regressions against the baseline'))
+
+    def cleanup(self, service, fixtures):
+        for room_id in fixtures['rooms'] + fixtures['extra_rooms']:
+            service.cleanup_room(room_id)
+        keys = []
+        for user_id in fixtures['users']:
+            keys += [user_key(user_id, 'rooms', 'activity'), user_key(user_id, 'rooms', 'read'), user_key(user_id, 'connections'),
+                     f"rate_limit:{{{user_id}}}:bench"]
+        keys += [user_key(user_id, 'mentions', fixtures['space']) for user_id in fixtures['users']]
+        keys += [space_key(fixtures['space'], 'online'), space_key(fixtures['space'], 'online', 'connections'),
+                 space_key(fixtures['space'], 'members', 'version'), space_key(fixtures['space'], 'members', 'changes'),
+                 space_key(fixtures['space'], 'moderation', 'version'), space_key(fixtures['space'], 'moderation', 'flagged')]
+        keys += [user_key(fixtures['users'][0], 'idempotency', 'bench', f"k{i}") for i in range(IDEMPOTENCY_KEYS)]
+        for start in range(0, len(keys), 500):
+            service.redis_client.delete(*keys[start:start + 500])
+        # Bench rooms left in the shared work sets would be picked up by the flush and persist workers
+        rooms = fixtures['rooms'] + fixtures['extra_rooms']
+        minute = int(time.time()) // 60
+        for hot_minute in range(minute - 2, minute + 1):
+            service.redis_client.zrem(service._hot_rooms_key(hot_minute), *rooms)
+        service.redis_client.srem(service.STREAM_ROOMS_KEY, *rooms)
+        service.redis_client.srem(service.COUNTERS_DIRTY_KEY, *rooms)
+        prefix = f"{BENCH_PREFIX}-{fixtures['run_id']}-"
+        dirty = [field for field, _ in service.redis_client.hscan_iter(service.REACTIONS_DIRTY_KEY, match=f"{prefix}*")]
+        if dirty:
+            service.redis_client.hdel(service.REACTIONS_DIRTY_KEY, *dirty)
@@ -0,0 +1,72 @@
+# chat/management/commands/bench_startup.py
+from django.core.management.base import BaseCommand
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Run in a fresh interpreter per sample, the way a Gunicorn/Daphne worker boots.
+# 'eager' replays what ChatConfig.ready used to do: connect, create the keyspace and sync every table.
+BOOT_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+error = None
+if sys.argv[1] == 'eager':
+    try:
+        from cassandra.cqlengine import connection
+        from chat.scylla import MIGRATIONS
+        session = connection.get_session()
+        for _, _, apply in MIGRATIONS:
+            apply(session)
+    except Exception as e:
+        error = str(e)
+print(json.dumps({'seconds': time.perf_counter() - started, 'error': error}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure per-worker boot time (django.setup) with lazy Scylla setup vs the old eager setup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters per mode')
+        parser.add_argument('--modes', default='eager,lazy', help='Comma-separated modes to compare')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable results only')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', os.environ.get('DJANGO_SETTINGS_MODULE', 'galileo.settings'))
+        results = []
+        for mode in options['modes'].split(','):
+            samples, errors = [], []
+            for _ in range(options['runs']):
+                completed = subprocess.run([sys.executable, '-c', BOOT_SCRIPT, mode], env=env,
+                                           capture_output=True, text=True)
+                lines = completed.stdout.strip().splitlines()
+                if completed.returncode != 0 or not lines:
+                    errors.append(completed.stderr.strip().splitlines()[-1:] or ['exit %d' % completed.returncode])
+                    continue
+                sample = json.loads(lines[-1])
+                samples.append(sample['seconds'] * 1000)
+                if sample['error']:
+                    errors.append(sample['error'])
+            result = {
+                'mode': mode,
+                'runs': len(samples),
+                'errors': len(errors),
+                'first_error': errors[0] if errors else None,
+                'boot_ms': {
+                    'min': min(samples) if samples else None,
+                    'median': statistics.median(samples) if samples else None,
+                    'max': max(samples) if samples else None,
+                },
+            }
+            results.append(result)
+            if not options['json'] and samples:
+                self.stdout.write(f"{mode:<6} median={result['boot_ms']['median']:.1f}ms "
+                                  f"min={result['boot_ms']['min']:.1f}ms max={result['boot_ms']['max']:.1f}ms "
+                                  f"errors={len(errors)}")
+
+        self.stdout.write(json.dumps({'runs': results}, indent=None if options['json'] else 2))
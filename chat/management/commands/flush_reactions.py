@@ -0,0 +1,57 @@
+# chat/management/commands/flush_reactions.py
+from django.core.management.base import BaseCommand
+from chat.services.redis_service import redis_chat_service
+from chat.services.scylla_writer import save_reactions
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Flush reaction counts changed in Redis into the ScyllaDB reactions table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=5, help='Seconds between flushes')
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages flushed per round')
+        parser.add_argument('--once', action='store_true', help='Flush once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                flushed = self.flush(options['batch_size'])
+                if options['once']:
+                    self.stdout.write(self.style.SUCCESS(f"Flushed reactions for {flushed} messages"))
+                    return
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping flush_reactions")
+                return
+
+    def flush(self, batch_size):
+        """
+        One pass over the changed messages, returns number of messages flushed. The pass moves on
+        past messages that fail to save, so one that Scylla keeps rejecting cannot hold up the rest;
+        they keep their mark and are retried on the next pass.
+        """
+        flushed = 0
+        cursor = 0
+        while True:
+            cursor, taken = redis_chat_service.take_dirty_reactions(batch_size, cursor)
+            # Expired state has nothing newer than what was last flushed
+            reactions = {key: state for key, state in taken.items() if state['reactors'] is not None}
+            try:
+                failed = save_reactions(reactions)
+            except Exception as e:
+                logger.error(f"Failed to flush reactions for {len(reactions)} messages: {str(e)}")
+                failed = list(reactions)
+
+            retry = set(failed)
+            redis_chat_service.clear_dirty_reactions(
+                {key: state['version'] for key, state in taken.items() if key not in retry}
+            )
+            if failed:
+                logger.error(f"Failed to flush {len(failed)} reaction updates, retrying next pass")
+            flushed += len(reactions) - len(failed)
+            if not cursor:
+                return flushed
@@ -0,0 +1,59 @@
+# chat/management/commands/flush_room_counters.py
+from django.core.management.base import BaseCommand
+from chat.services.redis_service import redis_chat_service
+from chat.services.scylla_writer import increment_room_counters, get_room_counters
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Flush per-room message counts accumulated in Redis into the durable ScyllaDB counter table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=10, help='Seconds between flushes')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rooms flushed per round')
+        parser.add_argument('--once', action='store_true', help='Flush once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                flushed = self.flush(options['batch_size'])
+                if options['once']:
+                    self.stdout.write(self.style.SUCCESS(f"Flushed counters for {flushed} rooms"))
+                    return
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping flush_room_counters")
+                return
+
+    def flush(self, batch_size):
+        """Drain dirty rooms until none are left, returns number of rooms flushed"""
+        flushed = 0
+        while True:
+            counts = redis_chat_service.take_pending_counts(batch_size)
+            if not counts:
+                return flushed
+            try:
+                applied = increment_room_counters(counts)
+            except Exception as e:
+                logger.error(f"Failed to flush counters for {len(counts)} rooms: {str(e)}")
+                applied = []
+
+            # Only counts that never reached Scylla go back; restoring an applied one would add it twice
+            applied_rooms = set(applied)
+            unapplied = {room_id: n for room_id, n in counts.items() if room_id not in applied_rooms}
+            if unapplied:
+                redis_chat_service.restore_pending_counts(unapplied)
+
+            # Re-sync the Redis mirror with the durable values
+            if applied:
+                try:
+                    redis_chat_service.set_message_totals(get_room_counters(applied))
+                except Exception as e:
+                    logger.error(f"Failed to refresh mirrored totals: {str(e)}")
+            flushed += len(applied)
+            logger.debug(f"Flushed message counters for {len(applied)} rooms")
+            if unapplied:
+                return flushed
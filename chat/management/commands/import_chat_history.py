@@ -0,0 +1,155 @@
+# chat/management/commands/import_chat_history.py
+from django.core.management.base import BaseCommand, CommandError
+from django.core.cache import cache
+from cassandra.cqlengine import connection
+from cassandra.concurrent import execute_concurrent_with_args
+from chat.services.redis_service import redis_chat_service
+from chat.services.scylla_writer import count_room_messages, get_insert_statement, message_to_row
+from collections import Counter
+import csv
+import io
+import json
+import logging
+import sys
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Namespace for ids derived from source rows, so re-running an import overwrites instead of duplicating
+IMPORT_NAMESPACE = uuid.UUID('6f1b8d1e-3c2a-4b7e-9a52-2f0c5d8e7a11')
+
+
+class Command(BaseCommand):
+    help = 'Bulk import chat history (NDJSON or CSV) into ScyllaDB'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['ndjson', 'csv'], help='Input format (default: from file extension)')
+        parser.add_argument('--room', help='Import every row into this chat room id')
+        parser.add_argument('--concurrency', type=int, default=100, help='Max in-flight insert requests')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows grouped by partition per write round')
+        parser.add_argument('--progress-every', type=int, default=50000, help='Report progress every N rows')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        stream = sys.stdin if path == '-' else io.open(path, encoding='utf-8', newline='')
+
+        session = connection.get_session()
+        insert = get_insert_statement()
+        room_counts = Counter()
+        imported = failed = skipped = 0
+        started = last_report = time.monotonic()
+        reported_at = 0
+
+        try:
+            rows = self.read_rows(stream, fmt)
+            chunk = []
+            for record in rows:
+                try:
+                    chunk.append(message_to_row(self.normalize(record, options['room'])))
+                except (KeyError, ValueError, TypeError) as e:
+                    skipped += 1
+                    logger.warning(f"Skipping invalid row: {str(e)}")
+                    continue
+
+                if len(chunk) >= options['chunk_size']:
+                    ok, bad = self.write_chunk(session, insert, chunk, options['concurrency'], room_counts)
+                    imported, failed, chunk = imported + ok, failed + bad, []
+
+                    if imported - reported_at >= options['progress_every']:
+                        now = time.monotonic()
+                        rate = (imported - reported_at) / max(now - last_report, 1e-6)
+                        self.stdout.write(f"{imported} rows imported ({rate:.0f} rows/s, {failed} failed, {skipped} skipped)")
+                        reported_at, last_report = imported, now
+
+            if chunk:
+                ok, bad = self.write_chunk(session, insert, chunk, options['concurrency'], room_counts)
+                imported, failed = imported + ok, failed + bad
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.rebuild_derived_state(room_counts)
+
+        elapsed = time.monotonic() - started
+        summary = (f"Imported {imported} messages into {len(room_counts)} rooms in {elapsed:.1f}s "
+                   f"({imported / max(elapsed, 1e-6):.0f} rows/s), {failed} failed, {skipped} skipped")
+        if failed:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def read_rows(self, stream, fmt):
+        """Yield input records one at a time"""
+        if fmt == 'csv':
+            yield from csv.DictReader(stream)
+            return
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f"Invalid JSON on line {line_no}: {str(e)}")
+
+    def normalize(self, record, room_override=None):
+        """Map an input record to the message payload shape used by MessageView.post"""
+        room = room_override or record['room']
+        media = record.get('media') or []
+        if isinstance(media, str):
+            media = json.loads(media) if media.startswith('[') else [media]
+
+        message_id = record.get('id')
+        if not message_id:
+            source_key = f"{room}|{record['created_at']}|{record['user']}|{record.get('content', '')}"
+            message_id = str(uuid.uuid5(IMPORT_NAMESPACE, source_key))
+
+        return {
+            'id': message_id,
+            'room': room,
+            'user': record['user'],
+            'content': record.get('content') or '',
+            'created_at': record['created_at'],
+            'edited_at': record.get('edited_at') or None,
+            'reply_to': record.get('reply_to') or None,
+            'media': media,
+        }
+
+    def write_chunk(self, session, insert, chunk, concurrency, room_counts):
+        """Write one chunk partition by partition with a bounded number of in-flight requests"""
+        chunk.sort(key=lambda row: row[0])  # Consecutive requests hit the same partition and replicas
+        results = execute_concurrent_with_args(
+            session, insert, chunk, concurrency=concurrency, raise_on_first_error=False,
+            execution_profile='message_write')
+
+        ok = bad = 0
+        for row, (success, result) in zip(chunk, results):
+            if success:
+                ok += 1
+                room_counts[row[0]] += 1
+            else:
+                bad += 1
+                logger.error(f"Failed to import message {row[2]} in room {row[0]}: {result}")
+        return ok, bad
+
+    def rebuild_derived_state(self, room_counts):
+        """
+        Bring per-room derived state in line with the imported rows. Ids are derived from the source
+        rows, so a re-run overwrites rows it already wrote; the message counter is therefore moved to
+        the room's actual row count instead of being increased by the rows written.
+        """
+        room_ids = list(room_counts)
+        totals = redis_chat_service.get_message_totals(room_ids)
+        if totals is None:
+            self.stdout.write(self.style.WARNING(
+                "Redis unavailable, message counts not updated; re-run the import to fix them"))
+        for room_id in room_ids:
+            if totals is not None:
+                difference = count_room_messages(room_id) - totals[room_id]
+                if difference:
+                    redis_chat_service.increment_message_count(room_id, difference)
+            redis_chat_service.invalidate_recent_messages(room_id)
+            cache.delete(f"room:{room_id}:messages:recent")
@@ -0,0 +1,90 @@
+# chat/management/commands/migrate_redis_keys.py
+from django.core.management.base import BaseCommand
+from chat.services.redis_service import redis_chat_service, room_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Keys from before room keys carried a {hash tag} that hold data not yet in Scylla. Everything else
+# under the old names (caches, presence, typing, rate limits) expires by itself or is rebuilt on read.
+OLD_STREAM_PATTERN = 'room:*:stream'
+OLD_PENDING_PATTERN = 'room:*:stats:message_count:pending'
+BATCH = 500
+
+
+def old_room_keys(client, pattern):
+    """(room_id, key) for keys matching pattern whose room id is not hash-tagged"""
+    for key in client.scan_iter(match=pattern, count=BATCH):
+        room_id = key.split(':')[1]
+        if not room_id.startswith('{'):
+            yield room_id, key
+
+
+class Command(BaseCommand):
+    help = ('Move write-behind streams and pending message counts from the untagged room:<id>:... keys '
+            'to room:{<id>}:...; run once with the old release stopped, before starting the new one')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without moving it')
+
+    def handle(self, *args, **options):
+        client = redis_chat_service.redis_client
+        dry_run = options['dry_run']
+        streams = entries = rooms = counted = 0
+
+        for room_id, old_key in old_room_keys(client, OLD_STREAM_PATTERN):
+            if client.type(old_key) != 'stream':
+                continue
+            moved = self.move_stream(client, room_id, old_key, dry_run)
+            streams += 1
+            entries += moved
+
+        for room_id, old_key in old_room_keys(client, OLD_PENDING_PATTERN):
+            moved = self.move_pending_count(client, room_id, old_key, dry_run)
+            rooms += 1
+            counted += moved
+
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {entries} unpersisted messages from {streams} streams "
+            f"and {counted} pending counts from {rooms} rooms"))
+
+    def move_stream(self, client, room_id, old_key, dry_run):
+        """Copy every entry of an old stream to the room's new stream, then drop the old one.
+        Acked entries are deleted from streams, so whatever is left has not reached Scylla;
+        persist_messages writes by message id, so an entry the old worker also persisted is harmless."""
+        new_key = room_key(room_id, 'stream')
+        moved = 0
+        last_id = '-'
+        while True:
+            batch = client.xrange(old_key, min=last_id, max='+', count=BATCH)
+            if last_id != '-':
+                batch = batch[1:]  # min is inclusive
+            if not batch:
+                break
+            if not dry_run:
+                pipe = client.pipeline(transaction=False)
+                for _, fields in batch:
+                    pipe.xadd(new_key, fields)
+                pipe.execute()
+            moved += len(batch)
+            last_id = batch[-1][0]
+
+        if not dry_run:
+            if moved:
+                client.sadd(redis_chat_service.STREAM_ROOMS_KEY, room_id)
+            client.delete(old_key)
+        logger.info(f"Room {room_id}: {moved} stream entries {'to move' if dry_run else 'moved'}")
+        return moved
+
+    def move_pending_count(self, client, room_id, old_key, dry_run):
+        """Add an old pending count to the room's new one and mark the room for flush_room_counters"""
+        if dry_run:
+            return int(client.get(old_key) or 0)
+        pending = int(client.getdel(old_key) or 0)
+        if pending:
+            pipe = client.pipeline(transaction=False)
+            pipe.incrby(room_key(room_id, 'stats', 'message_count', 'pending'), pending)
+            pipe.sadd(redis_chat_service.COUNTERS_DIRTY_KEY, room_id)
+            pipe.execute()
+        return pending
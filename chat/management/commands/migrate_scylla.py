@@ -0,0 +1,30 @@
+# chat/management/commands/migrate_scylla.py
+from django.core.management.base import BaseCommand
+from cassandra.cqlengine import connection
+from chat.scylla import MIGRATIONS, applied_versions, migrate
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Apply versioned ScyllaDB schema migrations for the chat app (run once per deploy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', type=int, help='Migrate up to and including this version')
+        parser.add_argument('--list', action='store_true', help='Show migrations and whether they are applied')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            done = applied_versions(connection.get_session())
+            for version, name, _ in MIGRATIONS:
+                mark = 'X' if version in done else ' '
+                self.stdout.write(f"[{mark}] {version:04d} {name}")
+            return
+
+        applied = migrate(target=options['target'], stdout=self.stdout)
+        if applied:
+            logger.info(f"Applied chat schema migrations {applied}")
+            self.stdout.write(self.style.SUCCESS(f"Applied {len(applied)} migration(s)"))
+        else:
+            self.stdout.write("No migrations to apply")
@@ -0,0 +1,95 @@
+# chat/management/commands/persist_messages.py
+from django.core.management.base import BaseCommand
+from chat.services.redis_service import redis_chat_service
+from chat.services.message_store import get_message_store
+import logging
+import socket
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Drain per-room Redis message streams into ScyllaDB (write-behind worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', default='persist', help='Consumer group name')
+        parser.add_argument('--consumer', default=f"{socket.gethostname()}-{os.getpid()}", help='Consumer name within the group')
+        parser.add_argument('--batch-size', type=int, default=500, help='Max entries read per stream per round')
+        parser.add_argument('--block-ms', type=int, default=1000, help='How long to block waiting for new entries')
+        parser.add_argument('--claim-idle-ms', type=int, default=60000, help='Reclaim entries pending longer than this from dead consumers')
+        parser.add_argument('--refresh-interval', type=int, default=5, help='Seconds between stream discovery, reclaim and lag reporting')
+        parser.add_argument('--once', action='store_true', help='Drain what is available and exit')
+
+    def handle(self, *args, **options):
+        self.group = options['group']
+        self.consumer = options['consumer']
+        batch_size = options['batch_size']
+        known_rooms = set()
+        last_refresh = 0
+        persisted_since_report = 0
+
+        self.stdout.write(f"persist_messages: group={self.group} consumer={self.consumer}")
+
+        while True:
+            try:
+                now = time.monotonic()
+                if now - last_refresh >= options['refresh_interval']:
+                    rooms = set(redis_chat_service.get_stream_rooms())
+                    for room_id in rooms - known_rooms:
+                        redis_chat_service.ensure_stream_group(room_id, self.group)
+                    if not known_rooms:
+                        # First round: finish anything this consumer read but never acked
+                        pending = redis_chat_service.read_message_streams(
+                            list(rooms), self.group, self.consumer, count=batch_size, pending=True)
+                        persisted_since_report += self.persist(pending)
+                    known_rooms = rooms
+
+                    for room_id in known_rooms:
+                        claimed = redis_chat_service.claim_stale_messages(
+                            room_id, self.group, self.consumer, min_idle_ms=options['claim_idle_ms'], count=batch_size)
+                        if claimed:
+                            persisted_since_report += self.persist({room_id: claimed})
+
+                    room_lag = redis_chat_service.get_stream_lag(list(known_rooms))
+                    lag = sum(room_lag.values())
+                    # Stop reading rooms that went quiet, so a round costs the active rooms only
+                    known_rooms -= set(redis_chat_service.retire_drained_streams(
+                        [room_id for room_id in known_rooms if room_id not in room_lag], self.group))
+                    redis_chat_service.record_persist_metrics(persisted_since_report, lag)
+                    logger.info(f"persist_messages: persisted={persisted_since_report} lag={lag}")
+                    persisted_since_report = 0
+                    last_refresh = now
+
+                entries = redis_chat_service.read_message_streams(
+                    list(known_rooms), self.group, self.consumer, count=batch_size, block_ms=options['block_ms'])
+                persisted_since_report += self.persist(entries)
+
+                if options['once'] and not entries:
+                    redis_chat_service.record_persist_metrics(persisted_since_report, 0)
+                    self.stdout.write(self.style.SUCCESS("Streams drained"))
+                    return
+                if not known_rooms:
+                    time.sleep(options['block_ms'] / 1000)
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping persist_messages")
+                return
+            except Exception as e:
+                logger.error(f"persist_messages loop error: {str(e)}")
+                time.sleep(1)
+
+    def persist(self, entries):
+        """Write each room's entries to Scylla and ack them; unacked entries are redelivered"""
+        persisted = 0
+        for room_id, room_entries in entries.items():
+            if not room_entries:
+                continue
+            try:
+                written = get_message_store().write_messages(message for _, message in room_entries)
+            except Exception as e:
+                logger.error(f"Failed to persist {len(room_entries)} messages for room {room_id}: {str(e)}")
+                continue
+            redis_chat_service.ack_messages(room_id, self.group, [entry_id for entry_id, _ in room_entries])
+            persisted += written
+        return persisted
@@ -0,0 +1,37 @@
+# chat/metrics.py - In-process counters and gauges for the chat app
+import threading
+from collections import defaultdict
+from typing import Dict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = defaultdict(float)
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """Increase a monotonically growing counter"""
+    with _lock:
+        _counters[name] += amount
+
+
+def adjust_gauge(name: str, delta: float) -> None:
+    """Move a gauge up or down"""
+    with _lock:
+        _gauges[name] += delta
+
+
+def set_gauge(name: str, value: float) -> None:
+    """Set a gauge to an absolute value"""
+    with _lock:
+        _gauges[name] = value
+
+
+def get_gauge(name: str) -> float:
+    with _lock:
+        return _gauges[name]
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """Copy of all counters and gauges for this process"""
+    with _lock:
+        return {'counters': dict(_counters), 'gauges': dict(_gauges)}
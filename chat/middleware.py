@@ -1,4 +1,7 @@
 # chat/middleware.py
+import json
+import random
+import time
 import jwt
 from outh.models import User  # Keep your custom User import
 from django.contrib.auth.models import AnonymousUser
@@ -8,9 +11,18 @@ from django.conf import settings
 from urllib.parse import parse_qs
 import logging
 from rest_framework_simplejwt.tokens import AccessToken
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
+# Connect admission: each worker takes at most CHAT_CONNECT_RATE new sockets per second (bursts of
+# up to CHAT_CONNECT_BURST) before any token decoding or database work. A socket over the limit is
+# accepted only to be told when to come back, then closed with 1013 (Try Again Later).
+CONNECT_RATE = getattr(settings, 'CHAT_CONNECT_RATE', 200)
+CONNECT_BURST = getattr(settings, 'CHAT_CONNECT_BURST', 400)
+CONNECT_RETRY_MIN_SECONDS = getattr(settings, 'CHAT_CONNECT_RETRY_MIN_SECONDS', 1.0)
+TRY_AGAIN_LATER_CLOSE_CODE = 1013
+
 
 @database_sync_to_async
 def get_user_by_token(token):
@@ -45,4 +57,61 @@ class JWTAuthMiddleware(BaseMiddleware):
                 token = auth_header[7:]
 
         scope['user'] = await get_user_by_token(token) if token else AnonymousUser()
-        return await super().__call__(scope, receive, send)
\ No newline at end of file
+        return await super().__call__(scope, receive, send)
+
+class ConnectAdmission:
+    """Token bucket over this worker's connects; a rate of 0 admits everything"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'window_start', 'rejected')
+
+    def __init__(self, rate: float = CONNECT_RATE, burst: float = CONNECT_BURST):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.window_start = self.updated
+        self.rejected = 0
+
+    def admit(self):
+        """None when the connect may proceed, else the seconds the client should wait before retrying"""
+        if self.rate <= 0:
+            return None
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        if now - self.window_start >= 1.0:
+            self.window_start, self.rejected = now, 0
+        self.rejected += 1
+        # Spread the clients turned away this second over the time the bucket needs to admit them,
+        # so they do not all come back together
+        spread = max(self.rejected / self.rate, CONNECT_RETRY_MIN_SECONDS)
+        return CONNECT_RETRY_MIN_SECONDS + random.uniform(0, spread)
+
+
+class ConnectAdmissionMiddleware(BaseMiddleware):
+    """Outermost WebSocket middleware: turns away connects over the worker's admission rate"""
+
+    def __init__(self, inner, admission: ConnectAdmission = None):
+        super().__init__(inner)
+        self.admission = admission or ConnectAdmission()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            return await super().__call__(scope, receive, send)
+        retry_after = self.admission.admit()
+        if retry_after is None:
+            return await super().__call__(scope, receive, send)
+
+        metrics.incr('ws_connects_rejected')
+        retry_after_ms = int(retry_after * 1000)
+        await receive()  # websocket.connect
+        await send({'type': 'websocket.accept'})
+        await send({'type': 'websocket.send', 'text': json.dumps({
+            'type': 'connection_rejected',
+            'reason': 'overloaded',
+            'retry_after_ms': retry_after_ms
+        })})
+        await send({'type': 'websocket.close', 'code': TRY_AGAIN_LATER_CLOSE_CODE,
+                    'reason': f"retry_after_ms={retry_after_ms}"})
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:25
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_initial'),
+        ('space', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationTerm',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('term', models.CharField(max_length=200)),
+                ('action', models.CharField(choices=[('block', 'Block'), ('mask', 'Mask'), ('flag', 'Flag')], default='block', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('space', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moderation_terms', to='space.space')),
+            ],
+            options={
+                'unique_together': {('space', 'term')},
+            },
+        ),
+    ]
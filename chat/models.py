@@ -2,8 +2,6 @@
 import uuid
 from django.db import models
 from django.conf import settings
-from cassandra.cqlengine import columns
-from cassandra.cqlengine.models import Model
 from space.models import Space
 from teams.models import Team
 
@@ -28,31 +26,34 @@ class ChatRoomMembership(models.Model):
     class Meta:
         unique_together = ('chat_room', 'user')
 
-# ScyllaDB model for storing messages
-class MessageScylla(Model):
-    __keyspace__ = 'galileo'
+class ModerationTerm(models.Model):
+    ACTION_CHOICES = [
+        ('block', 'Block'),  # Reject the message or post
+        ('mask', 'Mask'),  # Replace the term with asterisks
+        ('flag', 'Flag'),  # Accept as-is and queue for moderator review
+    ]
 
-    # Optimized primary key structure for better query performance
-    room = columns.Text(partition_key=True)  # Partition key - distributes data
-    created_at = columns.DateTime(primary_key=True, clustering_order="DESC")  # Clustering key for time ordering
-    id = columns.UUID(primary_key=True, default=uuid.uuid4)  # Secondary clustering key for uniqueness
-
-    # Data fields
-    user = columns.Text()  # User ID as string
-    content = columns.Text()  # Message content
-    media = columns.List(columns.Text, default=list)  # Media attachments
-    edited_at = columns.DateTime()  # Track message edits
-    reply_to = columns.UUID()  # For threaded conversations
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    space = models.ForeignKey(Space, on_delete=models.CASCADE, related_name='moderation_terms')
+    term = models.CharField(max_length=200)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default='block')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        get_pk_field = 'room'  # Primary partition key
+        unique_together = ('space', 'term')
+
+    def __str__(self):
+        return f"{self.term} ({self.action})"
+
 
-    @classmethod
-    def get_messages_for_room(cls, room_id, limit=50, before_time=None):
-        """Optimized query method for retrieving messages"""
-        query = cls.objects.filter(room=str(room_id))
+# The cqlengine models live in chat.scylla_models so that importing chat.models (Django app
+# loading, the in-memory/SQLite message stores) does not load the Cassandra driver.
+SCYLLA_MODELS = ('MessageScylla', 'RoomCounterScylla', 'MessageReactionScylla')
 
-        if before_time:
-            query = query.filter(created_at__lt=before_time)
 
-        return query.limit(limit).all()
\ No newline at end of file
+def __getattr__(name):
+    if name in SCYLLA_MODELS:
+        from . import scylla_models
+        return getattr(scylla_models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
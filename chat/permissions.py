@@ -1,9 +1,43 @@
 # chat/permissions.py
+from typing import Iterable, Set
 from rest_framework import permissions
 from .models import ChatRoom, ChatRoomMembership
 from space.models import SpaceMembership
 
 
+def room_member_ids(chat_room, user_ids: Iterable) -> Set[str]:
+    """
+    Which of user_ids may use a chat room: members of its space, of its team, or of the room itself.
+    IsChatRoomMember and @mentions both go through this rule.
+    """
+    from teams.models import Member
+    user_ids = list(user_ids)
+    admitted = SpaceMembership.objects.filter(space_id=chat_room.space_id, user_id__in=user_ids).values_list('user_id')
+    admitted = admitted.union(
+        ChatRoomMembership.objects.filter(chat_room=chat_room, user_id__in=user_ids).values_list('user_id'))
+    if chat_room.team_id:
+        admitted = admitted.union(Member.objects.filter(team_id=chat_room.team_id, user_id__in=user_ids).values_list('user_id'))
+    return {str(user_id) for user_id, in admitted}
+
+
+def space_room_members(space_id, user_ids: Iterable = None):
+    """
+    (user_id, username) of everyone room_member_ids could admit to some room of a space: its members,
+    members of its teams and direct members of its rooms
+    """
+    from teams.models import Member
+    sources = [
+        SpaceMembership.objects.filter(space_id=space_id),
+        Member.objects.filter(team__space_id=space_id),
+        ChatRoomMembership.objects.filter(chat_room__space_id=space_id),
+    ]
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        sources = [source.filter(user_id__in=user_ids) for source in sources]
+    first, *rest = [source.values_list('user_id', 'user__username') for source in sources]
+    return first.union(*rest)
+
+
 class HasSpaceAccess(permissions.BasePermission):
     """
     Permission to check if user has access to the space
@@ -42,15 +76,5 @@ class IsChatRoomMember(permissions.BasePermission):
         except ChatRoom.DoesNotExist:
             return False
 
-        # Check if user is a member of the space
-        if SpaceMembership.objects.filter(user=request.user, space=chat_room.space).exists():
-            return True
-
-        # If team-specific chat, check team membership
-        if chat_room.team:
-            from teams.models import Member
-            if Member.objects.filter(user=request.user, team=chat_room.team).exists():
-                return True
-
-        # Check direct chat room membership
-        return ChatRoomMembership.objects.filter(chat_room=chat_room, user=request.user).exists()
\ No newline at end of file
+        # Space, team or direct room membership, in one query
+        return bool(room_member_ids(chat_room, [request.user.pk]))
\ No newline at end of file
@@ -0,0 +1,147 @@
+# chat/scylla.py - ScyllaDB connection registration and versioned schema migrations for the chat models
+import logging
+import os
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = 'chat_schema_migrations'
+
+
+def connection_options():
+    db = settings.DATABASES.get('scylla', {})
+    return {
+        'hosts': [host.strip() for host in str(db.get('HOST', '127.0.0.1')).split(',')],
+        'keyspace': db.get('NAME', 'galileo'),
+        'port': int(os.getenv('SCYLLA_PORT', db.get('PORT', 9042))),  # Ensure integer
+        'protocol_version': 4,
+    }
+
+
+# Per-operation driver settings, overridable per key through settings.SCYLLA_EXECUTION_PROFILES.
+# Speculative executions only fire for statements marked idempotent.
+DEFAULT_EXECUTION_PROFILES = {
+    # cqlengine models and ad-hoc queries
+    'default': {'consistency': 'LOCAL_QUORUM', 'request_timeout': 10},
+    # History pages and per-message lookups on the request path: fast, with a hedged second request
+    'history_read': {'consistency': 'LOCAL_ONE', 'request_timeout': 2,
+                     'speculative_delay_ms': 50, 'speculative_attempts': 2},
+    # Durable state read back to be modified and written again (reaction state, counter totals): it must
+    # see the latest LOCAL_QUORUM write, which a single stale replica would not
+    'state_read': {'consistency': 'LOCAL_QUORUM', 'request_timeout': 5},
+    'message_write': {'consistency': 'LOCAL_QUORUM', 'request_timeout': 5},
+    # Counter increments are not idempotent and are never retried speculatively
+    'counter_update': {'consistency': 'LOCAL_QUORUM', 'request_timeout': 5},
+}
+
+
+def execution_profiles():
+    """Driver ExecutionProfiles keyed by name; every profile routes token-aware within the local DC"""
+    from cassandra import ConsistencyLevel
+    from cassandra.cluster import ExecutionProfile, EXEC_PROFILE_DEFAULT
+    from cassandra.policies import ConstantSpeculativeExecutionPolicy, DCAwareRoundRobinPolicy, TokenAwarePolicy
+    from cassandra.query import dict_factory, named_tuple_factory
+
+    local_dc = getattr(settings, 'SCYLLA_LOCAL_DC', None)
+    configured = {**DEFAULT_EXECUTION_PROFILES, **getattr(settings, 'SCYLLA_EXECUTION_PROFILES', {})}
+    profiles = {}
+    for name, options in configured.items():
+        speculative = None
+        if options.get('speculative_delay_ms'):
+            speculative = ConstantSpeculativeExecutionPolicy(options['speculative_delay_ms'] / 1000,
+                                                             options.get('speculative_attempts', 2))
+        profiles[EXEC_PROFILE_DEFAULT if name == 'default' else name] = ExecutionProfile(
+            load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=local_dc)),
+            consistency_level=ConsistencyLevel.name_to_value[options.get('consistency', 'LOCAL_QUORUM')],
+            request_timeout=options.get('request_timeout', 10),
+            speculative_execution_policy=speculative,
+            # cqlengine expects dict rows on the default profile; raw statements use attribute access
+            row_factory=dict_factory if name == 'default' else named_tuple_factory,
+        )
+    return profiles
+
+
+def setup_connection(lazy: bool = True) -> None:
+    """
+    Register the default cqlengine connection. With lazy=True no socket is opened until the first
+    query, so importing Django in a web worker or management command costs nothing here; a failed
+    connect is retried on the next query.
+    """
+    from cassandra.cqlengine import connection
+    options = connection_options()
+    logger.debug(f"Registering ScyllaDB connection: {options} lazy={lazy}")
+    connection.setup(options['hosts'], default_keyspace=options['keyspace'],
+                     protocol_version=options['protocol_version'], port=options['port'],
+                     lazy_connect=lazy, retry_connect=True, execution_profiles=execution_profiles())
+
+
+def replication_options():
+    """DATABASES['scylla']['OPTIONS']['replication'] as (strategy class, remaining options)"""
+    replication = dict(settings.DATABASES.get('scylla', {}).get('OPTIONS', {}).get('replication', {}))
+    return replication.pop('strategy_class', 'SimpleStrategy'), replication
+
+
+def _create_keyspace(session):
+    from cassandra.cqlengine.management import create_keyspace_network_topology, create_keyspace_simple
+    keyspace = connection_options()['keyspace']
+    strategy, replication = replication_options()
+    if strategy == 'NetworkTopologyStrategy':
+        create_keyspace_network_topology(keyspace, {dc: int(factor) for dc, factor in replication.items()})
+    else:
+        create_keyspace_simple(keyspace, replication_factor=int(replication.get('replication_factor', 1)))
+
+
+def _sync(model_name):
+    def apply(session):
+        from cassandra.cqlengine.management import sync_table
+        from . import models
+        sync_table(getattr(models, model_name))
+    return apply
+
+
+# Append only; a deployed version is never edited. Each step must be safe to re-run.
+MIGRATIONS = [
+    (1, 'create keyspace', _create_keyspace),
+    (2, 'messages table', _sync('MessageScylla')),
+    (3, 'room counters table', _sync('RoomCounterScylla')),
+    (4, 'message reactions table', _sync('MessageReactionScylla')),
+    (5, 'message reactions reactors column', _sync('MessageReactionScylla')),
+]
+
+
+def _ensure_migrations_table(session, keyspace):
+    session.execute(
+        f'CREATE TABLE IF NOT EXISTS {keyspace}.{MIGRATIONS_TABLE} '
+        f'(app text, version int, name text, applied_at timestamp, PRIMARY KEY (app, version))'
+    )
+
+
+def applied_versions(session) -> set:
+    keyspace = connection_options()['keyspace']
+    _ensure_migrations_table(session, keyspace)
+    rows = session.execute(f"SELECT version FROM {keyspace}.{MIGRATIONS_TABLE} WHERE app = 'chat'")
+    return {row['version'] for row in rows}
+
+
+def migrate(target: int = None, stdout=None) -> list:
+    """Apply pending schema migrations in order up to target, returns the versions applied"""
+    from cassandra.cqlengine import connection
+    keyspace = connection_options()['keyspace']
+    session = connection.get_session()
+    # The keyspace has to exist before the migrations table can be created in it
+    _create_keyspace(session)
+    done = applied_versions(session)
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        if stdout:
+            stdout.write(f"Applying chat {version:04d} {name}...")
+        apply(session)
+        session.execute(
+            f'INSERT INTO {keyspace}.{MIGRATIONS_TABLE} (app, version, name, applied_at) VALUES (%s, %s, %s, %s)',
+            ('chat', version, name, timezone.now())
+        )
+        applied.append(version)
+    return applied
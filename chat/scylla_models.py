@@ -0,0 +1,52 @@
+# chat/scylla_models.py - cqlengine models for the ScyllaDB side of chat (see chat.models.SCYLLA_MODELS)
+import uuid
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+
+
+# ScyllaDB model for storing messages
+class MessageScylla(Model):
+    __keyspace__ = 'galileo'
+
+    # Optimized primary key structure for better query performance
+    room = columns.Text(partition_key=True)  # Partition key - distributes data
+    created_at = columns.DateTime(primary_key=True, clustering_order="DESC")  # Clustering key for time ordering
+    id = columns.UUID(primary_key=True, default=uuid.uuid4)  # Secondary clustering key for uniqueness
+
+    # Data fields
+    user = columns.Text()  # User ID as string
+    content = columns.Text()  # Message content
+    media = columns.List(columns.Text, default=list)  # Media attachments
+    edited_at = columns.DateTime()  # Track message edits
+    reply_to = columns.UUID()  # For threaded conversations
+
+    class Meta:
+        get_pk_field = 'room'  # Primary partition key
+
+    @classmethod
+    def get_messages_for_room(cls, room_id, limit=50, before_time=None):
+        """Optimized query method for retrieving messages"""
+        query = cls.objects.filter(room=str(room_id))
+
+        if before_time:
+            query = query.filter(created_at__lt=before_time)
+
+        return query.limit(limit).all()
+
+
+# ScyllaDB counter table for durable per-room statistics
+class RoomCounterScylla(Model):
+    __keyspace__ = 'galileo'
+
+    room = columns.Text(partition_key=True)
+    message_count = columns.Counter()  # Flushed from Redis by flush_room_counters
+
+
+# ScyllaDB table for aggregated message reactions, flushed from Redis by flush_reactions
+class MessageReactionScylla(Model):
+    __keyspace__ = 'galileo'
+
+    room = columns.Text(partition_key=True)
+    message_id = columns.UUID(primary_key=True)
+    counts = columns.Map(columns.Text, columns.Integer)  # emoji -> count
+    reactors = columns.Set(columns.Text)  # "{user_id}:{emoji}", so a re-seeded message keeps its dedupe
@@ -0,0 +1,131 @@
+# chat/services/circuit_breaker.py - Circuit breakers that fast-fail calls to Redis and Scylla while they are down
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from typing import Dict
+from .. import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While open every call fails immediately;
+    after reset_timeout one probe call is let through (half-open) and its result closes or reopens
+    the breaker. Only exceptions in failure_exceptions count as failures; anything else means the
+    dependency answered.
+    """
+
+    def __init__(self, name: str, failure_exceptions=(Exception,), failure_threshold: int = 5,
+                 reset_timeout: float = 10.0):
+        self.name = name
+        self.failure_exceptions = failure_exceptions
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls would be rejected (open and not yet due for a probe)"""
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                    metrics.incr(f"breaker.{self.name}.opened")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        with self.guard():
+            return fn(*args, **kwargs)
+
+    @contextmanager
+    def guard(self):
+        if not self.allow():
+            metrics.incr(f"breaker.{self.name}.rejected")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            yield
+        except self.failure_exceptions:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        except BaseException:
+            with self._lock:
+                self.probing = False
+            raise
+        else:
+            self.record_success()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            state = self.state
+            if state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                state = HALF_OPEN  # The next call is the probe
+            return {'state': state, 'failures': self.failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str, failure_exceptions=(Exception,)) -> CircuitBreaker:
+    """Process-wide breaker for a dependency; thresholds come from settings.CHAT_CIRCUIT_BREAKER"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                options = getattr(settings, 'CHAT_CIRCUIT_BREAKER', {})
+                breaker = _breakers[name] = CircuitBreaker(
+                    name,
+                    failure_exceptions=failure_exceptions,
+                    failure_threshold=options.get('failure_threshold', 5),
+                    reset_timeout=options.get('reset_timeout', 10.0),
+                )
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict]:
+    return {name: breaker.snapshot() for name, breaker in list(_breakers.items())}
@@ -0,0 +1,108 @@
+# chat/services/export_service.py - Streaming export of a room's message history
+import json
+import logging
+import zlib
+from typing import AsyncIterator, Dict, Iterable, Iterator, Tuple
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from outh.models import User
+from .message_store import get_message_store
+
+logger = logging.getLogger(__name__)
+
+USER_INFO_TTL = 3600  # 1 hour, same as MessageView._get_user_info
+
+
+def get_users_info(user_ids: Iterable[str]) -> Dict[str, Dict]:
+    """Resolve user info for a batch of user ids with one cache round trip and one query"""
+    user_ids = {str(user_id) for user_id in user_ids if user_id}
+    if not user_ids:
+        return {}
+
+    cache_keys = {f"user:{user_id}:info": user_id for user_id in user_ids}
+    cached = cache.get_many(list(cache_keys))
+    users_info = {cache_keys[key]: info for key, info in cached.items()}
+
+    missing = user_ids - set(users_info)
+    if missing:
+        to_cache = {}
+        for user in User.objects.filter(user_id__in=missing).only('user_id', 'email', 'first_name', 'last_name'):
+            info = {
+                'user_id': str(user.user_id),
+                'email': getattr(user, 'email', 'Unknown'),
+                'display_name': f"{getattr(user, 'first_name', '') or ''} {getattr(user, 'last_name', '') or ''}".strip() or getattr(
+                    user, 'email', 'Unknown')
+            }
+            users_info[info['user_id']] = info
+            to_cache[f"user:{info['user_id']}:info"] = info
+        if to_cache:
+            cache.set_many(to_cache, timeout=USER_INFO_TTL)
+
+        for user_id in missing - set(users_info):
+            users_info[user_id] = {
+                'user_id': user_id,
+                'email': 'Unknown User',
+                'display_name': 'Unknown User'
+            }
+
+    return users_info
+
+
+def _export_pages(room_id: str, page_size: int) -> Iterator[Tuple[int, bytes]]:
+    """(messages, NDJSON) for each page of a room, newest first"""
+    for rows in get_message_store().iter_room_pages(room_id, page_size=page_size):
+        users_info = get_users_info(row.user for row in rows)
+        lines = []
+        for row in rows:
+            lines.append(json.dumps({
+                'id': str(row.id),
+                'room': str(room_id),
+                'content': row.content,
+                'user': row.user,
+                'user_info': users_info.get(row.user),
+                'created_at': row.created_at.isoformat(),
+                'edited_at': row.edited_at.isoformat() if row.edited_at else None,
+                'reply_to': str(row.reply_to) if row.reply_to else None,
+                'media': row.media or []
+            }))
+        lines.append('')
+        yield len(rows), '\n'.join(lines).encode('utf-8')
+
+
+def _compress_next_page(pages, compressor):
+    """(messages, gzip bytes) for the next page, or None after the last one"""
+    page = next(pages, None)
+    if page is None:
+        return None
+    count, data = page
+    return count, compressor.compress(data)
+
+
+async def stream_room_export(room_id: str, page_size: int = 1000, compresslevel: int = 6) -> AsyncIterator[bytes]:
+    """
+    Yield a gzip-compressed NDJSON export of a room, holding at most one page in memory. Pages are
+    read and compressed in a worker thread; being async, the ASGI handler sends each chunk as it is
+    produced instead of collecting a sync iterator into a list first. If the export fails part way,
+    the error is raised without writing the gzip trailer, so the client sees an aborted transfer
+    rather than a well-formed but truncated file.
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    pages = _export_pages(room_id, page_size)
+    next_page = sync_to_async(_compress_next_page)
+    exported = 0
+
+    try:
+        while True:
+            page = await next_page(pages, compressor)
+            if page is None:
+                break
+            count, chunk = page
+            exported += count
+            if chunk:
+                yield chunk
+    except Exception as e:
+        logger.error(f"Error exporting room {room_id} after {exported} messages: {str(e)}")
+        raise
+
+    yield compressor.flush()
+    logger.info(f"Exported {exported} messages from room {room_id}")
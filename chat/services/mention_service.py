@@ -0,0 +1,160 @@
+# chat/services/mention_service.py - @mention extraction against a per-space trie of member usernames
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from django.conf import settings
+from .redis_service import redis_chat_service
+from ..fanout import notify_user_sync
+
+logger = logging.getLogger(__name__)
+
+# How often a process checks Redis for member changes of a space it has a trie for
+MEMBER_SYNC_SECONDS = getattr(settings, 'CHAT_MENTION_SYNC_SECONDS', 1.0)
+MENTION_PREVIEW_LENGTH = 140
+
+_END = ''  # Key of the terminal entry in a trie node; never a username character
+
+
+def _is_name_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class MentionTrie:
+    """
+    Usernames of one space as a character trie. find() walks the content once, descending from
+    each '@' for at most the longest username, so extraction is linear in the content length
+    however many members the space has.
+    """
+    __slots__ = ('root', 'usernames', 'version', 'checked_at')
+
+    def __init__(self, version: Optional[int] = None):
+        self.root = {}
+        self.usernames = {}  # user id -> username, so removals only need the id
+        self.version = version
+        self.checked_at = 0.0
+
+    def add(self, username: str, user_id: str) -> None:
+        if self.usernames.get(user_id, username) != username:
+            self.remove(user_id)
+        node = self.root
+        for char in username:
+            node = node.setdefault(char, {})
+        node[_END] = user_id
+        self.usernames[user_id] = username
+
+    def remove(self, user_id: str) -> None:
+        username = self.usernames.pop(user_id, None)
+        if username is None:
+            return
+        path = [self.root]
+        for char in username:
+            path.append(path[-1][char])
+        if path[-1].get(_END) == user_id:
+            del path[-1][_END]
+        # Prune branches that no longer lead to a username
+        for depth in range(len(username), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][username[depth - 1]]
+
+    def find(self, content: str) -> List[str]:
+        """User ids mentioned as @username, in order of first mention; the longest username wins"""
+        found = {}
+        length = len(content)
+        position = content.find('@')
+        while position != -1:
+            if position == 0 or not _is_name_char(content[position - 1]):
+                node, match, index = self.root, None, position + 1
+                while index < length:
+                    node = node.get(content[index])
+                    if node is None:
+                        break
+                    index += 1
+                    if _END in node and (index == length or not _is_name_char(content[index])):
+                        match = node[_END]
+                if match is not None:
+                    found.setdefault(match, None)
+            position = content.find('@', position + 1)
+        return list(found)
+
+
+_tries: Dict[str, MentionTrie] = {}
+_tries_lock = threading.Lock()
+
+
+def _build_trie(space_id: str, version: Optional[int]) -> MentionTrie:
+    from ..permissions import space_room_members
+    trie = MentionTrie(version)
+    for user_id, username in space_room_members(space_id):
+        trie.add(username, str(user_id))
+    return trie
+
+
+def get_space_trie(space_id) -> MentionTrie:
+    """
+    The process's trie for a space. It is loaded from the database once, then kept current by
+    replaying the space's member change log; a username change is picked up on the next reload.
+    """
+    space_id = str(space_id)
+    trie = _tries.get(space_id)
+    now = time.monotonic()
+    if trie is not None and now - trie.checked_at < MEMBER_SYNC_SECONDS:
+        return trie
+
+    with _tries_lock:
+        trie = _tries.get(space_id)
+        if trie is not None and now - trie.checked_at < MEMBER_SYNC_SECONDS:
+            return trie
+        version, changes = redis_chat_service.get_member_changes(space_id, trie.version if trie else None)
+        if trie is None or changes is None:
+            # The version is read first, so changes racing the load are replayed again (harmlessly) later
+            trie = _build_trie(space_id, version)
+            _tries[space_id] = trie
+        else:
+            for op, user_id, username in changes:
+                if op == 'add':
+                    trie.add(username, user_id)
+                else:
+                    trie.remove(user_id)
+            trie.version = version
+        trie.checked_at = now
+        return trie
+
+
+def record_member_change(space_id, op: str, user_id, username: str = None) -> None:
+    """Publish a space, team or room membership change to every process's trie ('add' or 'remove')"""
+    redis_chat_service.record_member_change(str(space_id), op, str(user_id), username)
+
+
+def find_mentions(space_id, content: str, room_member_ids: Iterable[str] = None) -> List[str]:
+    """User ids mentioned in content, limited to room_member_ids when given"""
+    if not content or '@' not in content:
+        return []
+    user_ids = get_space_trie(space_id).find(content)
+    if room_member_ids is not None:
+        allowed = set(room_member_ids)
+        user_ids = [user_id for user_id in user_ids if user_id in allowed]
+    return user_ids
+
+
+def deliver_mentions(space_id, message_data: Dict, user_ids: List[str]) -> None:
+    """Add the message to each mentioned user's feed and notify their open sockets"""
+    user_ids = [user_id for user_id in user_ids if user_id != message_data['user']]
+    if not user_ids:
+        return
+    mention = {
+        'room_id': message_data['room'],
+        'message_id': message_data['id'],
+        'user': message_data['user'],
+        'content': (message_data.get('content') or '')[:MENTION_PREVIEW_LENGTH],
+        'created_at': message_data['created_at'],
+    }
+    score = datetime.fromisoformat(message_data['created_at']).timestamp()
+    redis_chat_service.record_mentions(str(space_id), user_ids, mention, score)
+    for user_id in user_ids:
+        try:
+            notify_user_sync(user_id, dict(mention, type='mention', space_id=str(space_id)))
+        except Exception as e:
+            logger.error(f"Error notifying mention of user {user_id}: {str(e)}")
@@ -0,0 +1,142 @@
+# chat/services/message_service.py - Creating a chat message, shared by the HTTP view and the WebSocket consumer
+import logging
+import uuid
+from typing import Dict, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .redis_service import redis_chat_service
+from .message_store import get_message_store
+from .export_service import get_users_info
+from .mention_service import deliver_mentions, find_mentions
+from .moderation_service import flag_for_review, moderate_content
+from ..fanout import group_send_room_sync, room_message_rate
+from ..models import ChatRoomMembership
+from ..permissions import room_member_ids
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 2000
+# In rooms sending at least CHAT_HOT_ROOM_MESSAGES_PER_SECOND, the cached first page of history is
+# kept for CHAT_HOT_ROOM_CACHE_SECONDS instead of being dropped on every message, which would
+# send every history load in a busy room to the message store
+HOT_ROOM_MESSAGES_PER_SECOND = getattr(settings, 'CHAT_HOT_ROOM_MESSAGES_PER_SECOND', 5)
+HOT_ROOM_CACHE_SECONDS = getattr(settings, 'CHAT_HOT_ROOM_CACHE_SECONDS', 2)
+
+
+class MessageRejected(Exception):
+    """The message failed validation; the text is the client-facing reason"""
+
+
+def create_message(chat_room, user_id, data: Dict) -> Tuple[Dict, bool]:
+    """
+    Validate, store and publish a message. Returns (message_data, queued), queued being True when
+    it went to the write-behind stream. Raises MessageRejected on invalid input and
+    MessageStoreUnavailable when it cannot be stored.
+    """
+    content = (data.get('content') or '').strip()
+    if not content and not data.get('media'):
+        raise MessageRejected("Message must have content or media")
+
+    if len(content) > MAX_MESSAGE_LENGTH:
+        raise MessageRejected(f"Message too long (max {MAX_MESSAGE_LENGTH} characters)")
+
+    moderation = moderate_content(chat_room.space_id, content)
+    if moderation.blocked:
+        raise MessageRejected("Message contains blocked terms")
+    content = moderation.text
+
+    reply_to = data.get('reply_to')
+    if reply_to:
+        try:
+            reply_to = uuid.UUID(str(reply_to))
+        except ValueError:
+            raise MessageRejected("Invalid reply_to UUID")
+
+    user_id = str(user_id)
+    msg_id = uuid.uuid4()
+    message_data = {
+        'id': str(msg_id),
+        'room': str(chat_room.id),
+        'user': user_id,
+        'user_info': get_users_info([user_id])[user_id],
+        'content': content,
+        'created_at': timezone.now().isoformat(),
+        'reply_to': str(reply_to) if reply_to else None,
+        'media': data.get('media') or []
+    }
+    message_data['mentions'] = _find_mentions(chat_room, content)
+
+    # Write-behind mode: append to the room stream and let persist_messages write to Scylla
+    queued = False
+    if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+        queued = bool(redis_chat_service.enqueue_message(str(chat_room.id), message_data))
+        if not queued:
+            logger.warning(f"Stream unavailable, writing message {msg_id} synchronously")
+    if not queued:
+        get_message_store().write_message(message_data)
+
+    _update_caches(chat_room, message_data)
+    _broadcast_message(str(chat_room.id), message_data)
+    _deliver_mentions(chat_room, message_data)
+    if moderation.flagged:
+        flag_for_review(chat_room.space_id, 'message', message_data['id'], user_id, moderation)
+
+    logger.info(f"Message {'queued' if queued else 'created'}: {msg_id} in room {chat_room.id}")
+    return message_data, queued
+
+
+def _update_caches(chat_room, message_data):
+    """Update various caches after message creation"""
+    chat_room_id = str(chat_room.id)
+
+    # Update Redis real-time features
+    redis_chat_service.cache_message(chat_room_id, message_data)
+    redis_chat_service.increment_message_count(chat_room_id)
+    redis_chat_service.record_throughput(chat_room_id, message_data['user'])
+
+    member_ids = {str(user_id) for user_id in ChatRoomMembership.objects.filter(
+        chat_room=chat_room).values_list('user_id', flat=True)}
+    member_ids.add(message_data['user'])
+    redis_chat_service.record_room_activity(chat_room_id, message_data, member_ids)
+
+    # Invalidate recent messages cache, or let it run out shortly in a busy room
+    if is_hot_room(chat_room_id):
+        cache.touch(f"room:{chat_room_id}:messages:recent", HOT_ROOM_CACHE_SECONDS)
+    else:
+        cache.delete(f"room:{chat_room_id}:messages:recent")
+
+
+def is_hot_room(room_id) -> bool:
+    return room_message_rate(room_id) >= HOT_ROOM_MESSAGES_PER_SECOND
+
+
+def _find_mentions(chat_room, content):
+    """Ids of users mentioned as @username who may use the room"""
+    try:
+        candidates = find_mentions(chat_room.space_id, content)
+        if not candidates:
+            return []
+        members = room_member_ids(chat_room, candidates)
+        return [user_id for user_id in candidates if user_id in members]
+    except Exception as e:
+        logger.error(f"Error finding mentions: {str(e)}")
+        return []
+
+
+def _deliver_mentions(chat_room, message_data):
+    try:
+        deliver_mentions(chat_room.space_id, message_data, message_data['mentions'])
+    except Exception as e:
+        logger.error(f"Error delivering mentions: {str(e)}")
+
+
+def _broadcast_message(chat_room_id, message_data):
+    """Push the new message to connected WebSocket clients"""
+    try:
+        group_send_room_sync(
+            chat_room_id,
+            {'type': 'new_message', 'message': message_data}
+        )
+    except Exception as e:
+        logger.error(f"Error broadcasting message: {str(e)}")
@@ -0,0 +1,263 @@
+# chat/services/message_store.py - Message history storage backends (ScyllaDB, SQLite, in-process)
+import bisect
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from collections import defaultdict, namedtuple
+from datetime import datetime, timezone
+from django.conf import settings
+from typing import Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Same fields and attribute names as a MessageScylla row
+MessageRow = namedtuple('MessageRow', ['id', 'room', 'user', 'content', 'media', 'created_at', 'edited_at', 'reply_to'])
+
+
+class MessageStoreUnavailable(Exception):
+    """The backing store cannot serve requests right now; retry_after is a hint in seconds"""
+
+    def __init__(self, message, retry_after: int = 10):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _to_stored_time(value) -> Optional[datetime]:
+    """Timestamps are kept like Scylla returns them: naive UTC, millisecond precision"""
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _to_uuid(value) -> Optional[uuid.UUID]:
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    return uuid.UUID(value)
+
+
+def to_message_row(message: Dict) -> MessageRow:
+    """Normalise a message payload (as returned by MessageView.post) to a stored row"""
+    return MessageRow(
+        id=_to_uuid(message['id']),
+        room=str(message['room']),
+        user=str(message['user']),
+        content=message.get('content', ''),
+        media=list(message.get('media') or []),
+        created_at=_to_stored_time(message['created_at']),
+        edited_at=_to_stored_time(message.get('edited_at')),
+        reply_to=_to_uuid(message.get('reply_to')),
+    )
+
+
+class MessageStore:
+    """
+    Room message history. Every backend has the same semantics:
+    - rows are keyed by (room, created_at, id); writing the same key again overwrites the row
+    - pages are newest first; rows sharing a created_at come back in a stable order
+    - before_time is an exclusive cursor on created_at
+    - iter_room_pages walks a whole room, newest first, one page in memory at a time
+    """
+    name = None
+
+    def write_messages(self, messages: Iterable[Dict]) -> int:
+        """Write message payloads, returns rows written"""
+        raise NotImplementedError
+
+    def write_message(self, message: Dict) -> None:
+        self.write_messages([message])
+
+    def get_room_messages(self, room_id: str, limit: int = 50, before_time: datetime = None) -> List[MessageRow]:
+        raise NotImplementedError
+
+    def get_rows_at(self, room_id: str, created_at: datetime) -> List[MessageRow]:
+        """Every row of a room with exactly this created_at, in page order"""
+        raise NotImplementedError
+
+    def iter_room_pages(self, room_id: str, page_size: int = 1000) -> Iterator[List[MessageRow]]:
+        before_time = None
+        while True:
+            rows = self.get_room_messages(room_id, limit=page_size, before_time=before_time)
+            if len(rows) < page_size:
+                if rows:
+                    yield rows
+                return
+            # The cursor is exclusive, so rows sharing the oldest timestamp go out together in this page
+            oldest = rows[-1].created_at
+            yield [row for row in rows if row.created_at != oldest] + self.get_rows_at(room_id, oldest)
+            before_time = oldest
+
+
+class ScyllaMessageStore(MessageStore):
+    """The production store: prepared statements through chat.services.scylla_writer"""
+    name = 'scylla'
+
+    def _call(self, fn, *args, **kwargs):
+        from .circuit_breaker import CircuitOpenError
+        from .scylla_writer import scylla_breaker
+        try:
+            return fn(*args, **kwargs)
+        except scylla_breaker.failure_exceptions + (CircuitOpenError,) as e:
+            raise MessageStoreUnavailable(str(e), retry_after=int(scylla_breaker.reset_timeout)) from e
+
+    def write_messages(self, messages: Iterable[Dict]) -> int:
+        from .scylla_writer import write_messages_batched
+        return self._call(write_messages_batched, messages)
+
+    def write_message(self, message: Dict) -> None:
+        from .scylla_writer import write_message
+        self._call(write_message, message)
+
+    def get_room_messages(self, room_id: str, limit: int = 50, before_time: datetime = None) -> List[MessageRow]:
+        from .scylla_writer import get_room_messages
+        return [MessageRow(**row._asdict()) for row in self._call(get_room_messages, room_id, limit, before_time)]
+
+    def get_rows_at(self, room_id: str, created_at: datetime) -> List[MessageRow]:
+        from .scylla_writer import get_rows_at
+        return [MessageRow(**row._asdict()) for row in self._call(get_rows_at, room_id, created_at)]
+
+    def iter_room_pages(self, room_id: str, page_size: int = 1000) -> Iterator[List[MessageRow]]:
+        # Driver paging already continues exactly where the previous page ended
+        from .scylla_writer import iter_room_pages
+        pages = iter_room_pages(room_id, page_size)
+        while True:
+            rows = self._call(next, pages, None)  # Each page is a driver round trip that can fail
+            if rows is None:
+                return
+            yield [MessageRow(**row._asdict()) for row in rows]
+
+
+class InMemoryMessageStore(MessageStore):
+    """Process-local store for benchmarks and local development; nothing survives a restart"""
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = defaultdict(list)  # room -> sorted [(-created_at ms, id)], i.e. newest first
+        self._rows = defaultdict(dict)
+
+    @staticmethod
+    def _key(created_at: datetime, message_id) -> tuple:
+        return -round(created_at.replace(tzinfo=timezone.utc).timestamp() * 1000), str(message_id)
+
+    def write_messages(self, messages: Iterable[Dict]) -> int:
+        written = 0
+        with self._lock:
+            for message in messages:
+                row = to_message_row(message)
+                key = self._key(row.created_at, row.id)
+                if key not in self._rows[row.room]:
+                    bisect.insort(self._keys[row.room], key)
+                self._rows[row.room][key] = row
+                written += 1
+        return written
+
+    def _select(self, room_id: str, start_ms: int = None, end_ms: int = None, limit: int = None) -> List[MessageRow]:
+        """Rows whose sort position -created_at lies in [start_ms, end_ms)"""
+        room_id = str(room_id)
+        with self._lock:
+            keys = self._keys.get(room_id, [])
+            start = 0 if start_ms is None else bisect.bisect_left(keys, (start_ms,))
+            end = len(keys) if end_ms is None else bisect.bisect_left(keys, (end_ms,))
+            if limit is not None:
+                end = min(end, start + limit)
+            return [self._rows[room_id][key] for key in keys[start:end]]
+
+    def get_room_messages(self, room_id: str, limit: int = 50, before_time: datetime = None) -> List[MessageRow]:
+        start_ms = None
+        if before_time is not None:
+            start_ms = self._key(_to_stored_time(before_time), '')[0] + 1
+        return self._select(room_id, start_ms=start_ms, limit=limit)
+
+    def get_rows_at(self, room_id: str, created_at: datetime) -> List[MessageRow]:
+        position = self._key(_to_stored_time(created_at), '')[0]
+        return self._select(room_id, start_ms=position, end_ms=position + 1)
+
+
+class SQLiteMessageStore(MessageStore):
+    """Single-file store (or ':memory:') for hermetic benchmarks and CI"""
+    name = 'sqlite'
+
+    def __init__(self, path: str = ':memory:'):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS chat_messages ('
+            'room TEXT NOT NULL, created_at INTEGER NOT NULL, id TEXT NOT NULL, user TEXT, content TEXT, '
+            'media TEXT, edited_at INTEGER, reply_to TEXT, PRIMARY KEY (room, created_at, id))'
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _ms(value: Optional[datetime]) -> Optional[int]:
+        return None if value is None else round(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+    @staticmethod
+    def _time(ms: Optional[int]) -> Optional[datetime]:
+        return None if ms is None else datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+    def _row(self, values) -> MessageRow:
+        room, created_at, message_id, user, content, media, edited_at, reply_to = values
+        return MessageRow(
+            id=uuid.UUID(message_id), room=room, user=user, content=content, media=json.loads(media or '[]'),
+            created_at=self._time(created_at), edited_at=self._time(edited_at),
+            reply_to=uuid.UUID(reply_to) if reply_to else None,
+        )
+
+    def write_messages(self, messages: Iterable[Dict]) -> int:
+        params = []
+        for message in messages:
+            row = to_message_row(message)
+            params.append((row.room, self._ms(row.created_at), str(row.id), row.user, row.content,
+                           json.dumps(row.media), self._ms(row.edited_at), str(row.reply_to) if row.reply_to else None))
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO chat_messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)', params)
+            self._db.commit()
+        return len(params)
+
+    def _select(self, where: str, params: list, limit: int = None) -> List[MessageRow]:
+        query = f'SELECT * FROM chat_messages WHERE {where} ORDER BY created_at DESC, id'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params = params + [limit]
+        with self._lock:
+            return [self._row(values) for values in self._db.execute(query, params)]
+
+    def get_room_messages(self, room_id: str, limit: int = 50, before_time: datetime = None) -> List[MessageRow]:
+        if before_time is None:
+            return self._select('room = ?', [str(room_id)], limit)
+        return self._select('room = ? AND created_at < ?', [str(room_id), self._ms(_to_stored_time(before_time))], limit)
+
+    def get_rows_at(self, room_id: str, created_at: datetime) -> List[MessageRow]:
+        return self._select('room = ? AND created_at = ?', [str(room_id), self._ms(_to_stored_time(created_at))])
+
+
+_stores: Dict[str, MessageStore] = {}
+_stores_lock = threading.Lock()
+
+
+def create_message_store(name: str) -> MessageStore:
+    if name == 'scylla':
+        return ScyllaMessageStore()
+    if name == 'memory':
+        return InMemoryMessageStore()
+    if name == 'sqlite':
+        return SQLiteMessageStore(getattr(settings, 'CHAT_MESSAGE_STORE_PATH', ':memory:'))
+    raise ValueError(f"Unknown message store '{name}'")
+
+
+def get_message_store(name: str = None) -> MessageStore:
+    """Process-wide store selected by settings.CHAT_MESSAGE_STORE ('scylla', 'sqlite' or 'memory')"""
+    name = name or getattr(settings, 'CHAT_MESSAGE_STORE', 'scylla')
+    store = _stores.get(name)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(name)
+            if store is None:
+                store = _stores[name] = create_message_store(name)
+    return store
@@ -0,0 +1,179 @@
+# chat/services/moderation_service.py - Per-space banned-term filtering with an Aho-Corasick automaton
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from .redis_service import redis_chat_service
+from .. import metrics
+
+logger = logging.getLogger(__name__)
+
+# How often a process checks whether a space's term list changed
+MODERATION_SYNC_SECONDS = getattr(settings, 'CHAT_MODERATION_SYNC_SECONDS', 5.0)
+MASK_CHAR = '*'
+ACTION_PRECEDENCE = {'flag': 0, 'mask': 1, 'block': 2}
+
+# blocked: reject the content; text: content with masked terms replaced; flagged: terms to review
+ModerationResult = namedtuple('ModerationResult', ['blocked', 'text', 'flagged', 'matches'])
+
+
+class ModerationAutomaton:
+    """
+    Aho-Corasick automaton over a term list. scan() reads the text once, following failure links
+    on mismatches, so its cost is linear in the text length (plus matches) however many terms
+    there are. Terms match case-insensitively and only as whole words.
+    """
+    __slots__ = ('goto', 'fail', 'outputs', 'version', 'checked_at')
+
+    def __init__(self, terms: Iterable[Tuple[str, str]], version: Optional[int] = None):
+        goto = [{}]
+        outputs = [()]
+        for term, action in terms:
+            term = term.strip().lower()
+            if not term:
+                continue
+            node = 0
+            for char in term:
+                child = goto[node].get(char)
+                if child is None:
+                    child = goto[node][char] = len(goto)
+                    goto.append({})
+                    outputs.append(())
+                node = child
+            outputs[node] += ((len(term), action),)
+
+        # Breadth first, so a node's failure target is always finished before the node itself
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                target = fail[node]
+                while target and char not in goto[target]:
+                    target = fail[target]
+                fail[child] = goto[target].get(char, 0)
+                outputs[child] += outputs[fail[child]]
+
+        self.goto = goto
+        self.fail = fail
+        self.outputs = outputs
+        self.version = version
+        self.checked_at = 0.0
+
+    def __len__(self):
+        return len(self.goto)
+
+    def scan(self, text: str) -> List[Tuple[int, int, str]]:
+        """(start, end, action) of every whole-word term occurrence"""
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        matches = []
+        node = 0
+        length = len(text)
+        for index, char in enumerate(text):
+            char = char.lower()
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                end = index + 1
+                if end < length and text[end].isalnum():
+                    continue
+                for term_length, action in outputs[node]:
+                    start = end - term_length
+                    if start == 0 or not text[start - 1].isalnum():
+                        matches.append((start, end, action))
+        return matches
+
+    def moderate(self, text: str) -> ModerationResult:
+        matches = self.scan(text) if text else []
+        if not matches:
+            return ModerationResult(False, text, [], [])
+        actions = {}
+        for start, end, action in matches:
+            # Where one span is listed under several actions, the strictest applies
+            if ACTION_PRECEDENCE[action] > ACTION_PRECEDENCE.get(actions.get((start, end)), -1):
+                actions[(start, end)] = action
+        if 'block' in actions.values():
+            return ModerationResult(True, text, [], [text[start:end] for start, end in actions])
+
+        masked = list(text)
+        flagged = []
+        for (start, end), action in actions.items():
+            if action == 'mask':
+                masked[start:end] = MASK_CHAR * (end - start)
+            else:
+                flagged.append(text[start:end])
+        return ModerationResult(False, ''.join(masked), flagged, [text[start:end] for start, end in actions])
+
+
+_automata: Dict[str, ModerationAutomaton] = {}
+_automata_lock = threading.Lock()
+
+
+def _compile(space_id: str, version: Optional[int]) -> ModerationAutomaton:
+    from ..models import ModerationTerm
+    started = time.perf_counter()
+    automaton = ModerationAutomaton(
+        ModerationTerm.objects.filter(space_id=space_id).values_list('term', 'action').iterator(), version)
+    logger.info(f"Compiled moderation terms for space {space_id}: {len(automaton)} states in "
+                f"{(time.perf_counter() - started) * 1000:.1f}ms")
+    return automaton
+
+
+def get_space_automaton(space_id) -> ModerationAutomaton:
+    """The process's compiled terms for a space, recompiled when the space's version moves"""
+    space_id = str(space_id)
+    automaton = _automata.get(space_id)
+    now = time.monotonic()
+    if automaton is not None and now - automaton.checked_at < MODERATION_SYNC_SECONDS:
+        return automaton
+
+    with _automata_lock:
+        automaton = _automata.get(space_id)
+        if automaton is not None and now - automaton.checked_at < MODERATION_SYNC_SECONDS:
+            return automaton
+        version = redis_chat_service.get_moderation_version(space_id)
+        # While Redis is unreadable the compiled terms stay in use as they are
+        if automaton is None or (version is not None and version != automaton.version):
+            automaton = _compile(space_id, version)
+            _automata[space_id] = automaton
+        automaton.checked_at = now
+        return automaton
+
+
+def invalidate_space_terms(space_id) -> None:
+    """Called when a space's terms change: drop this process's copy and tell the others"""
+    space_id = str(space_id)
+    _automata.pop(space_id, None)
+    redis_chat_service.bump_moderation_version(space_id)
+
+
+def moderate_content(space_id, text: str) -> ModerationResult:
+    """Apply a space's terms to message or post content"""
+    if not text:
+        return ModerationResult(False, text, [], [])
+    try:
+        result = get_space_automaton(space_id).moderate(text)
+    except Exception as e:
+        # Like the rate limiter, filtering fails open rather than taking writes down with it
+        logger.error(f"Error moderating content for space {space_id}: {str(e)}")
+        return ModerationResult(False, text, [], [])
+    if result.blocked:
+        metrics.incr('moderation_blocked')
+    elif result.flagged:
+        metrics.incr('moderation_flagged')
+    return result
+
+
+def flag_for_review(space_id, kind: str, object_id: str, user_id: str, result: ModerationResult) -> None:
+    """Queue accepted content that matched 'flag' terms for moderators"""
+    redis_chat_service.flag_content(str(space_id), {
+        'kind': kind,
+        'id': str(object_id),
+        'user': str(user_id),
+        'terms': result.flagged,
+        'flagged_at': time.time(),
+    })
@@ -0,0 +1,53 @@
+# chat/services/reaction_service.py - Message reactions backed by Redis with Scylla persistence
+import logging
+from typing import Dict, List, Optional
+from .redis_service import redis_chat_service
+from . import scylla_writer
+
+logger = logging.getLogger(__name__)
+
+MAX_EMOJI_LENGTH = 32
+
+
+def is_valid_emoji(emoji) -> bool:
+    """Reactions are short non-blank strings (an emoji or a :shortcode:)"""
+    return isinstance(emoji, str) and 0 < len(emoji.strip()) <= MAX_EMOJI_LENGTH
+
+
+def apply_reaction(room_id: str, message_id: str, user_id: str, emoji: str, add: bool = True) -> Optional[Dict]:
+    """Add or remove a reaction, returns the resulting count for the emoji or None on error"""
+    room_id, message_id, user_id = str(room_id), str(message_id), str(user_id)
+    result = redis_chat_service.react(room_id, message_id, user_id, emoji, add=add)
+    if result is not None and not result['loaded']:
+        # The Redis state expired or never existed; load who already reacted before applying,
+        # otherwise the user could react twice or fail to remove an earlier reaction
+        try:
+            counts, reactors = scylla_writer.get_reaction_state(room_id, message_id)
+        except Exception as e:
+            logger.error(f"Error loading persisted reactions for message {message_id}: {str(e)}")
+            return None
+        if not redis_chat_service.seed_reactions(room_id, message_id, counts, reactors):
+            return None
+        result = redis_chat_service.react(room_id, message_id, user_id, emoji, add=add)
+    if result is None or not result['loaded']:
+        return None
+
+    return {
+        'message_id': message_id,
+        'emoji': emoji,
+        'count': result['count'],
+        'changed': result['changed'],
+    }
+
+
+def get_message_reactions(room_id: str, message_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    """Reaction counts for a page of messages: one Redis pipeline, Scylla only for uncached messages"""
+    counts = redis_chat_service.get_reaction_counts(str(room_id), message_ids)
+    missing = [message_id for message_id in message_ids if message_id not in counts]
+    if missing:
+        try:
+            persisted = scylla_writer.get_reaction_counts(str(room_id), missing)
+            counts.update({message_id: persisted[message_id] for message_id in missing if message_id in persisted})
+        except Exception as e:
+            logger.error(f"Error loading persisted reactions for room {room_id}: {str(e)}")
+    return counts
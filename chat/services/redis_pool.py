@@ -0,0 +1,177 @@
+# chat/services/redis_pool.py - Process-wide Redis connection pools shared by the chat service, cache and rate limiter
+import functools
+import logging
+import threading
+import redis
+from redis.cluster import RedisCluster, ClusterNode
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+from typing import Dict
+from .circuit_breaker import CircuitOpenError, get_breaker
+
+logger = logging.getLogger(__name__)
+
+# Every alias talks to the same server(s), so they share one breaker
+redis_breaker = get_breaker('redis', (redis.ConnectionError, redis.TimeoutError))
+
+# Overridden by settings.REDIS_POOL, then by settings.REDIS_POOL_ALIASES[alias]
+DEFAULT_POOL_OPTIONS = {
+    'max_connections': 50,
+    'timeout': 2,  # Seconds to wait for a free connection once the pool is exhausted
+    'socket_connect_timeout': 1,
+    'socket_timeout': 2,  # Per command; must stay above the persist worker's XREADGROUP block time
+    'socket_keepalive': True,
+    'health_check_interval': 30,
+    'retry_on_timeout': False,  # A timeout counts against the circuit breaker instead of being retried
+}
+
+# 'default' returns str (chat service, rate limiter); 'cache' returns bytes for Django's pickling cache
+DEFAULT_ALIASES = {
+    'default': {'decode_responses': True},
+    'cache': {'decode_responses': False},
+}
+
+_lock = threading.Lock()
+_clients: Dict[str, redis.Redis] = {}
+
+
+def pool_options(alias: str) -> Dict:
+    options = {**DEFAULT_POOL_OPTIONS, **getattr(settings, 'REDIS_POOL', {})}
+    aliases = {**DEFAULT_ALIASES, **getattr(settings, 'REDIS_POOL_ALIASES', {})}
+    options.update(aliases.get(alias, {}))
+    return options
+
+
+class GuardedCommandsMixin:
+    """Routes commands and pipeline executions through the Redis circuit breaker"""
+
+    def execute_command(self, *args, **options):
+        return redis_breaker.call(super().execute_command, *args, **options)
+
+    def pipeline(self, *args, **kwargs):
+        pipe = super().pipeline(*args, **kwargs)
+        pipe.execute = functools.partial(redis_breaker.call, pipe.execute)
+        return pipe
+
+
+class GuardedRedis(GuardedCommandsMixin, redis.Redis):
+    pass
+
+
+class GuardedRedisCluster(GuardedCommandsMixin, RedisCluster):
+    pass
+
+
+def _create_client(alias: str):
+    options = pool_options(alias)
+    if getattr(settings, 'REDIS_CLUSTER', False):
+        # RedisCluster keeps one pool per node; the wait timeout only applies to BlockingConnectionPool
+        options.pop('timeout', None)
+        nodes = [ClusterNode(host, port) for host, port in getattr(settings, 'REDIS_CLUSTER_NODES', [('localhost', 7000)])]
+        return GuardedRedisCluster(startup_nodes=nodes, **options)
+    url = getattr(settings, 'REDIS_URL', 'redis://localhost:6379/0')
+    return GuardedRedis(connection_pool=redis.BlockingConnectionPool.from_url(url, **options))
+
+
+def get_redis_client(alias: str = 'default'):
+    """Client for an alias; every caller in the process shares its connection pool"""
+    client = _clients.get(alias)
+    if client is None:
+        with _lock:
+            client = _clients.get(alias)
+            if client is None:
+                client = _clients[alias] = _create_client(alias)
+    return client
+
+
+def _pools(client):
+    if isinstance(client, redis.Redis):
+        return [client.connection_pool]
+    return [node.redis_connection.connection_pool for node in client.get_nodes() if node.redis_connection]
+
+
+def pool_stats() -> Dict[str, Dict]:
+    """
+    Connection usage per alias, summed over cluster nodes. redis-py has no public API for this, so
+    its private pool attributes are read with defaults: a release that renames them reports zero
+    usage instead of breaking the metrics endpoint.
+    """
+    stats = {}
+    for alias, client in list(_clients.items()):
+        created = in_use = limit = 0
+        for pool in _pools(client):
+            limit += getattr(pool, 'max_connections', 0) or 0
+            if isinstance(pool, redis.BlockingConnectionPool):
+                connections = len(getattr(pool, '_connections', ()))
+                idle = list(getattr(getattr(pool, 'pool', None), 'queue', ()))
+                created += connections
+                in_use += max(connections - sum(1 for connection in idle if connection), 0)
+            else:
+                created += getattr(pool, '_created_connections', 0)
+                in_use += len(getattr(pool, '_in_use_connections', ()))
+        stats[alias] = {
+            'max_connections': limit,
+            'created': created,
+            'in_use': in_use,
+            'utilisation': round(in_use / limit, 3) if limit else 0,
+        }
+    return stats
+
+
+class SharedRedisCacheClient(RedisCacheClient):
+    def get_client(self, key=None, *, write=False):
+        return get_redis_client('cache')
+
+
+class SharedRedisCache(RedisCache):
+    """
+    Django's Redis cache backend on the shared 'cache' pool instead of its own per-server pools.
+    While Redis is unreachable reads behave like misses and writes are dropped.
+    """
+    unavailable_errors = (redis.ConnectionError, redis.TimeoutError, CircuitOpenError)
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = SharedRedisCacheClient
+
+    def get(self, key, default=None, version=None):
+        try:
+            return super().get(key, default, version)
+        except self.unavailable_errors as e:
+            logger.warning(f"Cache get skipped: {str(e)}")
+            return default
+
+    def get_many(self, keys, version=None):
+        try:
+            return super().get_many(keys, version)
+        except self.unavailable_errors as e:
+            logger.warning(f"Cache get_many skipped: {str(e)}")
+            return {}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            super().set(key, value, timeout, version)
+        except self.unavailable_errors as e:
+            logger.warning(f"Cache set skipped: {str(e)}")
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            return super().set_many(data, timeout, version)
+        except self.unavailable_errors as e:
+            logger.warning(f"Cache set_many skipped: {str(e)}")
+            return list(data)
+
+    def delete(self, key, version=None):
+        try:
+            return super().delete(key, version)
+        except self.unavailable_errors as e:
+            logger.warning(f"Cache delete skipped: {str(e)}")
+            return False
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            return super().touch(key, timeout, version)
+        except self.unavailable_errors as e:
+            logger.warning(f"Cache touch skipped: {str(e)}")
+            return False
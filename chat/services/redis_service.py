@@ -1,26 +1,57 @@
 # chat/services/redis_service.py - Enhanced Redis service for chat features
 import json
 import logging
+import time
 import redis
 from django.conf import settings
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from .redis_pool import get_redis_client
 
 logger = logging.getLogger(__name__)
 
 
+# Key layout: everything belonging to one room (or one user) shares a {hash tag}, so under Redis
+# Cluster those keys live in one slot and multi-key scripts and pipelines on them stay valid.
+# Releases before the tags wrote room:<id>:...; migrate_redis_keys moves what of that is not yet
+# in Scylla (write-behind streams, pending message counts) when upgrading.
+def room_key(room_id, *parts) -> str:
+    return ':'.join([f"room:{{{room_id}}}", *[str(part) for part in parts]])
+
+
+def user_key(user_id, *parts) -> str:
+    return ':'.join([f"user:{{{user_id}}}", *[str(part) for part in parts]])
+
+
+def space_key(space_id, *parts) -> str:
+    return ':'.join([f"space:{{{space_id}}}", *[str(part) for part in parts]])
+
+
 class RedisChatService:
-    def __init__(self):
-        self.redis_client = redis.Redis(
-            host=getattr(settings, 'REDIS_HOST', 'localhost'),
-            port=getattr(settings, 'REDIS_PORT', 6379),
-            db=getattr(settings, 'REDIS_DB', 0),
-            decode_responses=True,
-            socket_connect_timeout=5,
-            socket_timeout=5,
-            retry_on_timeout=True
-        )
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client or get_redis_client('default')
+        self.is_cluster = getattr(settings, 'REDIS_CLUSTER', False)
         self.default_ttl = 3600  # 1 hour
+        self.scripts = {
+            'react': self.redis_client.register_script(self._REACT_SCRIPT),
+            'seed_reactions': self.redis_client.register_script(self._SEED_REACTIONS_SCRIPT),
+            'clear_changed': self.redis_client.register_script(self._CLEAR_CHANGED_SCRIPT),
+            'move_pending': self.redis_client.register_script(self._MOVE_PENDING_SCRIPT),
+            'leave_space': self.redis_client.register_script(self._LEAVE_SPACE_SCRIPT),
+            'record_throughput': self.redis_client.register_script(self._RECORD_THROUGHPUT_SCRIPT),
+            'rate_limit': self.redis_client.register_script(self._RATE_LIMIT_SCRIPT),
+        }
+
+    def _run_script(self, name: str, calls: List[tuple]) -> List:
+        """Run a script once per (keys, args); pipelined on a single node, one call per key slot on a cluster"""
+        script = self.scripts[name]
+        if self.is_cluster:
+            # Cluster pipelines cannot load scripts on demand; Script.__call__ handles NOSCRIPT itself
+            return [script(keys=keys, args=args) for keys, args in calls]
+        pipe = self.redis_client.pipeline()
+        for keys, args in calls:
+            script(keys=keys, args=args, client=pipe)
+        return pipe.execute()
 
     def health_check(self) -> Dict[str, str]:
         """Check Redis connection health"""
@@ -35,7 +66,7 @@ class RedisChatService:
     def cache_message(self, room_id: str, message_data: Dict) -> bool:
         """Cache a message in Redis with expiration"""
         try:
-            key = f"room:{room_id}:message:{message_data['id']}"
+            key = room_key(room_id, 'message', message_data['id'])
             self.redis_client.setex(
                 key,
                 self.default_ttl,
@@ -43,7 +74,7 @@ class RedisChatService:
             )
 
             # Also add to recent messages list
-            recent_key = f"room:{room_id}:messages:recent"
+            recent_key = room_key(room_id, 'messages', 'recent')
             self.redis_client.lpush(recent_key, json.dumps(message_data))
             self.redis_client.ltrim(recent_key, 0, 99)  # Keep last 100 messages
             self.redis_client.expire(recent_key, self.default_ttl)
@@ -56,7 +87,7 @@ class RedisChatService:
     def get_cached_messages(self, room_id: str, limit: int = 50) -> List[Dict]:
         """Get cached messages for a room"""
         try:
-            key = f"room:{room_id}:messages:recent"
+            key = room_key(room_id, 'messages', 'recent')
             messages = self.redis_client.lrange(key, 0, limit - 1)
             return [json.loads(msg) for msg in messages]
         except Exception as e:
@@ -67,11 +98,11 @@ class RedisChatService:
         """Remove a message from cache"""
         try:
             # Remove from individual cache
-            key = f"room:{room_id}:message:{message_id}"
+            key = room_key(room_id, 'message', message_id)
             self.redis_client.delete(key)
 
             # Remove from recent messages list (this is expensive, consider alternatives)
-            recent_key = f"room:{room_id}:messages:recent"
+            recent_key = room_key(room_id, 'messages', 'recent')
             messages = self.redis_client.lrange(recent_key, 0, -1)
             self.redis_client.delete(recent_key)
 
@@ -86,38 +117,320 @@ class RedisChatService:
             logger.error(f"Error invalidating message: {str(e)}")
             return False
 
+    def invalidate_recent_messages(self, room_id: str) -> bool:
+        """Drop the recent messages list so it is rebuilt from the store"""
+        try:
+            self.redis_client.delete(room_key(room_id, 'messages', 'recent'))
+            return True
+        except Exception as e:
+            logger.error(f"Error invalidating recent messages: {str(e)}")
+            return False
+
+    # Write-behind message streams
+    STREAM_ROOMS_KEY = "chat:streams:rooms"
+    PERSIST_METRICS_KEY = "chat:persist:metrics"
+
+    def enqueue_message(self, room_id: str, message_data: Dict) -> Optional[str]:
+        """Append a message to the room's stream for the persist_messages worker"""
+        try:
+            stream_key = room_key(room_id, 'stream')
+            pipe = self.redis_client.pipeline()
+            pipe.xadd(
+                stream_key,
+                {'data': json.dumps(message_data)},
+                maxlen=getattr(settings, 'CHAT_STREAM_MAXLEN', 100000),
+                approximate=True
+            )
+            pipe.sadd(self.STREAM_ROOMS_KEY, room_id)
+            entry_id, _ = pipe.execute()
+            return entry_id
+        except Exception as e:
+            logger.error(f"Error enqueueing message: {str(e)}")
+            return None
+
+    def get_stream_rooms(self) -> List[str]:
+        """Get rooms that have a message stream"""
+        try:
+            return list(self.redis_client.smembers(self.STREAM_ROOMS_KEY))
+        except Exception as e:
+            logger.error(f"Error getting stream rooms: {str(e)}")
+            return []
+
+    def ensure_stream_group(self, room_id: str, group: str) -> bool:
+        """Create the consumer group for a room stream if it does not exist"""
+        try:
+            self.redis_client.xgroup_create(room_key(room_id, 'stream'), group, id='0', mkstream=True)
+            return True
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' in str(e):
+                return True
+            logger.error(f"Error creating stream group: {str(e)}")
+            return False
+        except Exception as e:
+            logger.error(f"Error creating stream group: {str(e)}")
+            return False
+
+    def read_message_streams(self, room_ids: List[str], group: str, consumer: str,
+                             count: int = 500, block_ms: int = 1000, pending: bool = False) -> Dict[str, List]:
+        """Read entries for a consumer; pending=True re-reads this consumer's unacked entries"""
+        if not room_ids:
+            return {}
+        stream_rooms = {room_key(room_id, 'stream'): room_id for room_id in room_ids}
+        start_id = '0' if pending else '>'
+        if self.is_cluster:
+            # Streams of different rooms live in different slots, so read them one by one
+            response = []
+            for stream_key in stream_rooms:
+                response.extend(self.redis_client.xreadgroup(group, consumer, {stream_key: start_id}, count=count) or [])
+            if not response and not pending:
+                time.sleep(block_ms / 1000)
+        else:
+            response = self.redis_client.xreadgroup(group, consumer, {key: start_id for key in stream_rooms},
+                                                    count=count, block=None if pending else block_ms)
+        entries = {}
+        for stream_key, stream_entries in response or []:
+            room_id = stream_rooms[stream_key]
+            entries[room_id] = [(entry_id, json.loads(fields['data'])) for entry_id, fields in stream_entries if fields]
+        return entries
+
+    def claim_stale_messages(self, room_id: str, group: str, consumer: str,
+                             min_idle_ms: int = 60000, count: int = 500) -> List:
+        """Take over entries left pending by consumers that died mid-batch"""
+        try:
+            result = self.redis_client.xautoclaim(room_key(room_id, 'stream'), group, consumer,
+                                                  min_idle_time=min_idle_ms, start_id='0', count=count)
+            return [(entry_id, json.loads(fields['data'])) for entry_id, fields in result[1] if fields]
+        except Exception as e:
+            logger.error(f"Error claiming stale messages: {str(e)}")
+            return []
+
+    def ack_messages(self, room_id: str, group: str, entry_ids: List[str]) -> bool:
+        """Acknowledge and drop persisted entries"""
+        try:
+            stream_key = room_key(room_id, 'stream')
+            pipe = self.redis_client.pipeline()
+            pipe.xack(stream_key, group, *entry_ids)
+            pipe.xdel(stream_key, *entry_ids)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error acknowledging messages: {str(e)}")
+            return False
+
+    def get_stream_lag(self, room_ids: List[str]) -> Dict[str, int]:
+        """Entries not yet persisted per room (acked entries are deleted, so XLEN is the lag)"""
+        try:
+            pipe = self.redis_client.pipeline()
+            for room_id in room_ids:
+                pipe.xlen(room_key(room_id, 'stream'))
+            return {room_id: length for room_id, length in zip(room_ids, pipe.execute()) if length}
+        except Exception as e:
+            logger.error(f"Error getting stream lag: {str(e)}")
+            return {}
+
+    def retire_drained_streams(self, room_ids: List[str], group: str) -> List[str]:
+        """
+        Take rooms whose stream is empty with nothing pending for the group out of the stream set, so
+        the worker stops reading them; enqueue_message adds a room back with its next message.
+        Returns the rooms retired.
+        """
+        if not room_ids:
+            return []
+        try:
+            pipe = self.redis_client.pipeline()
+            for room_id in room_ids:
+                pipe.xlen(room_key(room_id, 'stream'))
+                pipe.xpending(room_key(room_id, 'stream'), group)
+            results = pipe.execute()
+            drained = [room_id for room_id, length, pending in zip(room_ids, results[::2], results[1::2])
+                       if not length and not pending['pending']]
+            if not drained:
+                return []
+            self.redis_client.srem(self.STREAM_ROOMS_KEY, *drained)
+
+            # enqueue_message adds to the stream before the set: an entry that landed before this
+            # re-check is seen here, one that lands after it adds its room back by itself
+            pipe = self.redis_client.pipeline()
+            for room_id in drained:
+                pipe.xlen(room_key(room_id, 'stream'))
+            refilled = [room_id for room_id, length in zip(drained, pipe.execute()) if length]
+            if refilled:
+                self.redis_client.sadd(self.STREAM_ROOMS_KEY, *refilled)
+            return [room_id for room_id in drained if room_id not in refilled]
+        except Exception as e:
+            logger.error(f"Error retiring drained streams: {str(e)}")
+            return []
+
+    def record_persist_metrics(self, persisted: int, lag: int) -> bool:
+        """Publish persist_messages worker metrics"""
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hincrby(self.PERSIST_METRICS_KEY, 'persisted_total', persisted)
+            pipe.hset(self.PERSIST_METRICS_KEY, mapping={
+                'lag': lag,
+                'last_run': datetime.now().isoformat()
+            })
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error recording persist metrics: {str(e)}")
+            return False
+
+    def get_persist_metrics(self) -> Dict[str, str]:
+        """Get persist_messages worker metrics"""
+        try:
+            return self.redis_client.hgetall(self.PERSIST_METRICS_KEY)
+        except Exception as e:
+            logger.error(f"Error getting persist metrics: {str(e)}")
+            return {}
+
     # User presence management
-    def set_user_online(self, room_id: str, user_id: str) -> bool:
-        """Mark user as online in a room"""
+    # Room presence is a hash of user -> last heartbeat. Space presence is kept alongside it:
+    # space:{id}:online is a sorted set of user -> last heartbeat (epoch seconds) and
+    # space:{id}:online:connections counts each user's open sockets in the space, so a user only
+    # leaves the space set when their last socket there closes. Entries older than
+    # CHAT_PRESENCE_TIMEOUT (sockets lost with a crashed worker) are ignored and pruned on read.
+    # room:{id}:leaving marks users whose user_left broadcast is held back for a reconnect grace window.
+    PRESENCE_TIMEOUT = getattr(settings, 'CHAT_PRESENCE_TIMEOUT', 300)
+    SPACE_CONNECTIONS_TTL = 86400
+
+    # Decrement the user's socket count and drop them from the space set on their last socket
+    _LEAVE_SPACE_SCRIPT = """
+    local remaining = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+    if remaining <= 0 then
+        redis.call('HDEL', KEYS[1], ARGV[1])
+        redis.call('ZREM', KEYS[2], ARGV[1])
+    end
+    return remaining
+    """
+
+    def set_user_online(self, room_id: str, user_id: str, space_id: str = None) -> bool:
+        """Mark user as online in a room, and in its space when space_id is given"""
         try:
-            key = f"room:{room_id}:online_users"
-            timestamp = datetime.now().isoformat()
-            self.redis_client.hset(key, user_id, timestamp)
-            self.redis_client.expire(key, 300)  # 5 minutes
+            key = room_key(room_id, 'online_users')
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(key, user_id, datetime.now().isoformat())
+            pipe.expire(key, self.PRESENCE_TIMEOUT)
+            if space_id:
+                connections_key = space_key(space_id, 'online', 'connections')
+                pipe.hincrby(connections_key, user_id, 1)
+                pipe.expire(connections_key, self.SPACE_CONNECTIONS_TTL)
+                pipe.zadd(space_key(space_id, 'online'), {user_id: time.time()})
+            pipe.execute()
             return True
         except Exception as e:
             logger.error(f"Error setting user online: {str(e)}")
             return False
 
-    def set_user_offline(self, room_id: str, user_id: str) -> bool:
-        """Mark user as offline in a room"""
+    def presence_heartbeat(self, room_id: str, user_id: str, space_id: str = None, channel_name: str = None) -> bool:
+        """Refresh a connected user's room and space presence, and their socket's entry, in one round trip"""
         try:
-            key = f"room:{room_id}:online_users"
-            self.redis_client.hdel(key, user_id)
+            key = room_key(room_id, 'online_users')
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(key, user_id, datetime.now().isoformat())
+            pipe.expire(key, self.PRESENCE_TIMEOUT)
+            if channel_name:
+                sockets_key = room_key(room_id, 'sockets')
+                pipe.zadd(sockets_key, {channel_name: time.time()}, xx=True)  # Not back once unregistered
+                pipe.expire(sockets_key, self.PRESENCE_TIMEOUT)
+            if space_id:
+                pipe.zadd(space_key(space_id, 'online'), {user_id: time.time()})
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error refreshing presence: {str(e)}")
+            return False
 
+    def set_user_offline(self, room_id: str, user_id: str, space_id: str = None, leaving: bool = False) -> bool:
+        """
+        Mark user as offline in a room; with space_id, this closes one of the user's sockets in the space.
+        leaving=True also leaves a marker that the user's user_left broadcast is being held back.
+        """
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hdel(room_key(room_id, 'online_users'), user_id)
             # Also remove from typing users
-            typing_key = f"room:{room_id}:typing_users"
-            self.redis_client.hdel(typing_key, user_id)
+            pipe.hdel(room_key(room_id, 'typing_users'), user_id)
+            if leaving:
+                leaving_key = room_key(room_id, 'leaving')
+                pipe.hset(leaving_key, user_id, time.time())
+                pipe.expire(leaving_key, self.PRESENCE_TIMEOUT)
+            pipe.execute()
+            if space_id:
+                self.scripts['leave_space'](keys=[space_key(space_id, 'online', 'connections'),
+                                                  space_key(space_id, 'online')], args=[user_id])
             return True
         except Exception as e:
             logger.error(f"Error setting user offline: {str(e)}")
             return False
 
+    def take_leave_marker(self, room_id: str, user_id: str) -> bool:
+        """
+        Remove the user's held-back leave from a room; True when there was one. Whoever takes it
+        decides: a reconnecting socket skips user_joined, the grace timer sends user_left.
+        """
+        try:
+            # HDEL reports the removal to exactly one caller
+            return bool(self.redis_client.hdel(room_key(room_id, 'leaving'), user_id))
+        except Exception as e:
+            logger.error(f"Error taking leave marker: {str(e)}")
+            return False
+
+    def get_space_online_users(self, space_id: str) -> List[str]:
+        """Users with a live socket anywhere in a space"""
+        try:
+            key = space_key(space_id, 'online')
+            cutoff = time.time() - self.PRESENCE_TIMEOUT
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zremrangebyscore(key, '-inf', cutoff)
+            pipe.zrange(key, 0, -1)
+            return pipe.execute()[1]
+        except Exception as e:
+            logger.error(f"Error getting space online users: {str(e)}")
+            return []
+
+    def get_space_presence(self, space_id: str, room_ids: List[str]) -> Dict:
+        """Space-wide online users plus the online users of each room, in one pipeline"""
+        room_ids = [str(room_id) for room_id in room_ids]
+        try:
+            key = space_key(space_id, 'online')
+            now = time.time()
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zremrangebyscore(key, '-inf', now - self.PRESENCE_TIMEOUT)
+            pipe.zrange(key, 0, -1)
+            for room_id in room_ids:
+                pipe.hgetall(room_key(room_id, 'online_users'))
+            results = pipe.execute()
+
+            online = set(results[1])
+            cutoff_time = datetime.fromtimestamp(now - self.PRESENCE_TIMEOUT)
+            rooms = {}
+            for room_id, users_data in zip(room_ids, results[2:]):
+                rooms[room_id] = []
+                for user_id, timestamp_str in users_data.items():
+                    try:
+                        if user_id in online and datetime.fromisoformat(timestamp_str) > cutoff_time:
+                            rooms[room_id].append(user_id)
+                    except ValueError:
+                        continue
+            return {'online': results[1], 'rooms': rooms}
+        except Exception as e:
+            logger.error(f"Error getting space presence: {str(e)}")
+            return {'online': [], 'rooms': {room_id: [] for room_id in room_ids}}
+
+    def get_online_count(self, room_id: str) -> int:
+        """Number of users marked online in a room (including not yet expired stale entries)"""
+        try:
+            return self.redis_client.hlen(room_key(room_id, 'online_users'))
+        except Exception as e:
+            logger.error(f"Error getting online count: {str(e)}")
+            return 0
+
     def get_online_users(self, room_id: str) -> List[str]:
         """Get list of online users in a room"""
         try:
-            key = f"room:{room_id}:online_users"
-            cutoff_time = datetime.now() - timedelta(minutes=5)
+            key = room_key(room_id, 'online_users')
+            cutoff_time = datetime.now() - timedelta(seconds=self.PRESENCE_TIMEOUT)
 
             online_users = []
             users_data = self.redis_client.hgetall(key)
@@ -139,11 +452,172 @@ class RedisChatService:
             logger.error(f"Error getting online users: {str(e)}")
             return []
 
+    # Connection registry
+    # user:{id}:connections maps each open socket's channel name to the room it is connected to.
+    # Entries are removed on disconnect; the key expires after a day without connects so sockets
+    # lost with a crashed worker do not linger forever.
+    # The same calls keep room:{id}:sockets, a sorted set of the room's sockets scored by their last
+    # heartbeat. Sockets are counted from it rather than with a counter, so those lost with a crashed
+    # worker drop out after PRESENCE_TIMEOUT like their presence does, and a close can never take
+    # the count below the sockets actually there. Only sockets register, so presence changes made
+    # elsewhere (a member removed by a view) leave it alone.
+    CONNECTION_REGISTRY_TTL = 86400
+
+    def register_connection(self, user_id: str, channel_name: str, room_id: str) -> bool:
+        """Record an open socket of a user"""
+        try:
+            key = user_key(user_id, 'connections')
+            sockets_key = room_key(room_id, 'sockets')
+            now = time.time()
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(key, channel_name, json.dumps({'room': str(room_id), 'connected_at': datetime.now().isoformat()}))
+            pipe.expire(key, self.CONNECTION_REGISTRY_TTL)
+            pipe.zremrangebyscore(sockets_key, '-inf', now - self.PRESENCE_TIMEOUT)
+            pipe.zadd(sockets_key, {channel_name: now})
+            pipe.expire(sockets_key, self.PRESENCE_TIMEOUT)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error registering connection: {str(e)}")
+            return False
+
+    def unregister_connection(self, user_id: str, channel_name: str, room_id: str) -> bool:
+        """Forget a closed socket"""
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hdel(user_key(user_id, 'connections'), channel_name)
+            pipe.zrem(room_key(room_id, 'sockets'), channel_name)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error unregistering connection: {str(e)}")
+            return False
+
+    def get_user_connections(self, user_id: str) -> Dict[str, Dict]:
+        """Open sockets of a user keyed by channel name, with the room each is connected to"""
+        try:
+            connections = self.redis_client.hgetall(user_key(user_id, 'connections'))
+            return {channel_name: json.loads(info) for channel_name, info in connections.items()}
+        except Exception as e:
+            logger.error(f"Error getting user connections: {str(e)}")
+            return {}
+
+    # Space member changes and mentions
+    # Every SpaceMembership add/remove is appended to space:{id}:members:changes (the newest
+    # MEMBER_CHANGES_KEPT entries) under a version counter, so each process can bring its
+    # mention trie up to date without reloading the member list. Mentions of a user in a space are
+    # kept in user:{id}:mentions:{space} (newest MENTIONS_KEPT), scored by message time.
+    MEMBER_CHANGES_KEPT = 500
+    MENTIONS_KEPT = getattr(settings, 'CHAT_MENTIONS_KEPT', 500)
+    MENTIONS_TTL = 30 * 86400
+
+    def record_member_change(self, space_id: str, op: str, user_id: str, username: str = None) -> Optional[int]:
+        """Append a member add/remove to the space's change log, returns the new version"""
+        try:
+            changes_key = space_key(space_id, 'members', 'changes')
+            pipe = self.redis_client.pipeline()  # MULTI keeps the version and the log in step
+            pipe.incr(space_key(space_id, 'members', 'version'))
+            pipe.rpush(changes_key, json.dumps([op, user_id, username]))
+            pipe.ltrim(changes_key, -self.MEMBER_CHANGES_KEPT, -1)
+            return pipe.execute()[0]
+        except Exception as e:
+            logger.error(f"Error recording member change: {str(e)}")
+            return None
+
+    def get_member_changes(self, space_id: str, since: Optional[int]) -> tuple:
+        """
+        (version, changes) where changes are the [op, user_id, username] entries after version since;
+        changes is None when since is unknown or too old and the caller must reload the members.
+        On error the caller's version is returned with no changes.
+        """
+        try:
+            version = int(self.redis_client.get(space_key(space_id, 'members', 'version')) or 0)
+            if since is None or version < since or version - since > self.MEMBER_CHANGES_KEPT:
+                return version, None
+            if version == since:
+                return version, []
+            changes = self.redis_client.lrange(space_key(space_id, 'members', 'changes'), since - version, -1)
+            return version, [json.loads(change) for change in changes]
+        except Exception as e:
+            logger.error(f"Error getting member changes: {str(e)}")
+            return since, []
+
+    def record_mentions(self, space_id: str, user_ids: List[str], mention: Dict, score: float) -> bool:
+        """Add a mention entry to each mentioned user's feed for the space"""
+        try:
+            member = json.dumps(mention)
+            pipe = self.redis_client.pipeline(transaction=False)
+            for user_id in user_ids:
+                key = user_key(user_id, 'mentions', space_id)
+                pipe.zadd(key, {member: score})
+                pipe.zremrangebyrank(key, 0, -self.MENTIONS_KEPT - 1)
+                pipe.expire(key, self.MENTIONS_TTL)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error recording mentions: {str(e)}")
+            return False
+
+    def get_mentions(self, user_id: str, space_id: str, limit: int = 50, before: float = None) -> List[Dict]:
+        """A user's mentions in a space, newest first; before is an exclusive score cursor"""
+        try:
+            entries = self.redis_client.zrevrangebyscore(
+                user_key(user_id, 'mentions', space_id), f"({before}" if before is not None else '+inf', '-inf',
+                start=0, num=limit, withscores=True)
+            return [dict(json.loads(member), score=score) for member, score in entries]
+        except Exception as e:
+            logger.error(f"Error getting mentions: {str(e)}")
+            return []
+
+    # Moderation
+    # space:{id}:moderation:version changes whenever the space's term list does, telling every
+    # process to recompile its automaton; flagged content waits in space:{id}:moderation:flagged.
+    MODERATION_FLAGGED_KEPT = 1000
+
+    def get_moderation_version(self, space_id: str) -> Optional[int]:
+        """Current term list version of a space, None when Redis cannot be read"""
+        try:
+            return int(self.redis_client.get(space_key(space_id, 'moderation', 'version')) or 0)
+        except Exception as e:
+            logger.error(f"Error getting moderation version: {str(e)}")
+            return None
+
+    def bump_moderation_version(self, space_id: str) -> bool:
+        """Invalidate every process's compiled terms for a space"""
+        try:
+            self.redis_client.incr(space_key(space_id, 'moderation', 'version'))
+            return True
+        except Exception as e:
+            logger.error(f"Error bumping moderation version: {str(e)}")
+            return False
+
+    def flag_content(self, space_id: str, entry: Dict) -> bool:
+        """Queue flagged content for moderator review, newest first"""
+        try:
+            key = space_key(space_id, 'moderation', 'flagged')
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.lpush(key, json.dumps(entry))
+            pipe.ltrim(key, 0, self.MODERATION_FLAGGED_KEPT - 1)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error flagging content: {str(e)}")
+            return False
+
+    def get_flagged_content(self, space_id: str, limit: int = 50) -> List[Dict]:
+        """Most recently flagged content of a space"""
+        try:
+            return [json.loads(entry) for entry in
+                    self.redis_client.lrange(space_key(space_id, 'moderation', 'flagged'), 0, limit - 1)]
+        except Exception as e:
+            logger.error(f"Error getting flagged content: {str(e)}")
+            return []
+
     # Typing indicators
     def set_user_typing(self, room_id: str, user_id: str) -> bool:
         """Mark user as typing in a room"""
         try:
-            key = f"room:{room_id}:typing_users"
+            key = room_key(room_id, 'typing_users')
             timestamp = datetime.now().isoformat()
             self.redis_client.hset(key, user_id, timestamp)
             self.redis_client.expire(key, 30)  # 30 seconds
@@ -155,7 +629,7 @@ class RedisChatService:
     def unset_user_typing(self, room_id: str, user_id: str) -> bool:
         """Remove user from typing list"""
         try:
-            key = f"room:{room_id}:typing_users"
+            key = room_key(room_id, 'typing_users')
             self.redis_client.hdel(key, user_id)
             return True
         except Exception as e:
@@ -165,7 +639,7 @@ class RedisChatService:
     def get_typing_users(self, room_id: str) -> List[str]:
         """Get list of users currently typing"""
         try:
-            key = f"room:{room_id}:typing_users"
+            key = room_key(room_id, 'typing_users')
             cutoff_time = datetime.now() - timedelta(seconds=30)
 
             typing_users = []
@@ -188,58 +662,545 @@ class RedisChatService:
             logger.error(f"Error getting typing users: {str(e)}")
             return []
 
+    # Message reactions
+    # Counts live in room:{id}:message:{mid}:reactions (emoji -> count) and who reacted in
+    # room:{id}:message:{mid}:reactors ("{uid}:{emoji}" plus an empty member marking the set as loaded),
+    # both persisted to Scylla. chat:reactions:changed maps "{room}:{mid}" to a version bumped on each
+    # change; flush_reactions removes an entry only when its version is unchanged after the write.
+    REACTIONS_DIRTY_KEY = "chat:reactions:changed"
+    REACTION_TTL = 30 * 86400  # 30 days, older messages are re-seeded from Scylla
+    REACTORS_LOADED = ''
+
+    # KEYS: reactors, counts; ARGV: member, emoji, add, ttl. Returns {changed, count, loaded}
+    _REACT_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {0, 0, 0}
+    end
+    local changed = 0
+    if ARGV[3] == '1' then
+        if redis.call('SADD', KEYS[1], ARGV[1]) == 1 then
+            redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+            changed = 1
+        end
+    elseif redis.call('SREM', KEYS[1], ARGV[1]) == 1 then
+        if redis.call('HINCRBY', KEYS[2], ARGV[2], -1) <= 0 then
+            redis.call('HDEL', KEYS[2], ARGV[2])
+        end
+        changed = 1
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+    return {changed, tonumber(redis.call('HGET', KEYS[2], ARGV[2]) or '0'), 1}
+    """
+
+    # KEYS: reactors, counts; ARGV: ttl, loaded marker, member count, members..., emoji, count, ...
+    _SEED_REACTIONS_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return 0
+    end
+    local members = tonumber(ARGV[3])
+    redis.call('SADD', KEYS[1], ARGV[2])
+    for i = 4, 3 + members, 1000 do  -- unpack is bounded by the Lua stack
+        redis.call('SADD', KEYS[1], unpack(ARGV, i, math.min(i + 999, 3 + members)))
+    end
+    redis.call('DEL', KEYS[2])
+    for i = 4 + members, #ARGV, 2 do
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+    return 1
+    """
+
+    # KEYS: changed hash; ARGV: field, version, ... Deletes fields whose version was not bumped since
+    _CLEAR_CHANGED_SCRIPT = """
+    local cleared = 0
+    for i = 1, #ARGV, 2 do
+        if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+            cleared = cleared + redis.call('HDEL', KEYS[1], ARGV[i])
+        end
+    end
+    return cleared
+    """
+
+    def _reaction_keys(self, room_id: str, message_id: str) -> List[str]:
+        return [room_key(room_id, 'message', message_id, 'reactors'),
+                room_key(room_id, 'message', message_id, 'reactions')]
+
+    def react(self, room_id: str, message_id: str, user_id: str, emoji: str, add: bool = True) -> Optional[Dict]:
+        """Add or remove a user's reaction; returns the new count, or loaded=False when
+        the message's reaction state has to be seeded from Scylla first"""
+        try:
+            keys = self._reaction_keys(room_id, message_id)
+            args = [f"{user_id}:{emoji}", emoji, '1' if add else '0', self.REACTION_TTL]
+            if self.is_cluster:
+                changed, count, loaded = self.scripts['react'](keys=keys, args=args)
+                if changed:
+                    self.redis_client.hincrby(self.REACTIONS_DIRTY_KEY, f"{room_id}:{message_id}", 1)
+            else:
+                pipe = self.redis_client.pipeline()
+                self.scripts['react'](keys=keys, args=args, client=pipe)
+                # Marking an unchanged message is harmless: the flush rewrites the same state
+                pipe.hincrby(self.REACTIONS_DIRTY_KEY, f"{room_id}:{message_id}", 1)
+                (changed, count, loaded), _ = pipe.execute()
+            return {'count': int(count), 'changed': bool(changed), 'loaded': bool(loaded)}
+        except Exception as e:
+            logger.error(f"Error updating reaction: {str(e)}")
+            return None
+
+    def seed_reactions(self, room_id: str, message_id: str, counts: Dict[str, int], reactors: List[str]) -> bool:
+        """Load persisted counts and reactors ("{uid}:{emoji}") unless another request already did"""
+        try:
+            args = [self.REACTION_TTL, self.REACTORS_LOADED, len(reactors), *reactors]
+            for emoji, count in counts.items():
+                args += [emoji, count]
+            self.scripts['seed_reactions'](keys=self._reaction_keys(room_id, message_id), args=args)
+            return True
+        except Exception as e:
+            logger.error(f"Error seeding reactions: {str(e)}")
+            return False
+
+    def get_reaction_counts(self, room_id: str, message_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """Get reaction counts for several messages in one pipeline; messages without loaded state are omitted"""
+        if not message_ids:
+            return {}
+        try:
+            pipe = self.redis_client.pipeline()
+            for message_id in message_ids:
+                reactors, reactions = self._reaction_keys(room_id, message_id)
+                pipe.exists(reactors)
+                pipe.hgetall(reactions)
+            results = pipe.execute()
+            return {
+                message_id: {emoji: int(count) for emoji, count in counts.items()}
+                for message_id, loaded, counts in zip(message_ids, results[::2], results[1::2]) if loaded
+            }
+        except Exception as e:
+            logger.error(f"Error getting reaction counts: {str(e)}")
+            return {}
+
+    def take_dirty_reactions(self, count: int = 500, cursor: int = 0) -> Tuple[int, Dict[tuple, Dict]]:
+        """Read about count changed messages from an HSCAN cursor without removing them. Returns the
+        next cursor (0 once the pass is done) and the messages keyed by (room, message) with their
+        counts, reactors and version; reactors is None when the state has expired"""
+        try:
+            cursor, versions = self.redis_client.hscan(self.REACTIONS_DIRTY_KEY, cursor, count=count)
+            fields = list(versions)
+            keys = [tuple(field.split(':', 1)) for field in fields]
+            pipe = self.redis_client.pipeline()
+            for room_id, message_id in keys:
+                reactors, reactions = self._reaction_keys(room_id, message_id)
+                pipe.hgetall(reactions)
+                pipe.smembers(reactors)
+            results = pipe.execute()
+            return int(cursor), {
+                key: {
+                    'counts': {emoji: int(n) for emoji, n in counts.items()},
+                    'reactors': sorted(member for member in reactors if member != self.REACTORS_LOADED) if reactors else None,
+                    'version': versions[field],
+                }
+                for key, field, counts, reactors in zip(keys, fields, results[::2], results[1::2])
+            }
+        except Exception as e:
+            logger.error(f"Error taking dirty reactions: {str(e)}")
+            return 0, {}
+
+    def clear_dirty_reactions(self, versions: Dict[tuple, str]) -> int:
+        """Drop flushed (room, message) marks whose version did not change since they were taken"""
+        if not versions:
+            return 0
+        try:
+            args = []
+            for (room_id, message_id), version in versions.items():
+                args += [f"{room_id}:{message_id}", version]
+            return self.scripts['clear_changed'](keys=[self.REACTIONS_DIRTY_KEY], args=args)
+        except Exception as e:
+            logger.error(f"Error clearing dirty reactions: {str(e)}")
+            return 0
+
+    # Fan-out sharding
+    def get_fanout_shards(self, room_id: str) -> int:
+        """Number of channel-layer shard groups for a room (1 = unsharded)"""
+        try:
+            return int(self.redis_client.get(room_key(room_id, 'fanout', 'shards')) or 1)
+        except Exception as e:
+            logger.error(f"Error getting fan-out shards: {str(e)}")
+            return 1
+
+    def promote_fanout(self, room_id: str, shards: int) -> int:
+        """Switch a room to sharded fan-out; the first promotion wins and is never lowered"""
+        try:
+            key = room_key(room_id, 'fanout', 'shards')
+            pipe = self.redis_client.pipeline()
+            pipe.setnx(key, shards)
+            pipe.get(key)
+            _, current = pipe.execute()
+            logger.info(f"Room {room_id} uses {current} fan-out shards")
+            return int(current)
+        except Exception as e:
+            logger.error(f"Error promoting fan-out: {str(e)}")
+            return 1
+
+    # Room throughput
+    # room:{id}:throughput is a fixed-size ring: s:{n}/st:{n} hold the message count and epoch second
+    # of slot n = second % 60, m:{n}/mt:{n} the same per minute for the last hour. A slot whose
+    # stamp is not the current second (or minute) is stale and is reset on the next write, so
+    # the hash never grows past 240 fields. room:{id}:throughput:senders scores each sender by
+    # their last message; open sockets are counted from room:{id}:sockets. Rooms that sent
+    # anything in a minute are counted in chat:{throughput}:hot:{minute} for the hot room list.
+    THROUGHPUT_SLOTS = 60
+    THROUGHPUT_TTL = 3600
+    THROUGHPUT_RATE_WINDOW = 10  # Complete seconds averaged into messages_per_second
+    THROUGHPUT_SENDER_WINDOW = 60
+    HOT_ROOMS_TTL = 180
+
+    # KEYS: ring, senders[, hot rooms of this minute]; ARGV: now, user, room, ttl, sender window, hot ttl
+    _RECORD_THROUGHPUT_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local second = math.floor(now)
+    local minute = math.floor(second / 60)
+    local function bump(prefix, stamp)
+        local slot = stamp % 60
+        if redis.call('HGET', KEYS[1], prefix .. 't:' .. slot) == tostring(stamp) then
+            redis.call('HINCRBY', KEYS[1], prefix .. ':' .. slot, 1)
+        else
+            redis.call('HSET', KEYS[1], prefix .. 't:' .. slot, stamp, prefix .. ':' .. slot, 1)
+        end
+    end
+    bump('s', second)
+    bump('m', minute)
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('ZADD', KEYS[2], now, ARGV[2])
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[5]))
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+    if KEYS[3] then
+        redis.call('ZINCRBY', KEYS[3], 1, ARGV[3])
+        redis.call('EXPIRE', KEYS[3], ARGV[6])
+    end
+    return 1
+    """
+
+    def _hot_rooms_key(self, minute: int) -> str:
+        return f"chat:{{throughput}}:hot:{minute}"
+
+    def record_throughput(self, room_id: str, user_id: str) -> bool:
+        """Count a sent message in the room's rings; one EVALSHA on a single node"""
+        try:
+            now = time.time()
+            keys = [room_key(room_id, 'throughput'), room_key(room_id, 'throughput', 'senders')]
+            args = [now, user_id, room_id, self.THROUGHPUT_TTL, self.THROUGHPUT_SENDER_WINDOW, self.HOT_ROOMS_TTL]
+            hot_key = self._hot_rooms_key(int(now) // 60)
+            if self.is_cluster:
+                # The hot room set lives in another slot than the room's keys
+                self.scripts['record_throughput'](keys=keys, args=args)
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.zincrby(hot_key, 1, room_id)
+                pipe.expire(hot_key, self.HOT_ROOMS_TTL)
+                pipe.execute()
+            else:
+                self.scripts['record_throughput'](keys=keys + [hot_key], args=args)
+            return True
+        except Exception as e:
+            logger.error(f"Error recording throughput: {str(e)}")
+            return False
+
+    def _ring(self, meter: Dict, prefix: str, current: int) -> List[int]:
+        """Counts of the last THROUGHPUT_SLOTS periods up to current, oldest first; stale slots read as 0"""
+        counts = []
+        for stamp in range(current - self.THROUGHPUT_SLOTS + 1, current + 1):
+            slot = stamp % self.THROUGHPUT_SLOTS
+            counts.append(int(meter.get(f"{prefix}:{slot}", 0)) if meter.get(f"{prefix}t:{slot}") == str(stamp) else 0)
+        return counts
+
+    def get_room_throughput(self, room_ids: List[str]) -> Dict[str, Dict]:
+        """Per-second and per-minute series, active senders and open sockets of several rooms in one pipeline"""
+        room_ids = [str(room_id) for room_id in room_ids]
+        try:
+            now = time.time()
+            pipe = self.redis_client.pipeline(transaction=False)
+            for room_id in room_ids:
+                pipe.hgetall(room_key(room_id, 'throughput'))
+                pipe.zcount(room_key(room_id, 'throughput', 'senders'), now - self.THROUGHPUT_SENDER_WINDOW, '+inf')
+                pipe.zcount(room_key(room_id, 'sockets'), now - self.PRESENCE_TIMEOUT, '+inf')
+            results = pipe.execute()
+
+            throughput = {}
+            for index, room_id in enumerate(room_ids):
+                meter, senders, sockets = results[index * 3:index * 3 + 3]
+                per_second = self._ring(meter, 's', int(now))
+                throughput[room_id] = {
+                    # The current second is still filling up, so the rate uses the complete ones before it
+                    'messages_per_second': sum(per_second[-self.THROUGHPUT_RATE_WINDOW - 1:-1]) / self.THROUGHPUT_RATE_WINDOW,
+                    'messages_per_minute': sum(per_second),
+                    'active_senders': senders,
+                    'sockets': sockets,
+                    'per_second': per_second,
+                    'per_minute': self._ring(meter, 'm', int(now) // 60),
+                }
+            return throughput
+        except Exception as e:
+            logger.error(f"Error getting room throughput: {str(e)}")
+            return {}
+
+    def get_room_message_rates(self, room_ids: List[str]) -> Dict[str, float]:
+        """messages_per_second of several rooms, reading only the slots it needs"""
+        room_ids = [str(room_id) for room_id in room_ids]
+        try:
+            second = int(time.time())
+            stamps = range(second - self.THROUGHPUT_RATE_WINDOW, second)
+            fields = []
+            for stamp in stamps:
+                fields += [f"s:{stamp % self.THROUGHPUT_SLOTS}", f"st:{stamp % self.THROUGHPUT_SLOTS}"]
+            pipe = self.redis_client.pipeline(transaction=False)
+            for room_id in room_ids:
+                pipe.hmget(room_key(room_id, 'throughput'), fields)
+            rates = {}
+            for room_id, values in zip(room_ids, pipe.execute()):
+                count = sum(int(values[i] or 0) for i, stamp in zip(range(0, len(values), 2), stamps)
+                            if values[i + 1] == str(stamp))
+                rates[room_id] = count / self.THROUGHPUT_RATE_WINDOW
+            return rates
+        except Exception as e:
+            logger.error(f"Error getting room message rates: {str(e)}")
+            return {}
+
+    def get_hot_rooms(self, limit: int = 20) -> List[tuple]:
+        """(room_id, messages) of the busiest rooms over the current and previous minute"""
+        try:
+            minute = int(time.time()) // 60
+            return [(room_id, int(count)) for room_id, count in self.redis_client.zunion(
+                [self._hot_rooms_key(minute - 1), self._hot_rooms_key(minute)], withscores=True)[::-1][:limit]]
+        except Exception as e:
+            logger.error(f"Error getting hot rooms: {str(e)}")
+            return []
+
+    # Room activity and previews
+    LAST_MESSAGE_PREVIEW_LENGTH = 140
+
+    def record_room_activity(self, room_id: str, message_data: Dict, member_ids: List[str]) -> bool:
+        """Store the room's last-message preview and bump the room in each member's activity set"""
+        try:
+            created_at = datetime.fromisoformat(message_data['created_at'])
+            score = created_at.timestamp()
+            pipe = self.redis_client.pipeline()
+            pipe.hset(room_key(room_id, 'last_message'), mapping={
+                'id': message_data['id'],
+                'user': message_data['user'],
+                'content': (message_data.get('content') or '')[:self.LAST_MESSAGE_PREVIEW_LENGTH],
+                'has_media': int(bool(message_data.get('media'))),
+                'created_at': message_data['created_at'],
+            })
+            for user_id in member_ids:
+                pipe.zadd(user_key(user_id, 'rooms', 'activity'), {str(room_id): score})
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error recording room activity: {str(e)}")
+            return False
+
+    def mark_room_read(self, room_id: str, user_id: str) -> bool:
+        """Remember the room's message count at the time the user last read it"""
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.get(room_key(room_id, 'stats', 'message_total'))
+            pipe.get(room_key(room_id, 'stats', 'message_count', 'pending'))
+            total, pending = pipe.execute()
+            self.redis_client.hset(user_key(user_id, 'rooms', 'read'), str(room_id), int(total or 0) + int(pending or 0))
+            return True
+        except Exception as e:
+            logger.error(f"Error marking room read: {str(e)}")
+            return False
+
+    def get_room_summaries(self, user_id: str, room_ids: List[str]) -> Dict[str, Dict]:
+        """Last message, last activity and unread count for several rooms in one pipeline"""
+        room_ids = [str(room_id) for room_id in room_ids]
+        if not room_ids:
+            return {}
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.zmscore(user_key(user_id, 'rooms', 'activity'), room_ids)
+            pipe.hmget(user_key(user_id, 'rooms', 'read'), room_ids)
+            for room_id in room_ids:
+                pipe.hgetall(room_key(room_id, 'last_message'))
+                pipe.get(room_key(room_id, 'stats', 'message_total'))
+                pipe.get(room_key(room_id, 'stats', 'message_count', 'pending'))
+            results = pipe.execute()
+
+            scores, read_counts = results[0], results[1]
+            summaries = {}
+            for index, room_id in enumerate(room_ids):
+                last_message, total, pending = results[2 + index * 3:5 + index * 3]
+                count = int(total or 0) + int(pending or 0)
+                last_activity = scores[index]
+                if last_activity is None and last_message:
+                    last_activity = datetime.fromisoformat(last_message['created_at']).timestamp()
+                if last_message:
+                    last_message['has_media'] = last_message.get('has_media') == '1'
+                summaries[room_id] = {
+                    'last_message': last_message or None,
+                    'last_activity': last_activity,
+                    'unread_count': max(count - int(read_counts[index] or 0), 0),
+                }
+            return summaries
+        except Exception as e:
+            logger.error(f"Error getting room summaries: {str(e)}")
+            return {}
+
     # Room statistics
-    def increment_message_count(self, room_id: str) -> int:
+    # Message counts are accumulated in room:{id}:stats:message_count:pending and moved into the
+    # durable Scylla counter table by flush_room_counters; room:{id}:stats:message_total mirrors
+    # the durable value so stats never need to touch Scylla on the hot path.
+    COUNTERS_DIRTY_KEY = "chat:counters:dirty"
+
+    # Atomically move the pending count into the mirrored total and return the amount moved
+    _MOVE_PENDING_SCRIPT = """
+    local n = tonumber(redis.call('GET', KEYS[1]) or '0')
+    if n ~= 0 then
+        redis.call('DEL', KEYS[1])
+        redis.call('INCRBY', KEYS[2], n)
+    end
+    return n
+    """
+
+    def increment_message_count(self, room_id: str, amount: int = 1) -> int:
         """Increment message count for a room"""
         try:
-            key = f"room:{room_id}:stats:message_count"
-            count = self.redis_client.incr(key)
-            self.redis_client.expire(key, 86400)  # 24 hours
-            return count
+            pending_key = room_key(room_id, 'stats', 'message_count', 'pending')
+            total_key = room_key(room_id, 'stats', 'message_total')
+            pipe = self.redis_client.pipeline()
+            pipe.incrby(pending_key, amount)
+            pipe.sadd(self.COUNTERS_DIRTY_KEY, room_id)
+            pipe.get(total_key)
+            pending, _, total = pipe.execute()
+            return int(total or 0) + pending
         except Exception as e:
             logger.error(f"Error incrementing message count: {str(e)}")
             return 0
 
-    def get_room_stats(self, room_id: str) -> Dict[str, int]:
-        """Get comprehensive room statistics"""
+    def take_pending_counts(self, count: int = 500) -> Dict[str, int]:
+        """Pop dirty rooms and move their pending counts into the mirrored totals"""
+        try:
+            room_ids = self.redis_client.spop(self.COUNTERS_DIRTY_KEY, count) or []
+            moved = self._run_script('move_pending', [
+                ([room_key(room_id, 'stats', 'message_count', 'pending'),
+                  room_key(room_id, 'stats', 'message_total')], [])
+                for room_id in room_ids
+            ])
+            return {room_id: int(n) for room_id, n in zip(room_ids, moved) if int(n)}
+        except Exception as e:
+            logger.error(f"Error taking pending message counts: {str(e)}")
+            return {}
+
+    def restore_pending_counts(self, counts: Dict[str, int]) -> bool:
+        """Put counts back after a failed flush so the next run retries them"""
+        try:
+            pipe = self.redis_client.pipeline()
+            for room_id, n in counts.items():
+                pipe.decrby(room_key(room_id, 'stats', 'message_total'), n)
+                pipe.incrby(room_key(room_id, 'stats', 'message_count', 'pending'), n)
+                pipe.sadd(self.COUNTERS_DIRTY_KEY, room_id)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error restoring pending message counts: {str(e)}")
+            return False
+
+    def set_message_totals(self, totals: Dict[str, int]) -> bool:
+        """Overwrite mirrored totals with the durable counter values"""
+        try:
+            pipe = self.redis_client.pipeline()
+            for room_id, total in totals.items():
+                pipe.set(room_key(room_id, 'stats', 'message_total'), total)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error setting message totals: {str(e)}")
+            return False
+
+    def _load_message_totals(self, room_ids: List[str]) -> Dict[str, int]:
+        """Read durable counts from Scylla, in one query, for rooms whose Redis mirror is missing"""
+        if not room_ids:
+            return {}
         try:
-            message_count_key = f"room:{room_id}:stats:message_count"
-            online_users_key = f"room:{room_id}:online_users"
-            typing_users_key = f"room:{room_id}:typing_users"
+            from .scylla_writer import get_room_counters
+            durable = get_room_counters(room_ids)
+            totals = {room_id: durable.get(str(room_id), 0) for room_id in room_ids}
+            pipe = self.redis_client.pipeline()
+            for room_id, total in totals.items():
+                pipe.setnx(room_key(room_id, 'stats', 'message_total'), total)
+            pipe.execute()
+            return totals
+        except Exception as e:
+            logger.error(f"Error loading durable message counts: {str(e)}")
+            return {}
+
+    def _add_pending(self, room_ids: List[str], mirrored: List, pending: List) -> Dict[str, int]:
+        """Mirrored total (loaded from Scylla where missing) plus pending count per room"""
+        loaded = self._load_message_totals([room_id for room_id, total in zip(room_ids, mirrored) if total is None])
+        return {room_id: int(loaded.get(room_id, 0) if total is None else total) + int(count or 0)
+                for room_id, total, count in zip(room_ids, mirrored, pending)}
 
-            # Get counts using pipeline for efficiency
+    def get_message_totals(self, room_ids: List[str]) -> Optional[Dict[str, int]]:
+        """Message count per room as the app reports it, or None when Redis is unreachable"""
+        try:
             pipe = self.redis_client.pipeline()
-            pipe.get(message_count_key)
-            pipe.hlen(online_users_key)
-            pipe.hlen(typing_users_key)
+            for room_id in room_ids:
+                pipe.get(room_key(room_id, 'stats', 'message_total'))
+                pipe.get(room_key(room_id, 'stats', 'message_count', 'pending'))
             results = pipe.execute()
+            return self._add_pending(room_ids, results[::2], results[1::2])
+        except Exception as e:
+            logger.error(f"Error getting message totals: {str(e)}")
+            return None
 
+    def get_rooms_stats(self, room_ids: List[str]) -> Dict[str, Dict]:
+        """get_room_stats for many rooms: one pipeline plus at most one Scylla query for missing mirrors"""
+        room_ids = [str(room_id) for room_id in room_ids]
+        now = datetime.now().isoformat()
+        try:
+            pipe = self.redis_client.pipeline()
+            for room_id in room_ids:
+                pipe.get(room_key(room_id, 'stats', 'message_total'))
+                pipe.get(room_key(room_id, 'stats', 'message_count', 'pending'))
+                pipe.hlen(room_key(room_id, 'online_users'))
+                pipe.hlen(room_key(room_id, 'typing_users'))
+            results = pipe.execute()
+            totals = self._add_pending(room_ids, results[0::4], results[1::4])
             return {
-                'total_messages': int(results[0] or 0),
-                'online_users_count': results[1] or 0,
-                'typing_users_count': results[2] or 0,
-                'last_activity': datetime.now().isoformat()
+                room_id: {
+                    'total_messages': totals[room_id],
+                    'online_users_count': online or 0,
+                    'typing_users_count': typing or 0,
+                    'last_activity': now
+                }
+                for room_id, online, typing in zip(room_ids, results[2::4], results[3::4])
             }
         except Exception as e:
             logger.error(f"Error getting room stats: {str(e)}")
-            return {
+            return {room_id: {
                 'total_messages': 0,
                 'online_users_count': 0,
                 'typing_users_count': 0,
-                'last_activity': datetime.now().isoformat()
-            }
+                'last_activity': now
+            } for room_id in room_ids}
+
+    def get_room_stats(self, room_id: str) -> Dict[str, int]:
+        """Get comprehensive room statistics"""
+        return self.get_rooms_stats([room_id])[str(room_id)]
 
     def cleanup_room(self, room_id: str) -> bool:
         """Clean up all Redis data for a room"""
         try:
-            keys = [
-                f"room:{room_id}:*"
-            ]
+            pattern = room_key(room_id, '*')
+            if self.is_cluster:
+                # All room keys share one slot, so only the node owning it needs scanning
+                node = self.redis_client.get_node_from_key(room_key(room_id))
+                keys_to_delete = list(self.redis_client.scan_iter(match=pattern, count=500, target_nodes=node))
+            else:
+                keys_to_delete = list(self.redis_client.scan_iter(match=pattern, count=500))
 
-            for pattern in keys:
-                keys_to_delete = self.redis_client.keys(pattern)
-                if keys_to_delete:
-                    self.redis_client.delete(*keys_to_delete)
+            for start in range(0, len(keys_to_delete), 500):
+                self.redis_client.delete(*keys_to_delete[start:start + 500])
 
             logger.info(f"Cleaned up Redis data for room {room_id}")
             return True
@@ -248,29 +1209,79 @@ class RedisChatService:
             return False
 
     # Rate limiting
+    # Fixed window counter. EXPIRE ... NX would need Redis 7, so the script sets the TTL itself when
+    # the key has none (first hit, or a key left without one); runs on any version with scripting
+    _RATE_LIMIT_SCRIPT = """
+    local current = redis.call('INCR', KEYS[1])
+    if redis.call('TTL', KEYS[1]) < 0 then
+        redis.call('EXPIRE', KEYS[1], ARGV[1])
+    end
+    return current
+    """
+
     def check_rate_limit(self, user_id: str, action: str, limit: int = 10, window: int = 60) -> bool:
         """Check if user has exceeded rate limit for an action"""
         try:
-            key = f"rate_limit:{user_id}:{action}"
-            current = self.redis_client.get(key)
-
-            if current is None:
-                self.redis_client.setex(key, window, 1)
-                return True
-            elif int(current) < limit:
-                self.redis_client.incr(key)
-                return True
-            else:
-                return False
+            key = f"rate_limit:{{{user_id}}}:{action}"
+            return self.scripts['rate_limit'](keys=[key], args=[window]) <= limit
         except Exception as e:
             logger.error(f"Error checking rate limit: {str(e)}")
             return True  # Allow on error
 
+    # Idempotent writes
+    # A client-supplied key is claimed with SET NX in user:{id}:idempotency:{scope}:{key}. While the
+    # write runs the entry is pending with a short TTL, so a worker that dies mid-write frees it;
+    # the finished response then replaces it for IDEMPOTENCY_TTL and is replayed on retries.
+    # SET with both NX and GET needs Redis 7.0; an older server rejects it on every call, and that
+    # is raised rather than treated like an outage, which would quietly turn deduplication off.
+    IDEMPOTENCY_TTL = getattr(settings, 'CHAT_IDEMPOTENCY_TTL', 86400)
+    IDEMPOTENCY_PENDING_TTL = 60
+
+    def claim_idempotency_key(self, user_id: str, scope: str, key: str, fingerprint: str) -> Optional[Dict]:
+        """
+        Claim a key before a write. None means the caller holds the claim and should write;
+        otherwise the entry already stored under the key is returned.
+        """
+        try:
+            stored = self.redis_client.set(
+                user_key(user_id, 'idempotency', scope, key),
+                json.dumps({'state': 'pending', 'fingerprint': fingerprint}),
+                nx=True, ex=self.IDEMPOTENCY_PENDING_TTL, get=True)
+            return json.loads(stored) if stored else None
+        except redis.ResponseError as e:
+            logger.error(f"Redis rejected the idempotency claim, Redis 7.0+ is required: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Error claiming idempotency key: {str(e)}")
+            return None  # Write without deduplication rather than fail the request while Redis is down
+
+    def store_idempotent_response(self, user_id: str, scope: str, key: str, fingerprint: str,
+                                  status: int, body) -> bool:
+        """Keep the response of a finished write for replay"""
+        try:
+            self.redis_client.set(
+                user_key(user_id, 'idempotency', scope, key),
+                json.dumps({'state': 'done', 'fingerprint': fingerprint, 'status': status, 'body': body}, default=str),
+                ex=self.IDEMPOTENCY_TTL)
+            return True
+        except Exception as e:
+            logger.error(f"Error storing idempotent response: {str(e)}")
+            return False
+
+    def release_idempotency_key(self, user_id: str, scope: str, key: str) -> bool:
+        """Drop the claim of a write that failed, so a retry runs it again"""
+        try:
+            self.redis_client.delete(user_key(user_id, 'idempotency', scope, key))
+            return True
+        except Exception as e:
+            logger.error(f"Error releasing idempotency key: {str(e)}")
+            return False
+
     # Message search cache
     def cache_search_results(self, query: str, room_id: str, results: List[Dict], ttl: int = 300) -> bool:
         """Cache search results"""
         try:
-            key = f"search:{room_id}:{hash(query)}"
+            key = room_key(room_id, 'search', hash(query))
             self.redis_client.setex(key, ttl, json.dumps(results))
             return True
         except Exception as e:
@@ -280,7 +1291,7 @@ class RedisChatService:
     def get_cached_search_results(self, query: str, room_id: str) -> Optional[List[Dict]]:
         """Get cached search results"""
         try:
-            key = f"search:{room_id}:{hash(query)}"
+            key = room_key(room_id, 'search', hash(query))
             cached = self.redis_client.get(key)
             return json.loads(cached) if cached else None
         except Exception as e:
@@ -0,0 +1,259 @@
+# chat/services/scylla_writer.py - Prepared message reads/writes and counter updates for ScyllaDB
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+from cassandra import OperationTimedOut, ReadTimeout, Unavailable, WriteTimeout
+from cassandra.cluster import NoHostAvailable
+from cassandra.cqlengine import CQLEngineException, connection
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import BatchStatement, BatchType, SimpleStatement
+from ..models import MessageScylla, RoomCounterScylla, MessageReactionScylla
+from .circuit_breaker import get_breaker
+
+logger = logging.getLogger(__name__)
+
+# Request-path reads and writes go through this breaker; background workers retry on their own
+scylla_breaker = get_breaker('scylla', (NoHostAvailable, OperationTimedOut, ReadTimeout, WriteTimeout,
+                                        Unavailable, CQLEngineException))
+
+# Scylla warns on batches above a few KB; keep single-partition batches small
+MAX_BATCH_ROWS = 50
+
+_prepared = {}
+
+
+def _prepare(name, query):
+    session = connection.get_session()
+    key = (name, id(session))
+    if key not in _prepared:
+        _prepared[key] = session.prepare(query)
+    return _prepared[key]
+
+
+def get_insert_statement():
+    """Prepared INSERT for MessageScylla, prepared once per session"""
+    statement = _prepare(
+        'message_insert',
+        f'INSERT INTO {MessageScylla.column_family_name()} '
+        f'(room, created_at, id, "user", content, media, edited_at, reply_to) '
+        f'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+    )
+    # Re-inserting the same primary key is an upsert, so retries are safe
+    statement.is_idempotent = True
+    return statement
+
+
+def write_message(message: Dict) -> None:
+    """Insert a single message payload"""
+    with scylla_breaker.guard():
+        session = connection.get_session()
+        session.execute(get_insert_statement(), message_to_row(message), execution_profile='message_write')
+
+
+MESSAGE_COLUMNS = 'id, room, "user", content, media, created_at, edited_at, reply_to'
+
+
+def get_room_messages(room_id: str, limit: int = 50, before_time: datetime = None) -> List:
+    """Newest-first page of a room partition as rows with model attribute names"""
+    table = MessageScylla.column_family_name()
+    with scylla_breaker.guard():
+        session = connection.get_session()
+        if before_time:
+            select = _prepare('messages_before', f'SELECT {MESSAGE_COLUMNS} FROM {table} WHERE room = ? AND created_at < ? LIMIT ?')
+            params = (str(room_id), before_time, limit)
+        else:
+            select = _prepare('messages_latest', f'SELECT {MESSAGE_COLUMNS} FROM {table} WHERE room = ? LIMIT ?')
+            params = (str(room_id), limit)
+        select.is_idempotent = True
+        return list(session.execute(select, params, execution_profile='history_read'))
+
+
+def get_rows_at(room_id: str, created_at: datetime) -> List:
+    """Every message of a room with exactly this created_at"""
+    table = MessageScylla.column_family_name()
+    with scylla_breaker.guard():
+        session = connection.get_session()
+        select = _prepare('messages_at', f'SELECT {MESSAGE_COLUMNS} FROM {table} WHERE room = ? AND created_at = ?')
+        select.is_idempotent = True
+        return list(session.execute(select, (str(room_id), created_at), execution_profile='history_read'))
+
+
+def iter_room_pages(room_id: str, page_size: int = 1000) -> Iterator[List]:
+    """Walk a room partition newest-first, one driver page at a time. Each page fetch goes through the
+    breaker on its own, so a consumer that is slow between pages never holds a half-open probe."""
+    statement = SimpleStatement(
+        f'SELECT {MESSAGE_COLUMNS} FROM {MessageScylla.column_family_name()} WHERE room = %s',
+        fetch_size=page_size
+    )
+    with scylla_breaker.guard():
+        result = connection.get_session().execute(statement, (str(room_id),), execution_profile='history_read')
+    while True:
+        rows = result.current_rows
+        if rows:
+            yield rows
+        if not result.has_more_pages:
+            break
+        with scylla_breaker.guard():
+            result.fetch_next_page()
+
+
+def count_room_messages(room_id: str, page_size: int = 5000) -> int:
+    """Rows in a room partition, counted page by page so a large room cannot time out one query"""
+    statement = SimpleStatement(
+        f'SELECT id FROM {MessageScylla.column_family_name()} WHERE room = %s',
+        fetch_size=page_size
+    )
+    with scylla_breaker.guard():
+        result = connection.get_session().execute(statement, (str(room_id),), execution_profile='default')
+    count = len(result.current_rows)
+    while result.has_more_pages:
+        with scylla_breaker.guard():
+            result.fetch_next_page()
+        count += len(result.current_rows)
+    return count
+
+
+def _parse_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _parse_uuid(value):
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    return uuid.UUID(value)
+
+
+def message_to_row(message: Dict) -> tuple:
+    """Convert a message payload (as returned by MessageView.post) to insert parameters"""
+    return (
+        str(message['room']),
+        _parse_datetime(message['created_at']),
+        _parse_uuid(message['id']),
+        str(message['user']),
+        message.get('content', ''),
+        list(message.get('media') or []),
+        _parse_datetime(message.get('edited_at')),
+        _parse_uuid(message.get('reply_to')),
+    )
+
+
+def group_by_partition(messages: Iterable[Dict]) -> Dict[str, List[tuple]]:
+    """Group message payloads by their room partition"""
+    partitions = defaultdict(list)
+    for message in messages:
+        row = message_to_row(message)
+        partitions[row[0]].append(row)
+    return partitions
+
+
+def write_messages_batched(messages: Iterable[Dict]) -> int:
+    """Write messages as unlogged single-partition batches, returns rows written"""
+    session = connection.get_session()
+    insert = get_insert_statement()
+    written = 0
+
+    for room, rows in group_by_partition(messages).items():
+        for start in range(0, len(rows), MAX_BATCH_ROWS):
+            chunk = rows[start:start + MAX_BATCH_ROWS]
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            batch.is_idempotent = True
+            for row in chunk:
+                batch.add(insert, row)
+            session.execute(batch, execution_profile='message_write')
+            written += len(chunk)
+
+    return written
+
+
+def increment_room_counters(counts: Dict[str, int]) -> List[str]:
+    """
+    Add message counts to the durable per-room counters, returns the rooms applied. Counter updates
+    cannot be repeated safely, so this stops at the first failure and leaves the caller to put back
+    exactly the counts that were not written.
+    """
+    session = connection.get_session()
+    update = _prepare(
+        'room_counter_update',
+        f'UPDATE {RoomCounterScylla.column_family_name()} SET message_count = message_count + ? WHERE room = ?'
+    )
+    applied = []
+    for room_id, count in counts.items():
+        if count:
+            try:
+                session.execute(update, (count, str(room_id)), execution_profile='counter_update')
+            except Exception as e:
+                logger.error(f"Failed to increment message counter of room {room_id}: {str(e)}")
+                break
+        applied.append(room_id)
+    return applied
+
+
+def get_room_counters(room_ids: List[str]) -> Dict[str, int]:
+    """Read durable per-room message counts"""
+    if not room_ids:
+        return {}
+    with scylla_breaker.guard():
+        session = connection.get_session()
+        select = _prepare(
+            'room_counter_select',
+            f'SELECT room, message_count FROM {RoomCounterScylla.column_family_name()} WHERE room IN ?'
+        )
+        select.is_idempotent = True
+        rows = session.execute(select, ([str(room_id) for room_id in room_ids],), execution_profile='state_read')
+    return {row.room: row.message_count or 0 for row in rows}
+
+
+def save_reactions(reactions: Dict[tuple, Dict], concurrency: int = 50) -> List[tuple]:
+    """Overwrite reaction counts and reactors keyed by (room, message_id), returns keys that failed"""
+    if not reactions:
+        return []
+    session = connection.get_session()
+    update = _prepare(
+        'reaction_update',
+        f'UPDATE {MessageReactionScylla.column_family_name()} SET counts = ?, reactors = ? '
+        f'WHERE room = ? AND message_id = ?'
+    )
+    update.is_idempotent = True
+    keys = list(reactions)
+    params = [(reactions[key]['counts'], set(reactions[key]['reactors']), str(key[0]), _parse_uuid(key[1]))
+              for key in keys]
+    results = execute_concurrent_with_args(session, update, params, concurrency=concurrency,
+                                           raise_on_first_error=False, execution_profile='message_write')
+    return [key for key, (success, _) in zip(keys, results) if not success]
+
+
+def get_reaction_counts(room_id: str, message_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    """Read aggregated reaction counts for messages in one room partition"""
+    if not message_ids:
+        return {}
+    with scylla_breaker.guard():
+        session = connection.get_session()
+        select = _prepare(
+            'reaction_select',
+            f'SELECT message_id, counts FROM {MessageReactionScylla.column_family_name()} '
+            f'WHERE room = ? AND message_id IN ?'
+        )
+        select.is_idempotent = True
+        rows = session.execute(select, (str(room_id), [_parse_uuid(message_id) for message_id in message_ids]),
+                               execution_profile='history_read')
+    return {str(row.message_id): dict(row.counts or {}) for row in rows}
+
+
+def get_reaction_state(room_id: str, message_id: str) -> Tuple[Dict[str, int], List[str]]:
+    """Read a message's reaction counts and reactors ("{user_id}:{emoji}") for re-seeding Redis"""
+    with scylla_breaker.guard():
+        session = connection.get_session()
+        select = _prepare(
+            'reaction_state_select',
+            f'SELECT counts, reactors FROM {MessageReactionScylla.column_family_name()} '
+            f'WHERE room = ? AND message_id = ?'
+        )
+        select.is_idempotent = True
+        row = session.execute(select, (str(room_id), _parse_uuid(message_id)), execution_profile='state_read').one()
+    if row is None:
+        return {}, []
+    return dict(row.counts or {}), sorted(row.reactors or ())
@@ -1,7 +1,8 @@
 # chat/signals.py
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from space.models import Space
+from space.models import Space, SpaceMembership
 from teams.models import Team
 import logging
 
@@ -42,4 +43,89 @@ def create_team_chat_room(sender, instance, created, **kwargs):
             )
             logger.info(f"Default chat room created for team {instance.id}")
         except Exception as e:
-            logger.error(f"Failed to create default chat room for team {instance.id}: {str(e)}")
\ No newline at end of file
+            logger.error(f"Failed to create default chat room for team {instance.id}: {str(e)}")
+
+def publish_member_added(space_id, user_id):
+    """
+    Add a user to the mention tries of every process once the membership is committed.
+    """
+    def publish():
+        try:
+            from chat.services.mention_service import record_member_change
+            from outh.models import User
+
+            username = User.objects.filter(pk=user_id).values_list('username', flat=True).first()
+            if username:
+                record_member_change(space_id, 'add', user_id, username)
+        except Exception as e:
+            logger.error(f"Failed to publish member added to space {space_id}: {str(e)}")
+
+    if space_id:
+        transaction.on_commit(publish)
+
+def publish_member_removed(space_id, user_id):
+    """
+    Remove a user from the mention tries once the removal is committed, unless a space, team or
+    room membership still makes them mentionable in the space.
+    """
+    def publish():
+        try:
+            from chat.permissions import space_room_members
+            from chat.services.mention_service import record_member_change
+
+            if not space_room_members(space_id, [user_id]).exists():
+                record_member_change(space_id, 'remove', user_id)
+        except Exception as e:
+            logger.error(f"Failed to publish member removed from space {space_id}: {str(e)}")
+
+    if space_id:
+        transaction.on_commit(publish)
+
+@receiver(post_save, sender=SpaceMembership)
+def publish_space_member_added(sender, instance, created, **kwargs):
+    if created:
+        publish_member_added(instance.space_id, instance.user_id)
+
+@receiver(post_delete, sender=SpaceMembership)
+def publish_space_member_removed(sender, instance, **kwargs):
+    publish_member_removed(instance.space_id, instance.user_id)
+
+def publish_team_member_added(sender, instance, created, **kwargs):
+    if created:
+        publish_member_added(Team.objects.filter(pk=instance.team_id).values_list('space_id', flat=True).first(),
+                             instance.user_id)
+
+def publish_team_member_removed(sender, instance, **kwargs):
+    publish_member_removed(Team.objects.filter(pk=instance.team_id).values_list('space_id', flat=True).first(),
+                           instance.user_id)
+
+def publish_room_member_added(sender, instance, created, **kwargs):
+    if created:
+        publish_member_added(instance.chat_room.space_id, instance.user_id)
+
+def publish_room_member_removed(sender, instance, **kwargs):
+    publish_member_removed(instance.chat_room.space_id, instance.user_id)
+
+post_save.connect(publish_team_member_added, sender='teams.Member')
+post_delete.connect(publish_team_member_removed, sender='teams.Member')
+post_save.connect(publish_room_member_added, sender='chat.ChatRoomMembership')
+post_delete.connect(publish_room_member_removed, sender='chat.ChatRoomMembership')
+
+def invalidate_moderation_terms(sender, instance, **kwargs):
+    """
+    Recompile a space's moderation automaton once a term change is committed.
+    """
+    space_id = instance.space_id
+
+    def invalidate():
+        try:
+            from chat.services.moderation_service import invalidate_space_terms
+
+            invalidate_space_terms(space_id)
+        except Exception as e:
+            logger.error(f"Failed to invalidate moderation terms for space {space_id}: {str(e)}")
+
+    transaction.on_commit(invalidate)
+
+post_save.connect(invalidate_moderation_terms, sender='chat.ModerationTerm')
+post_delete.connect(invalidate_moderation_terms, sender='chat.ModerationTerm')
@@ -0,0 +1,100 @@
+from unittest import mock
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase
+from .. import metrics
+from ..middleware import (
+    CONNECT_RETRY_MIN_SECONDS, TRY_AGAIN_LATER_CLOSE_CODE, ConnectAdmission, ConnectAdmissionMiddleware,
+)
+from .utils import LOCAL_SERVICES
+
+
+class PatchedClockMixin:
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        self.jitter = 0.0  # Fraction of the spread random.uniform returns
+        patches = {
+            'chat.middleware.time.monotonic': lambda: self.now,
+            'chat.middleware.random.uniform': lambda low, high: low + (high - low) * self.jitter,
+        }
+        for target, replacement in patches.items():
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class ConnectAdmissionTests(PatchedClockMixin, SimpleTestCase):
+    def test_admits_a_burst_then_refills_at_the_rate(self):
+        admission = ConnectAdmission(rate=10, burst=3)
+        self.assertEqual([admission.admit() for _ in range(3)], [None] * 3)
+        self.assertIsNotNone(admission.admit())
+
+        self.now += 0.1  # One token back
+        self.assertIsNone(admission.admit())
+        self.assertIsNotNone(admission.admit())
+
+        self.now += 60  # Never more than the burst
+        self.assertEqual([admission.admit() is None for _ in range(4)], [True, True, True, False])
+
+    def test_zero_rate_admits_everything(self):
+        admission = ConnectAdmission(rate=0, burst=1)
+        self.assertEqual({admission.admit() for _ in range(100)}, {None})
+
+    def test_retries_spread_over_the_time_to_admit_them(self):
+        admission = ConnectAdmission(rate=2, burst=1)
+        admission.admit()
+        self.jitter = 1.0
+        # The n-th client turned away this second may be sent up to n / rate seconds out, at least the minimum
+        retries = [admission.admit() for _ in range(4)]
+        self.assertEqual(retries, [CONNECT_RETRY_MIN_SECONDS + max(n / 2, CONNECT_RETRY_MIN_SECONDS)
+                                   for n in range(1, 5)])
+        self.jitter = 0.0
+        self.assertEqual(admission.admit(), CONNECT_RETRY_MIN_SECONDS)
+
+        # The spread starts over each second
+        self.now += 1.0
+        admission.tokens = 0
+        admission.updated = self.now
+        self.jitter = 1.0
+        self.assertEqual(admission.admit(), CONNECT_RETRY_MIN_SECONDS * 2)
+
+
+class Accept(AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.accept()
+        await self.send(text_data='{"type": "welcome"}')
+
+
+@LOCAL_SERVICES
+class ConnectAdmissionMiddlewareTests(PatchedClockMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.application = ConnectAdmissionMiddleware(Accept.as_asgi(), ConnectAdmission(rate=1, burst=1))
+
+    async def test_connect_over_the_rate_is_told_when_to_retry_and_closed(self):
+        rejected = metrics.snapshot()['counters'].get('ws_connects_rejected', 0)
+        admitted = WebsocketCommunicator(self.application, '/ws/chat/')
+        self.assertTrue((await admitted.connect())[0])
+        self.assertEqual(await admitted.receive_json_from(), {'type': 'welcome'})
+
+        self.jitter = 0.5
+        turned_away = WebsocketCommunicator(self.application, '/ws/chat/')
+        self.assertTrue((await turned_away.connect())[0])
+        retry_after_ms = int((CONNECT_RETRY_MIN_SECONDS + CONNECT_RETRY_MIN_SECONDS * 0.5) * 1000)
+        self.assertEqual(await turned_away.receive_json_from(), {
+            'type': 'connection_rejected', 'reason': 'overloaded', 'retry_after_ms': retry_after_ms})
+        self.assertEqual(await turned_away.receive_output(), {
+            'type': 'websocket.close', 'code': TRY_AGAIN_LATER_CLOSE_CODE,
+            'reason': f"retry_after_ms={retry_after_ms}"})
+        self.assertEqual(metrics.snapshot()['counters']['ws_connects_rejected'], rejected + 1)
+
+        await admitted.disconnect()
+        await turned_away.wait()
+
+    async def test_other_scopes_pass_through(self):
+        self.application.admission.tokens = 0
+        inner = mock.AsyncMock()
+        application = ConnectAdmissionMiddleware(inner, self.application.admission)
+        await application({'type': 'http'}, None, None)
+        inner.assert_awaited_once()
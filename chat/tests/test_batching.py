@@ -0,0 +1,100 @@
+import asyncio
+import json
+from unittest import mock
+from django.test import SimpleTestCase
+from .. import consumers
+from ..consumers import ChatConsumer
+
+
+def summary(frame):
+    """A message's id, a batch's list of ids, or any other frame's type"""
+    if frame['type'] == 'new_message':
+        return frame['message']['id']
+    if frame['type'] == 'messages_batch':
+        return [message['id'] for message in frame['messages']]
+    return frame['type']
+
+
+class AdaptiveBatchingTests(SimpleTestCase):
+    """Room events driven into one consumer above and below CHAT_BATCH_THRESHOLD, on a loop clock the test moves"""
+
+    def setUp(self):
+        for name, value in (('BATCH_THRESHOLD', 4), ('BATCH_WINDOW_SECONDS', 0.01)):
+            patcher = mock.patch.object(consumers, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.offset = 0.0
+
+    def patch_loop_clock(self):
+        loop = asyncio.get_running_loop()
+        clock = loop.time
+        loop.time = lambda: clock() + self.offset
+        self.addCleanup(vars(loop).pop, 'time')
+
+    def consumer(self):
+        consumer = ChatConsumer()
+        consumer.room_id = 'room'
+        consumer.user = mock.Mock(user_id='user-1')
+        consumer.sent = []
+
+        async def send(text_data=None, **kwargs):
+            consumer.sent.append(json.loads(text_data))
+        consumer.send = send
+        consumer.start_writer()
+        self.addCleanup(consumer.stop_writer)
+        return consumer
+
+    async def deliver(self, consumer, *ids):
+        for message_id in ids:
+            await consumer.new_message({'message': {'id': message_id}})
+
+    async def frames(self, consumer, wait=0.0):
+        await asyncio.sleep(wait)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        frames, consumer.sent = consumer.sent, []
+        return [summary(frame) for frame in frames]
+
+    async def test_batches_above_the_threshold_until_the_rate_halves(self):
+        self.patch_loop_clock()
+        consumer = self.consumer()
+
+        await self.deliver(consumer, 0, 1, 2, 3, 4)
+        self.assertEqual(await self.frames(consumer), [0, 1, 2, 3, 4])
+        self.assertFalse(consumer.batching)
+
+        # 5 events in the last second: buffered from here, sent together once the window passes
+        self.offset += 1.0
+        await self.deliver(consumer, 5, 6, 7)
+        self.assertTrue(consumer.batching)
+        self.assertEqual(await self.frames(consumer), [])
+        self.assertEqual(await self.frames(consumer, wait=0.05), [[5, 6, 7]])
+
+        # 3 a second is below the threshold but above half of it: still batching
+        self.offset += 1.0
+        await self.deliver(consumer, 8)
+        self.assertTrue(consumer.batching)
+
+        # 1 a second turns it off; the message joins the batch still buffered rather than overtaking it
+        self.offset += 1.0
+        await self.deliver(consumer, 9)
+        self.assertFalse(consumer.batching)
+        self.assertEqual(await self.frames(consumer, wait=0.05), [[8, 9]])
+        await self.deliver(consumer, 10)
+        self.assertEqual(await self.frames(consumer), [10])
+
+    async def test_buffered_batch_goes_out_before_any_other_frame(self):
+        self.patch_loop_clock()
+        consumer = self.consumer()
+        await self.deliver(consumer, *range(5))
+        await self.frames(consumer)
+
+        self.offset += 1.0
+        await self.deliver(consumer, 5, 6)
+        await consumer.message_updated({'message': {'id': 5}})
+        await consumer.message_deleted({'message_id': 6})
+        self.assertEqual(await self.frames(consumer), [[5, 6], 'message_updated', 'message_deleted'])
+
+        # The cancelled timer sends nothing more
+        self.assertEqual(await self.frames(consumer, wait=0.05), [])
+        self.assertIsNone(consumer.batch_flush_task)
@@ -0,0 +1,88 @@
+from unittest import mock
+from django.test import SimpleTestCase
+from ..services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Down(Exception):
+    pass
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('chat.services.circuit_breaker.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', failure_exceptions=(Down,), failure_threshold=3, reset_timeout=10)
+
+    def fail(self, exception=Down):
+        def raise_():
+            raise exception()
+        with self.assertRaises(exception):
+            self.breaker.call(raise_)
+
+    def open_breaker(self):
+        for _ in range(3):
+            self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail()
+        self.fail()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: 'not called')
+
+    def test_success_resets_the_failure_count(self):
+        self.fail()
+        self.fail()
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.fail()
+        self.fail()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_other_exceptions_mean_the_dependency_answered(self):
+        self.fail()
+        self.fail()
+        self.fail(ValueError)
+        self.fail()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.open_breaker()
+        self.now += 9.9
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+
+        self.now += 0.1
+        self.assertEqual(self.breaker.snapshot()['state'], HALF_OPEN)
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_successful_probe_closes(self):
+        self.open_breaker()
+        self.now += 10
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.snapshot(), {'state': CLOSED, 'failures': 0})
+
+    def test_failed_probe_reopens_for_another_timeout(self):
+        self.open_breaker()
+        self.now += 10
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now += 9.9
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: 'not called')
+        self.now += 0.1
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+
+    def test_interrupted_probe_frees_the_probe_slot(self):
+        self.open_breaker()
+        self.now += 10
+        self.fail(KeyboardInterrupt)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
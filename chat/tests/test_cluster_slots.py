@@ -0,0 +1,61 @@
+import uuid
+from redis.crc import key_slot
+from django.test import SimpleTestCase
+from ..services.redis_service import redis_chat_service, room_key, space_key, user_key
+from .utils import FakeRedisMixin, requires_fakeredis
+
+# Commands whose every argument is a key, so on a cluster they must stay within one slot
+MULTI_KEY_COMMANDS = {'DEL', 'UNLINK', 'EXISTS', 'MGET', 'SUNION', 'SINTER', 'SDIFF'}
+
+
+@requires_fakeredis
+class ClusterSlotTests(FakeRedisMixin, SimpleTestCase):
+    """Without a cluster to run against, check that the keys of every script call and multi-key command
+    hash to one slot, which is what a cluster requires of them"""
+
+    def setUp(self):
+        super().setUp()
+        redis_chat_service.is_cluster = True
+        self.calls = []
+        for name, script in list(redis_chat_service.scripts.items()):
+            redis_chat_service.scripts[name] = self.recording(name, script)
+        execute_command = self.redis.execute_command
+
+        def record_command(*args, **options):
+            if str(args[0]).upper() in MULTI_KEY_COMMANDS and len(args) > 2:
+                self.calls.append((args[0], list(args[1:])))
+            return execute_command(*args, **options)
+        self.redis.execute_command = record_command
+
+    def recording(self, name, script):
+        def call(keys=(), args=(), client=None):
+            self.calls.append((name, list(keys)))
+            return script(keys=keys, args=args, client=client)
+        return call
+
+    def assertSingleSlot(self):
+        for name, keys in self.calls:
+            self.assertEqual(len({key_slot(key.encode()) for key in keys}), 1, f"{name} spans slots: {keys}")
+
+    def test_key_helpers_hash_on_the_id(self):
+        for make_key in (room_key, user_key, space_key):
+            self.assertEqual(key_slot(make_key('a', 'x', 'y').encode()), key_slot(make_key('a').encode()))
+
+    def test_scripts_and_multi_key_commands_stay_in_one_slot(self):
+        room_id, space_id, user_id, message_id = (str(uuid.uuid4()) for _ in range(4))
+        service = redis_chat_service
+        service.set_user_online(room_id, user_id, space_id)
+        service.set_user_offline(room_id, user_id, space_id, leaving=True)
+        service.seed_reactions(room_id, message_id, {'👍': 1}, [f"{uuid.uuid4()}:👍"])
+        service.react(room_id, message_id, user_id, '👍')
+        _, taken = service.take_dirty_reactions(10)
+        service.clear_dirty_reactions({key: state['version'] for key, state in taken.items()})
+        service.record_throughput(room_id, user_id)
+        service.increment_message_count(room_id)
+        service.take_pending_counts(10)
+        service.get_rooms_stats([room_id])
+        service.check_rate_limit(user_id, 'send')
+
+        self.assertEqual({name for name, _ in self.calls} & set(service.scripts), set(service.scripts),
+                         'every script needs a call in this scenario')
+        self.assertSingleSlot()
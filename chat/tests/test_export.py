@@ -0,0 +1,77 @@
+import gzip
+import json
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+from rest_framework.test import APIClient
+from ..services.export_service import stream_room_export
+from ..services.message_store import MessageStoreUnavailable, get_message_store
+from .utils import LOCAL_SERVICES, MemoryStoreMixin, make_room, make_user
+
+
+@LOCAL_SERVICES
+class StreamRoomExportTests(MemoryStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.room_id = str(uuid.uuid4())
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        get_message_store().write_messages({
+            'id': str(uuid.uuid4()), 'room': self.room_id, 'user': str(uuid.uuid4()),
+            'content': f"message {index}", 'created_at': (start + timedelta(seconds=index)).isoformat(),
+        } for index in range(25))
+
+    @async_to_sync
+    async def collect(self, chunks, **kwargs):
+        async for chunk in stream_room_export(self.room_id, **kwargs):
+            chunks.append(chunk)
+
+    def test_exports_every_message_newest_first(self):
+        chunks = []
+        self.collect(chunks, page_size=10)
+        lines = gzip.decompress(b''.join(chunks)).decode().splitlines()
+        self.assertEqual([json.loads(line)['content'] for line in lines],
+                         [f"message {index}" for index in reversed(range(25))])
+
+    def test_failure_mid_stream_raises_without_gzip_trailer(self):
+        store = get_message_store()
+        pages = store.iter_room_pages
+
+        def failing_pages(room_id, page_size):
+            iterator = pages(room_id, page_size=page_size)
+            yield next(iterator)
+            raise ConnectionError('store went away')
+
+        chunks = []
+        with mock.patch.object(store, 'iter_room_pages', failing_pages), self.assertRaises(ConnectionError):
+            self.collect(chunks, page_size=10)
+
+        self.assertTrue(chunks)
+        decompressor = zlib.decompressobj(31)
+        decompressor.decompress(b''.join(chunks))
+        self.assertFalse(decompressor.eof)
+
+
+@LOCAL_SERVICES
+class MessageExportViewTests(MemoryStoreMixin, TestCase):
+    def test_response_streams_asynchronously(self):
+        user = make_user()
+        room = make_room(members=[user])
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/chat/{room.space_id}/chat-rooms/{room.id}/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+
+    def test_unavailable_store_is_refused_before_streaming(self):
+        user = make_user()
+        room = make_room(members=[user])
+        client = APIClient()
+        client.force_authenticate(user)
+        unavailable = MessageStoreUnavailable('scylla circuit is open', retry_after=10)
+        with mock.patch.object(get_message_store(), 'get_room_messages', side_effect=unavailable):
+            response = client.get(f'/chat/{room.space_id}/chat-rooms/{room.id}/export/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
@@ -0,0 +1,57 @@
+import uuid
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from .. import fanout
+from ..fanout import announce_promotion, group_send_room, room_group_name, room_groups, shard_group_name
+from ..services.redis_service import redis_chat_service
+from .utils import (
+    LOCAL_SERVICES, FakeRedisMixin, connect_socket, make_room, make_user, received_frames, requires_fakeredis,
+)
+
+
+@requires_fakeredis
+@LOCAL_SERVICES
+class ShardedFanoutTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        fanout._shard_cache.clear()
+        self.addCleanup(fanout._shard_cache.clear)
+        self.user = make_user()
+        self.room = make_room(members=[self.user])
+        self.room_id = str(self.room.id)
+
+    async def promote(self):
+        await sync_to_async(redis_chat_service.promote_fanout)(self.room_id, 4)
+
+    async def publish(self):
+        fanout._shard_cache.clear()
+        await group_send_room(self.room_id, {'type': 'new_message', 'message': {'id': str(uuid.uuid4())}})
+
+    def test_sharded_room_publishes_to_shards_only(self):
+        self.assertEqual(room_groups(self.room_id), [room_group_name(self.room_id)])
+        redis_chat_service.promote_fanout(self.room_id, 4)
+        fanout._shard_cache.clear()
+        self.assertEqual(room_groups(self.room_id), [shard_group_name(self.room_id, shard) for shard in range(4)])
+
+    async def test_base_group_socket_joins_its_shard_on_promotion(self):
+        socket = await connect_socket(self.user, self.room)
+        await received_frames(socket)
+
+        await self.promote()
+        await announce_promotion(self.room_id)
+        await received_frames(socket)
+        await self.publish()
+
+        self.assertEqual([frame['type'] for frame in await received_frames(socket)], ['new_message'])
+        await socket.disconnect()
+
+    async def test_socket_with_stale_shard_count_joins_its_shard(self):
+        await self.promote()
+        fanout._shard_cache[self.room_id] = (1, float('inf'))  # Read before the promotion
+
+        socket = await connect_socket(self.user, self.room)
+        await received_frames(socket)
+        await self.publish()
+
+        self.assertEqual([frame['type'] for frame in await received_frames(socket)], ['new_message'])
+        await socket.disconnect()
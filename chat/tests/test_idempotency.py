@@ -0,0 +1,91 @@
+import uuid
+from unittest import mock
+import redis
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from ..idempotency import IdempotentWrite
+from ..services.redis_service import redis_chat_service
+from .utils import LOCAL_SERVICES, FakeRedisMixin, make_room, make_user, requires_fakeredis
+
+
+@requires_fakeredis
+class IdempotentWriteTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user_id = str(uuid.uuid4())
+
+    def write(self, payload=None, key='key-1'):
+        return IdempotentWrite(self.user_id, 'message:room', key, payload or {'content': 'hello'})
+
+    def test_first_claim_writes(self):
+        self.assertIsNone(self.write().outcome)
+
+    def test_retry_while_pending_is_in_progress(self):
+        self.write()
+        self.assertEqual(self.write().outcome, 'in_progress')
+
+    def test_completed_write_is_replayed(self):
+        self.write().complete(201, {'id': 'm1'})
+        retry = self.write()
+        self.assertEqual(retry.outcome, 'replay')
+        response = retry.replay()
+        self.assertEqual((response.status_code, response.data), (201, {'id': 'm1'}))
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_reused_key_with_another_payload_is_refused(self):
+        self.write().complete(201, {'id': 'm1'})
+        self.assertEqual(self.write({'content': 'other'}).outcome, 'mismatch')
+        self.assertEqual(self.write({'content': 'other'}).replay().status_code, 422)
+
+    def test_released_key_can_be_claimed_again(self):
+        self.write().release()
+        self.assertIsNone(self.write().outcome)
+
+    def test_keys_are_per_user(self):
+        self.write().complete(201, {'id': 'm1'})
+        self.user_id = str(uuid.uuid4())
+        self.assertIsNone(self.write().outcome)
+
+    def test_without_a_key_every_write_runs(self):
+        self.write(key=None).complete(201, {'id': 'm1'})
+        self.assertIsNone(self.write(key=None).outcome)
+
+    def test_rejected_claim_is_raised(self):
+        # What a server older than 7.0 answers to SET ... NX GET
+        rejected = redis.ResponseError('syntax error')
+        with mock.patch.object(self.redis, 'set', side_effect=rejected), self.assertRaises(redis.ResponseError):
+            self.write()
+
+    def test_outage_fails_open(self):
+        with mock.patch.object(self.redis, 'set', side_effect=redis.ConnectionError('down')):
+            self.assertIsNone(redis_chat_service.claim_idempotency_key(self.user_id, 'message:room', 'key-1', 'f'))
+
+
+@requires_fakeredis
+@LOCAL_SERVICES
+class MessageCreateIdempotencyTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = make_user()
+        room = make_room(members=[user])
+        self.url = f'/chat/{room.space_id}/chat-rooms/{room.id}/messages/'
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def post(self, content='hello', key='retry-1'):
+        return self.client.post(self.url, {'content': content}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post()
+        self.assertIn(first.status_code, (201, 202))
+        retry = self.post()
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.json()['id'], first.json()['id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_reused_key_for_another_message_is_refused(self):
+        self.post()
+        self.assertEqual(self.post(content='different').status_code, 422)
+
+    def test_malformed_key_is_refused(self):
+        self.assertEqual(self.post(key='x' * 256).status_code, 400)
@@ -0,0 +1,31 @@
+import io
+import uuid
+from collections import Counter
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from ..management.commands.import_chat_history import Command as ImportChatHistory
+from ..services.redis_service import redis_chat_service, room_key
+from .utils import FakeRedisMixin, requires_fakeredis
+
+
+@requires_fakeredis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RebuildDerivedStateTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room_id = str(uuid.uuid4())
+        self.redis.set(room_key(self.room_id, 'stats', 'message_total'), 0)
+
+    def rebuild(self, rows_in_store, imported):
+        with mock.patch('chat.management.commands.import_chat_history.count_room_messages',
+                        return_value=rows_in_store):
+            ImportChatHistory(stdout=io.StringIO()).rebuild_derived_state(Counter({self.room_id: imported}))
+        return redis_chat_service.get_message_totals([self.room_id])[self.room_id]
+
+    def test_rerunning_an_import_does_not_inflate_the_count(self):
+        self.assertEqual(self.rebuild(rows_in_store=10, imported=10), 10)
+        self.assertEqual(self.rebuild(rows_in_store=10, imported=10), 10)
+
+    def test_count_includes_messages_sent_before_the_import(self):
+        redis_chat_service.increment_message_count(self.room_id, 4)
+        self.assertEqual(self.rebuild(rows_in_store=14, imported=10), 14)
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from .. import consumers, metrics
+from ..services.redis_service import redis_chat_service, room_key
+from .utils import (
+    LOCAL_SERVICES, FakeRedisMixin, connect_socket, make_room, make_user, received_frames, requires_fakeredis,
+)
+
+PING_SECONDS = 0.1
+IDLE_SECONDS = 0.35
+
+
+@requires_fakeredis
+@LOCAL_SERVICES
+class IdleReapingTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for name, value in (('SERVER_PING_SECONDS', PING_SECONDS), ('IDLE_TIMEOUT_SECONDS', IDLE_SECONDS),
+                            ('PRESENCE_GRACE_SECONDS', 0), ('_sweeper', None)):
+            patcher = mock.patch.object(consumers, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        consumers._live.clear()
+        self.watcher, self.user = make_user(), make_user()
+        self.room = make_room(members=[self.watcher, self.user])
+        self.room_id = str(self.room.id)
+
+    async def outputs_until_closed(self, socket):
+        """Frame types a silent socket received up to its close, and the close code"""
+        types = []
+        while True:
+            output = await socket.receive_output(timeout=IDLE_SECONDS * 3)
+            if output['type'] == 'websocket.close':
+                return types, output.get('code')
+            types.append(json.loads(output['text'])['type'])
+
+    async def keep_alive(self, socket, seconds):
+        """Answer pings for a while; the frame types received, with 'close' if the socket was closed"""
+        types = []
+        deadline = asyncio.get_running_loop().time() + seconds
+        while asyncio.get_running_loop().time() < deadline:
+            if await socket.receive_nothing(timeout=0.02, interval=0.01):
+                continue
+            output = await socket.receive_output()
+            if output['type'] == 'websocket.close':
+                return types + ['close']
+            types.append(json.loads(output['text'])['type'])
+            if types[-1] == 'ping':
+                await socket.send_json_to({'type': 'pong'})
+        return types
+
+    def open_sockets(self):
+        return self.redis.zcard(room_key(self.room_id, 'sockets'))
+
+    async def test_silent_socket_is_pinged_then_reaped(self):
+        reaped = metrics.snapshot()['counters'].get('ws_idle_reaped', 0)
+        watcher = await connect_socket(self.watcher, self.room)
+        socket = await connect_socket(self.user, self.room)
+
+        (types, code), watcher_types = await asyncio.gather(
+            self.outputs_until_closed(socket), self.keep_alive(watcher, IDLE_SECONDS * 2))
+        self.assertIn('ping', types)
+        self.assertEqual(code, consumers.IDLE_CLOSE_CODE)
+        self.assertEqual(metrics.snapshot()['counters']['ws_idle_reaped'], reaped + 1)
+        self.assertIn('user_left', watcher_types)
+        self.assertNotIn('close', watcher_types)
+        self.assertEqual(await sync_to_async(redis_chat_service.get_online_users)(self.room_id),
+                         [str(self.watcher.user_id)])
+        await watcher.disconnect()
+        self.assertEqual(consumers._live, set())
+
+    async def test_answering_pings_keeps_the_socket(self):
+        socket = await connect_socket(self.user, self.room)
+        types = await self.keep_alive(socket, IDLE_SECONDS * 2)
+        self.assertIn('ping', types)
+        self.assertNotIn('close', types)
+        self.assertEqual(len(consumers._live), 1)
+        await socket.disconnect()
+        self.assertEqual(consumers._live, set())
+
+    async def test_any_frame_counts_as_alive(self):
+        socket = await connect_socket(self.user, self.room)
+        for _ in range(int(IDLE_SECONDS * 4 / PING_SECONDS)):
+            await socket.send_json_to({'type': 'typing_stop'})
+            await asyncio.sleep(PING_SECONDS / 2)
+        # A socket that keeps talking is never pinged, let alone reaped
+        self.assertEqual(await received_frames(socket, wait=0.01), [])
+        self.assertEqual(len(consumers._live), 1)
+        await socket.disconnect()
+
+    async def test_reaped_socket_leaves_once(self):
+        socket = await connect_socket(self.user, self.room)
+        self.assertEqual(await sync_to_async(self.open_sockets)(), 1)
+        await self.outputs_until_closed(socket)
+        # The client's own disconnect after the reap must not leave again
+        await socket.disconnect()
+        self.assertEqual(await sync_to_async(self.open_sockets)(), 0)
+
+    async def test_zero_ping_interval_turns_the_sweep_off(self):
+        with mock.patch.object(consumers, 'SERVER_PING_SECONDS', 0):
+            socket = await connect_socket(self.user, self.room)
+            self.assertEqual(consumers._live, set())
+            self.assertEqual(await received_frames(socket, wait=IDLE_SECONDS * 1.5), [])
+            await socket.disconnect()
@@ -0,0 +1,114 @@
+import uuid
+from django.test import SimpleTestCase, TestCase
+from space.models import SpaceMembership
+from teams.models import Member, Team
+from ..models import ChatRoom, ChatRoomMembership
+from ..services import mention_service
+from ..services.mention_service import MentionTrie, get_space_trie
+from ..services.message_service import _find_mentions
+from ..services.redis_service import redis_chat_service
+from .utils import FakeRedisMixin, make_room, make_user, requires_fakeredis
+
+
+class MentionTrieTests(SimpleTestCase):
+    def setUp(self):
+        self.trie = MentionTrie()
+        for username, user_id in (('ann', 'a'), ('anna', 'b'), ('bob_2', 'c')):
+            self.trie.add(username, user_id)
+
+    def test_finds_mentions_in_order_of_first_mention(self):
+        self.assertEqual(self.trie.find('@bob_2 and @ann, again @bob_2'), ['c', 'a'])
+
+    def test_longest_username_wins(self):
+        self.assertEqual(self.trie.find('hi @anna!'), ['b'])
+        self.assertEqual(self.trie.find('hi @annab'), [])
+
+    def test_mention_needs_a_word_boundary_before_the_at(self):
+        self.assertEqual(self.trie.find('mail ann@anna.example'), [])
+
+    def test_remove_prunes_only_that_username(self):
+        self.trie.remove('b')
+        self.assertEqual(self.trie.find('@anna @ann'), ['a'])
+        self.assertEqual(self.trie.root['a']['n']['n'], {'': 'a'})
+
+    def test_rename_replaces_the_old_username(self):
+        self.trie.add('carol', 'c')
+        self.assertEqual(self.trie.find('@bob_2 @carol'), ['c'])
+        self.assertNotIn('b', self.trie.root)
+
+
+@requires_fakeredis
+class RoomMentionTests(FakeRedisMixin, TestCase):
+    """Mentions reach whoever IsChatRoomMember admits: space, team and direct room members"""
+
+    def setUp(self):
+        super().setUp()
+        mention_service._tries.clear()
+        self.addCleanup(mention_service._tries.clear)
+        self.author = make_user('author')
+        self.room = make_room(members=[self.author])
+
+    def mentioned(self, *users):
+        mention_service._tries.clear()
+        return _find_mentions(self.room, ' '.join(f"@{user.username}" for user in users))
+
+    def test_space_members_outside_the_room_are_mentioned(self):
+        member = make_user('spacer')
+        SpaceMembership.objects.create(user=member, space=self.room.space)
+        self.assertEqual(self.mentioned(member), [str(member.user_id)])
+
+    def test_team_members_of_a_team_room_are_mentioned(self):
+        team = Team.objects.create(name=f"team-{uuid.uuid4().hex[:8]}", space=self.room.space)
+        self.room.team = team
+        self.room.save()
+        member, outsider = make_user('teamer'), make_user('outsider')
+        Member.objects.create(user=member, team=team)
+        self.assertEqual(self.mentioned(member, outsider), [str(member.user_id)])
+
+    def test_direct_room_members_are_mentioned(self):
+        member = make_user('direct')
+        ChatRoomMembership.objects.create(chat_room=self.room, user=member)
+        self.assertEqual(self.mentioned(member), [str(member.user_id)])
+
+    def test_members_of_another_room_are_not_mentioned(self):
+        other_room = ChatRoom.objects.create(name='other', space=self.room.space)
+        member = make_user('elsewhere')
+        ChatRoomMembership.objects.create(chat_room=other_room, user=member)
+        self.assertEqual(self.mentioned(member), [])
+
+
+@requires_fakeredis
+class MemberChangeTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        mention_service._tries.clear()
+        self.addCleanup(mention_service._tries.clear)
+        self.room = make_room(members=[make_user()])
+        self.space_id = str(self.room.space_id)
+        self.trie = get_space_trie(self.space_id)
+        self.trie.checked_at = float('-inf')
+
+    def changes(self):
+        return redis_chat_service.get_member_changes(self.space_id, self.trie.version)[1]
+
+    def test_changes_are_published_on_commit(self):
+        user = make_user('late')
+        with self.captureOnCommitCallbacks(execute=True):
+            SpaceMembership.objects.create(user=user, space=self.room.space)
+            self.assertEqual(self.changes(), [])
+        self.assertIn(['add', str(user.user_id), 'late'], self.changes())
+        self.assertEqual(get_space_trie(self.space_id).find('@late'), [str(user.user_id)])
+
+    def test_removal_keeps_users_still_admitted_another_way(self):
+        user = make_user('both')
+        with self.captureOnCommitCallbacks(execute=True):
+            membership = SpaceMembership.objects.create(user=user, space=self.room.space)
+            ChatRoomMembership.objects.create(chat_room=self.room, user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            membership.delete()
+        self.assertEqual(get_space_trie(self.space_id).find('@both'), [str(user.user_id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatRoomMembership.objects.filter(user=user).delete()
+        self.trie.checked_at = float('-inf')
+        self.assertEqual(get_space_trie(self.space_id).find('@both'), [])
@@ -0,0 +1,163 @@
+import os
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from django.test import SimpleTestCase
+from ..services import scylla_writer
+from ..services.circuit_breaker import CircuitOpenError
+from ..services.message_store import (
+    MessageRow, MessageStoreUnavailable, ScyllaMessageStore, create_message_store, get_message_store,
+)
+
+BASE_TIME = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def make_message(room_id, offset_ms, content='', message_id=None, **extra):
+    created_at = BASE_TIME + timedelta(milliseconds=offset_ms)
+    return dict({
+        'id': str(message_id or uuid.uuid4()),
+        'room': room_id,
+        'user': 'user-1',
+        'content': content or f"message at {offset_ms}",
+        'created_at': created_at.isoformat(),
+        'reply_to': None,
+        'media': [],
+    }, **extra)
+
+
+class MessageStoreConformance:
+    """Behaviour every MessageStore backend must share; subclasses name the backend"""
+    store_name = None
+
+    def setUp(self):
+        super().setUp()
+        self.store = self.make_store()
+        self.room_id = f"conformance-{uuid.uuid4()}"
+
+    def make_store(self):
+        return create_message_store(self.store_name)
+
+    def created_ats(self, rows):
+        return [row.created_at for row in rows]
+
+    def test_round_trip(self):
+        reply_to = uuid.uuid4()
+        message = make_message(self.room_id, 0, content='hello', media=['a.png'], reply_to=str(reply_to),
+                               edited_at=(BASE_TIME + timedelta(seconds=5)).isoformat())
+        self.store.write_message(message)
+        [row] = self.store.get_room_messages(self.room_id, limit=10)
+        self.assertEqual(str(row.id), message['id'])
+        self.assertEqual((row.room, row.user, row.content), (self.room_id, 'user-1', 'hello'))
+        self.assertEqual(list(row.media), ['a.png'])
+        self.assertEqual(row.reply_to, reply_to)
+        self.assertEqual(row.created_at, BASE_TIME.replace(tzinfo=None))
+        self.assertEqual(row.edited_at, (BASE_TIME + timedelta(seconds=5)).replace(tzinfo=None))
+
+    def test_newest_first(self):
+        self.store.write_messages([make_message(self.room_id, offset) for offset in (30, 10, 20, 0)])
+        rows = self.store.get_room_messages(self.room_id, limit=10)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(self.created_ats(rows), sorted(self.created_ats(rows), reverse=True))
+
+    def test_limit_and_cursor(self):
+        self.store.write_messages([make_message(self.room_id, offset) for offset in range(0, 100, 10)])
+        first = self.store.get_room_messages(self.room_id, limit=3)
+        self.assertEqual(len(first), 3)
+        cursor = first[-1].created_at
+        second = self.store.get_room_messages(self.room_id, limit=3, before_time=cursor)
+        # The cursor is exclusive
+        self.assertTrue(all(row.created_at < cursor for row in second))
+        self.assertEqual(second[0].created_at, cursor - timedelta(milliseconds=10))
+        # An aware cursor means the same instant as a naive UTC one
+        aware = self.store.get_room_messages(self.room_id, limit=3, before_time=cursor.replace(tzinfo=timezone.utc))
+        self.assertEqual([row.id for row in aware], [row.id for row in second])
+        self.assertEqual(self.store.get_room_messages(self.room_id, limit=3, before_time=BASE_TIME), [])
+
+    def test_millisecond_precision(self):
+        message = make_message(self.room_id, 0)
+        message['created_at'] = (BASE_TIME + timedelta(microseconds=1999)).isoformat()
+        self.store.write_message(message)
+        [row] = self.store.get_room_messages(self.room_id, limit=1)
+        self.assertEqual(row.created_at, (BASE_TIME + timedelta(milliseconds=1)).replace(tzinfo=None))
+
+    def test_upsert(self):
+        message_id = uuid.uuid4()
+        self.store.write_message(make_message(self.room_id, 0, content='first', message_id=message_id))
+        self.store.write_message(make_message(self.room_id, 0, content='second', message_id=message_id))
+        rows = self.store.get_room_messages(self.room_id, limit=10)
+        self.assertEqual([row.content for row in rows], ['second'])
+
+    def test_rooms_isolated(self):
+        other = f"{self.room_id}-other"
+        self.store.write_messages([make_message(self.room_id, 0), make_message(other, 0), make_message(other, 1)])
+        self.assertEqual(len(self.store.get_room_messages(self.room_id, limit=10)), 1)
+        self.assertEqual(len(self.store.get_room_messages(other, limit=10)), 2)
+
+    def test_page_iteration(self):
+        # 25 messages, with a run of identical timestamps straddling the page boundary
+        offsets = list(range(0, 200, 10)) + [5] * 5
+        self.store.write_messages([make_message(self.room_id, offset) for offset in offsets])
+        pages = list(self.store.iter_room_pages(self.room_id, page_size=7))
+        rows = [row for page in pages for row in page]
+        self.assertEqual(len(rows), len(offsets))
+        self.assertEqual(len({row.id for row in rows}), len(offsets), 'duplicate rows across pages')
+        self.assertEqual(self.created_ats(rows), sorted(self.created_ats(rows), reverse=True))
+        self.assertTrue(all(pages), 'empty page')
+        self.assertEqual(list(self.store.iter_room_pages(f"{self.room_id}-empty", page_size=7)), [])
+
+    def test_ties_are_stable(self):
+        self.store.write_messages([make_message(self.room_id, 0) for _ in range(5)])
+        first = [row.id for row in self.store.get_room_messages(self.room_id, limit=10)]
+        second = [row.id for row in self.store.get_room_messages(self.room_id, limit=10)]
+        self.assertEqual(len(first), 5)
+        self.assertEqual(first, second)
+
+
+class InMemoryMessageStoreTests(MessageStoreConformance, SimpleTestCase):
+    store_name = 'memory'
+
+
+class SQLiteMessageStoreTests(MessageStoreConformance, SimpleTestCase):
+    store_name = 'sqlite'
+
+
+@unittest.skipUnless(os.environ.get('CHAT_TEST_SCYLLA'), 'set CHAT_TEST_SCYLLA=1 to run against DATABASES["scylla"]')
+class ScyllaMessageStoreTests(MessageStoreConformance, SimpleTestCase):
+    """Writes to throwaway rooms of the configured cluster; the process store is shared"""
+    store_name = 'scylla'
+
+    def make_store(self):
+        return get_message_store('scylla')
+
+
+class ScyllaPagingFailureTests(SimpleTestCase):
+    """Exports and imports page through the driver; each page fetch must fail like any other store call"""
+
+    def setUp(self):
+        breaker = scylla_writer.scylla_breaker
+        breaker.record_success()
+        self.addCleanup(breaker.record_success)
+        self.session = mock.Mock()
+        row = MessageRow(uuid.uuid4(), 'room', 'user-1', 'hello', [], BASE_TIME, None, None)
+        self.session.execute.return_value = mock.Mock(current_rows=[row], has_more_pages=True)
+        patcher = mock.patch.object(scylla_writer.connection, 'get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failed_page_fetch_is_unavailable(self):
+        self.session.execute.return_value.fetch_next_page.side_effect = scylla_writer.OperationTimedOut('timed out')
+        pages = ScyllaMessageStore().iter_room_pages('room', page_size=1)
+        self.assertEqual(len(next(pages)), 1)
+        with self.assertRaises(MessageStoreUnavailable):
+            next(pages)
+        self.assertEqual(scylla_writer.scylla_breaker.failures, 1)
+
+    def test_open_breaker_fails_fast(self):
+        for _ in range(scylla_writer.scylla_breaker.failure_threshold):
+            scylla_writer.scylla_breaker.record_failure()
+        with self.assertRaises(MessageStoreUnavailable):
+            list(ScyllaMessageStore().iter_room_pages('room'))
+        with self.assertRaises(CircuitOpenError):
+            scylla_writer.count_room_messages('room')
+        self.session.execute.assert_not_called()
@@ -0,0 +1,54 @@
+import io
+import json
+import uuid
+from unittest import mock
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from ..services.redis_service import redis_chat_service, room_key
+from .utils import FakeRedisMixin, requires_fakeredis
+
+
+@requires_fakeredis
+class MigrateRedisKeysTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room_id = str(uuid.uuid4())
+        self.messages = [{'id': str(uuid.uuid4()), 'room': self.room_id, 'content': f"m{index}"} for index in range(3)]
+        for message in self.messages:
+            self.redis.xadd(f"room:{self.room_id}:stream", {'data': json.dumps(message)})
+        self.redis.set(f"room:{self.room_id}:stats:message_count:pending", 7)
+
+    def migrate(self, *args):
+        out = io.StringIO()
+        call_command('migrate_redis_keys', *args, stdout=out)
+        return out.getvalue()
+
+    def test_moves_unpersisted_messages_and_pending_counts(self):
+        redis_chat_service.increment_message_count(self.room_id)  # Written by the new release meanwhile
+        self.assertIn('Moved 3 unpersisted messages from 1 streams and 7 pending counts from 1 rooms', self.migrate())
+
+        self.assertEqual(redis_chat_service.get_stream_rooms(), [self.room_id])
+        redis_chat_service.ensure_stream_group(self.room_id, 'persist')
+        read = redis_chat_service.read_message_streams([self.room_id], 'persist', 'test', block_ms=0)
+        self.assertEqual([data for _, data in read[self.room_id]], self.messages)
+
+        self.assertEqual(self.redis.get(room_key(self.room_id, 'stats', 'message_count', 'pending')), '8')
+        self.assertEqual(self.redis.smembers(redis_chat_service.COUNTERS_DIRTY_KEY), {self.room_id})
+        self.assertFalse(self.redis.exists(f"room:{self.room_id}:stream",
+                                           f"room:{self.room_id}:stats:message_count:pending"))
+
+    def test_second_run_moves_nothing(self):
+        self.migrate()
+        self.assertIn('Moved 0 unpersisted messages from 0 streams', self.migrate())
+        self.assertEqual(self.redis.xlen(room_key(self.room_id, 'stream')), 3)
+
+    def test_long_streams_move_in_batches(self):
+        with mock.patch('chat.management.commands.migrate_redis_keys.BATCH', 2):
+            self.assertIn('Moved 3 unpersisted messages', self.migrate())
+        entries = self.redis.xrange(room_key(self.room_id, 'stream'))
+        self.assertEqual([json.loads(fields['data']) for _, fields in entries], self.messages)
+
+    def test_dry_run_leaves_keys(self):
+        self.assertIn('Would move 3 unpersisted messages', self.migrate('--dry-run'))
+        self.assertEqual(self.redis.xlen(f"room:{self.room_id}:stream"), 3)
+        self.assertFalse(self.redis.exists(room_key(self.room_id, 'stream')))
@@ -0,0 +1,94 @@
+import random
+from django.test import SimpleTestCase, TestCase
+from ..models import ModerationTerm
+from ..services import moderation_service
+from ..services.moderation_service import ModerationAutomaton, get_space_automaton, moderate_content
+from .utils import FakeRedisMixin, make_room, make_user, requires_fakeredis
+
+
+def naive_scan(terms, text):
+    """Every whole-word, case-insensitive occurrence, found by trying each term at each position"""
+    lowered = text.lower()
+    matches = []
+    for term, action in terms:
+        term = term.strip().lower()
+        if not term:
+            continue
+        start = lowered.find(term)
+        while start != -1:
+            end = start + len(term)
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                matches.append((start, end, action))
+            start = lowered.find(term, start + 1)
+    return sorted(matches)
+
+
+class ModerationAutomatonTests(SimpleTestCase):
+    def test_overlapping_terms_are_all_found(self):
+        # The classic case: 'she' ends inside 'hers' and 'he' is reached through a failure link
+        terms = [('he', 'flag'), ('she', 'flag'), ('his', 'flag'), ('hers', 'flag'), ('he she', 'mask')]
+        text = 'he she hers his'
+        self.assertEqual(sorted(ModerationAutomaton(terms).scan(text)), naive_scan(terms, text))
+        self.assertIn((0, 6, 'mask'), ModerationAutomaton(terms).scan(text))
+
+    def test_matches_whole_words_case_insensitively(self):
+        automaton = ModerationAutomaton([('bad', 'flag')])
+        self.assertEqual(automaton.scan('BAD, Bad! bad'), [(0, 3, 'flag'), (5, 8, 'flag'), (10, 13, 'flag')])
+        self.assertEqual(automaton.scan('badge abad bad_'), [(11, 14, 'flag')])
+
+    def test_agrees_with_a_naive_scan(self):
+        rng = random.Random(46)
+        for _ in range(200):
+            terms = [(''.join(rng.choice('ab ') for _ in range(rng.randint(1, 4))), rng.choice(['flag', 'mask']))
+                     for _ in range(rng.randint(1, 6))]
+            text = ''.join(rng.choice('abAB .') for _ in range(rng.randint(0, 40)))
+            with self.subTest(terms=terms, text=text):
+                self.assertEqual(sorted(ModerationAutomaton(terms).scan(text)), naive_scan(terms, text))
+
+    def test_blank_terms_are_ignored(self):
+        automaton = ModerationAutomaton([('  ', 'block'), ('', 'block')])
+        self.assertEqual(len(automaton), 1)
+        self.assertEqual(automaton.scan('anything'), [])
+
+    def test_block_wins_over_other_actions(self):
+        result = ModerationAutomaton([('spam', 'mask'), ('spam', 'block'), ('eggs', 'flag')]).moderate('spam and eggs')
+        self.assertTrue(result.blocked)
+        self.assertEqual(result.text, 'spam and eggs')
+
+    def test_mask_keeps_length_and_flag_keeps_text(self):
+        result = ModerationAutomaton([('darn', 'mask'), ('heck', 'flag')]).moderate('Darn it, heck.')
+        self.assertFalse(result.blocked)
+        self.assertEqual(result.text, '**** it, heck.')
+        self.assertEqual(result.flagged, ['heck'])
+        self.assertEqual(sorted(result.matches), ['Darn', 'heck'])
+
+
+@requires_fakeredis
+class SpaceAutomatonTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        moderation_service._automata.clear()
+        self.addCleanup(moderation_service._automata.clear)
+        self.space = make_room(members=[make_user()]).space
+        self.space_id = str(self.space.space_id)
+
+    def add_term(self, term, action):
+        with self.captureOnCommitCallbacks(execute=True):
+            ModerationTerm.objects.create(space=self.space, term=term, action=action)
+
+    def test_term_changes_recompile_after_commit(self):
+        self.assertFalse(moderate_content(self.space_id, 'buy spam').blocked)
+        self.add_term('spam', 'block')
+        self.assertTrue(moderate_content(self.space_id, 'buy spam').blocked)
+
+    def test_other_processes_recompile_when_the_version_moves(self):
+        self.add_term('spam', 'block')
+        automaton = get_space_automaton(self.space_id)
+        automaton.checked_at = float('-inf')
+        self.assertIs(get_space_automaton(self.space_id), automaton)
+
+        # Another process changed the terms: its bump is all this process sees
+        ModerationTerm.objects.filter(space=self.space).update(action='flag')
+        self.redis.incr(f"space:{{{self.space_id}}}:moderation:version")
+        automaton.checked_at = float('-inf')
+        self.assertEqual(moderate_content(self.space_id, 'buy spam').flagged, ['spam'])
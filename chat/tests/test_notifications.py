@@ -0,0 +1,60 @@
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from rest_framework.test import APIClient
+from ..consumers import ACCESS_REVOKED_CLOSE_CODE
+from ..fanout import notify_user
+from ..models import ChatRoom, ChatRoomMembership
+from .utils import (
+    LOCAL_SERVICES, FakeRedisMixin, connect_socket, make_room, make_user, received_frames, requires_fakeredis,
+)
+
+
+@requires_fakeredis
+@LOCAL_SERVICES
+class UserNotificationTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin, self.user = make_user(), make_user()
+        self.room = make_room(members=[self.admin, self.user])
+        self.other_room = ChatRoom.objects.create(name='other', space=self.room.space)
+        ChatRoomMembership.objects.create(chat_room=self.other_room, user=self.user)
+        ChatRoomMembership.objects.filter(chat_room=self.room, user=self.admin).update(is_admin=True)
+
+    def remove_user(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.delete(f'/chat/{self.room.space_id}/chat-rooms/{self.room.id}/members/{self.user.user_id}/')
+        self.assertEqual(response.status_code, 204)
+
+    async def test_reaches_every_socket_of_the_user(self):
+        sockets = [await connect_socket(self.user, self.room), await connect_socket(self.user, self.other_room)]
+        bystander = await connect_socket(self.admin, self.room)
+        for socket in (*sockets, bystander):
+            await received_frames(socket)
+
+        await notify_user(self.user.user_id, {'type': 'mention', 'room_id': str(self.room.id)})
+        for socket in sockets:
+            self.assertEqual(await received_frames(socket), [{'type': 'mention', 'room_id': str(self.room.id)}])
+        self.assertEqual(await received_frames(bystander), [])
+
+        for socket in (*sockets, bystander):
+            await socket.disconnect()
+
+    async def test_removed_member_is_closed_in_that_room_only(self):
+        revoked = await connect_socket(self.user, self.room)
+        elsewhere = await connect_socket(self.user, self.other_room)
+        await received_frames(elsewhere)
+
+        await sync_to_async(self.remove_user)()
+        frame = {'type': 'room_access_revoked', 'room_id': str(self.room.id)}
+        self.assertEqual(await revoked.receive_json_from(), frame)
+        self.assertEqual(await revoked.receive_output(), {'type': 'websocket.close', 'code': ACCESS_REVOKED_CLOSE_CODE,
+                                                          'reason': 'access_revoked'})
+
+        # The user's socket in another room is told, and stays open
+        self.assertEqual(await received_frames(elsewhere), [frame])
+        await elsewhere.send_json_to({'type': 'ping'})
+        self.assertEqual(await received_frames(elsewhere), [{'type': 'pong'}])
+
+        await revoked.disconnect()
+        await elsewhere.disconnect()
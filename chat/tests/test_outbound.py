@@ -0,0 +1,94 @@
+import asyncio
+import json
+from unittest import mock
+from django.test import SimpleTestCase
+from .. import consumers, metrics
+from ..consumers import ChatConsumer
+
+
+def counter(name):
+    return metrics.snapshot()['counters'].get(name, 0)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    """A client that stops reading: its send never returns, so frames pile up in the outbound queue"""
+
+    def setUp(self):
+        patcher = mock.patch.object(consumers, 'OUTBOUND_QUEUE_SIZE', 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gauges = {name: metrics.get_gauge(name) for name in ('ws_outbound_queued', 'ws_connections')}
+        self.dropped = counter('ws_events_dropped')
+        self.evicted = counter('ws_slow_clients_evicted')
+
+    async def stalled_consumer(self):
+        consumer = ChatConsumer()
+        consumer.room_id = 'room'
+        consumer.user = mock.Mock(user_id='user-1')
+        consumer.sent = []
+        consumer.gate = asyncio.Event()
+
+        async def send(text_data=None, **kwargs):
+            await consumer.gate.wait()
+            consumer.sent.append(json.loads(text_data)['type'])
+        consumer.send = send
+        consumer.close = mock.AsyncMock()
+        consumer.start_writer()
+        # The writer takes the first frame and blocks on it, leaving the queue to fill up
+        await consumer.enqueue({'type': 'new_message', 'n': 0})
+        await asyncio.sleep(0)
+        return consumer
+
+    def queued_types(self, consumer):
+        return [frame['type'] for frame in consumer.outbound]
+
+    async def test_presence_and_typing_are_shed_first(self):
+        consumer = await self.stalled_consumer()
+        for frame_type in ('typing_indicator', 'new_message', 'user_joined', 'new_message'):
+            await consumer.enqueue({'type': frame_type})
+        self.assertEqual(len(consumer.outbound), consumers.OUTBOUND_QUEUE_SIZE)
+
+        # A droppable frame arriving at a full queue is dropped itself
+        await consumer.enqueue({'type': 'user_left'})
+        self.assertEqual(counter('ws_events_dropped'), self.dropped + 1)
+
+        # A message makes room by shedding the queued presence and typing frames, keeping order
+        await consumer.enqueue({'type': 'message_updated'})
+        self.assertEqual(self.queued_types(consumer), ['new_message', 'new_message', 'message_updated'])
+        self.assertEqual(counter('ws_events_dropped'), self.dropped + 3)
+        consumer.close.assert_not_called()
+
+        consumer.gate.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(consumer.sent, ['new_message', 'new_message', 'new_message', 'message_updated'])
+        consumer.stop_writer()
+
+    async def test_full_queue_of_messages_closes_with_resync(self):
+        consumer = await self.stalled_consumer()
+        for _ in range(consumers.OUTBOUND_QUEUE_SIZE):
+            await consumer.enqueue({'type': 'new_message'})
+        await consumer.enqueue({'type': 'new_message'})
+
+        consumer.close.assert_awaited_once_with(code=consumers.SLOW_CONSUMER_CLOSE_CODE, reason='resync')
+        self.assertEqual(counter('ws_slow_clients_evicted'), self.evicted + 1)
+        self.assertIsNone(consumer.outbound)
+        # Nothing more is queued for an evicted client
+        await consumer.enqueue({'type': 'new_message'})
+        self.assertIsNone(consumer.outbound)
+
+    async def test_gauges_return_after_disconnect(self):
+        consumer = await self.stalled_consumer()
+        for frame_type in ('typing_indicator', 'new_message', 'new_message'):
+            await consumer.enqueue({'type': frame_type})
+        self.assertEqual(metrics.get_gauge('ws_outbound_queued'), self.gauges['ws_outbound_queued'] + 3)
+        self.assertEqual(metrics.get_gauge('ws_connections'), self.gauges['ws_connections'] + 1)
+
+        consumer.stop_writer()
+        self.assertEqual({name: metrics.get_gauge(name) for name in self.gauges}, self.gauges)
+
+    async def test_gauges_return_after_eviction(self):
+        consumer = await self.stalled_consumer()
+        for _ in range(consumers.OUTBOUND_QUEUE_SIZE + 1):
+            await consumer.enqueue({'type': 'new_message'})
+        consumer.stop_writer()  # leave() after the close runs it again
+        self.assertEqual({name: metrics.get_gauge(name) for name in self.gauges}, self.gauges)
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from .. import consumers, metrics
+from ..services.redis_service import redis_chat_service
+from .utils import (
+    LOCAL_SERVICES, FakeRedisMixin, connect_socket, make_room, make_user, received_frames, requires_fakeredis,
+)
+
+GRACE_SECONDS = 0.3
+
+
+@requires_fakeredis
+@LOCAL_SERVICES
+class PresenceGraceTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(consumers, 'PRESENCE_GRACE_SECONDS', GRACE_SECONDS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.watcher, self.user = make_user(), make_user()
+        self.room = make_room(members=[self.watcher, self.user])
+        self.room_id = str(self.room.id)
+
+    async def frame_types(self, socket, wait=0.2):
+        return [frame['type'] for frame in await received_frames(socket, wait)]
+
+    def online_users(self):
+        return redis_chat_service.get_online_users(self.room_id)
+
+    async def test_reconnect_within_grace_is_not_announced(self):
+        watcher = await connect_socket(self.watcher, self.room)
+        socket = await connect_socket(self.user, self.room)
+        self.assertEqual(await self.frame_types(watcher), ['user_joined'])
+        suppressed = metrics.snapshot()['counters'].get('ws_presence_suppressed', 0)
+
+        await socket.disconnect()
+        socket = await connect_socket(self.user, self.room)
+        await asyncio.sleep(GRACE_SECONDS)
+
+        self.assertEqual(await self.frame_types(watcher), [])
+        self.assertEqual(metrics.snapshot()['counters']['ws_presence_suppressed'], suppressed + 1)
+        self.assertIn(str(self.user.user_id), await sync_to_async(self.online_users)())
+        await socket.disconnect()
+        await watcher.disconnect()
+
+    async def test_leave_is_announced_after_grace(self):
+        watcher = await connect_socket(self.watcher, self.room)
+        socket = await connect_socket(self.user, self.room)
+        await received_frames(watcher)
+
+        await socket.disconnect()
+        self.assertNotIn(str(self.user.user_id), await sync_to_async(self.online_users)())
+        self.assertEqual(await self.frame_types(watcher, wait=GRACE_SECONDS / 3), [])
+        self.assertEqual(await self.frame_types(watcher, wait=GRACE_SECONDS), ['user_left'])
+
+        # Once user_left went out, coming back is a join like any other
+        socket = await connect_socket(self.user, self.room)
+        self.assertEqual(await self.frame_types(watcher), ['user_joined'])
+        await socket.disconnect()
+        await watcher.disconnect()
+
+    async def test_no_grace_announces_at_once(self):
+        watcher = await connect_socket(self.watcher, self.room)
+        socket = await connect_socket(self.user, self.room)
+        await received_frames(watcher)
+
+        with mock.patch.object(consumers, 'PRESENCE_GRACE_SECONDS', 0):
+            await socket.disconnect()
+            self.assertEqual(await self.frame_types(watcher, wait=0.05), ['user_left'])
+        await watcher.disconnect()
+
+    async def test_redis_calls_stay_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        on_loop = []
+        execute_command = self.redis.execute_command
+
+        def record_command(*args, **options):
+            if threading.get_ident() == loop_thread:
+                on_loop.append(args[0])
+            return execute_command(*args, **options)
+
+        with mock.patch.object(self.redis, 'execute_command', record_command), \
+                mock.patch.object(self.redis, 'pipeline', self.pipeline_on(loop_thread, on_loop)):
+            watcher = await connect_socket(self.watcher, self.room)
+            socket = await connect_socket(self.user, self.room)
+            await socket.send_json_to({'type': 'typing_start'})
+            await socket.send_json_to({'type': 'ping'})
+            await received_frames(watcher)
+            await socket.disconnect()
+            await asyncio.sleep(GRACE_SECONDS)
+            self.assertEqual(await self.frame_types(watcher), ['user_left'])
+            await watcher.disconnect()
+        self.assertEqual(on_loop, [])
+
+    def pipeline_on(self, loop_thread, on_loop):
+        pipeline = self.redis.pipeline
+
+        def make_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def record_execute(*execute_args, **execute_kwargs):
+                if threading.get_ident() == loop_thread:
+                    on_loop.append('pipeline')
+                return execute(*execute_args, **execute_kwargs)
+            pipe.execute = record_execute
+            return pipe
+        return make_pipeline
@@ -0,0 +1,28 @@
+import uuid
+from django.test import SimpleTestCase
+from ..services.redis_service import redis_chat_service
+from .utils import FakeRedisMixin, requires_fakeredis
+
+
+@requires_fakeredis
+class RateLimitTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user_id = str(uuid.uuid4())
+        self.key = f"rate_limit:{{{self.user_id}}}:send"
+
+    def test_limit_applies_within_the_window(self):
+        allowed = [redis_chat_service.check_rate_limit(self.user_id, 'send', limit=3, window=60) for _ in range(4)]
+        self.assertEqual(allowed, [True, True, True, False])
+        self.assertTrue(0 < self.redis.ttl(self.key) <= 60)
+
+    def test_later_hits_do_not_extend_the_window(self):
+        redis_chat_service.check_rate_limit(self.user_id, 'send', window=60)
+        self.redis.expire(self.key, 5)
+        redis_chat_service.check_rate_limit(self.user_id, 'send', window=60)
+        self.assertLessEqual(self.redis.ttl(self.key), 5)
+
+    def test_counter_left_without_ttl_gets_one(self):
+        self.redis.set(self.key, 100)
+        self.assertFalse(redis_chat_service.check_rate_limit(self.user_id, 'send', limit=10, window=60))
+        self.assertTrue(0 < self.redis.ttl(self.key) <= 60)
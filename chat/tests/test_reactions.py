@@ -0,0 +1,116 @@
+import uuid
+from unittest import mock
+from django.test import SimpleTestCase
+from ..management.commands.flush_reactions import Command as FlushReactions
+from ..services import reaction_service, scylla_writer
+from ..services.redis_service import redis_chat_service, room_key
+from .utils import FakeRedisMixin, requires_fakeredis
+
+
+@requires_fakeredis
+class ReactionTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room_id, self.message_id, self.user_id = (str(uuid.uuid4()) for _ in range(3))
+        self.durable = {}
+        self.failing = False
+        self.rejected = set()
+        command = 'chat.management.commands.flush_reactions'
+        for target, replacement in ((f'{command}.save_reactions', self.save_reactions),
+                                    ('chat.services.scylla_writer.get_reaction_state', self.get_reaction_state)):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def save_reactions(self, reactions):
+        if self.failing:
+            return list(reactions)
+        for key, state in reactions.items():
+            if key in self.rejected:
+                continue
+            self.durable[key] = {'counts': dict(state['counts']), 'reactors': sorted(state['reactors'])}
+        return [key for key in reactions if key in self.rejected]
+
+    def get_reaction_state(self, room_id, message_id):
+        if self.failing:
+            raise reaction_service.scylla_writer.OperationTimedOut('timed out')
+        state = self.durable.get((room_id, message_id), {'counts': {}, 'reactors': []})
+        return dict(state['counts']), list(state['reactors'])
+
+    def react(self, add=True, user_id=None):
+        return reaction_service.apply_reaction(self.room_id, self.message_id, user_id or self.user_id, '👍', add=add)
+
+    def expire(self):
+        self.redis.delete(room_key(self.room_id, 'message', self.message_id, 'reactors'),
+                          room_key(self.room_id, 'message', self.message_id, 'reactions'))
+
+    def test_dedupe_survives_expiry(self):
+        self.assertEqual(self.react()['count'], 1)
+        FlushReactions().flush(batch_size=10)
+        self.expire()
+
+        again = self.react()
+        self.assertFalse(again['changed'])
+        self.assertEqual(again['count'], 1)
+
+        removed = self.react(add=False)
+        self.assertTrue(removed['changed'])
+        self.assertEqual(removed['count'], 0)
+
+    def test_cold_state_is_not_changed_when_scylla_is_down(self):
+        self.failing = True
+        self.assertIsNone(self.react())
+        self.assertEqual(redis_chat_service.get_reaction_counts(self.room_id, [self.message_id]), {})
+
+    def test_failed_flush_keeps_the_mark(self):
+        self.react()
+        self.failing = True
+        self.assertEqual(FlushReactions().flush(batch_size=10), 0)
+        self.failing = False
+        self.assertEqual(FlushReactions().flush(batch_size=10), 1)
+        self.assertEqual(self.durable[(self.room_id, self.message_id)],
+                         {'counts': {'👍': 1}, 'reactors': [f"{self.user_id}:👍"]})
+        self.assertEqual(redis_chat_service.take_dirty_reactions(10), (0, {}))
+
+    def test_message_that_keeps_failing_does_not_hold_up_the_rest(self):
+        message_ids = [str(uuid.uuid4()) for _ in range(20)]
+        for message_id in message_ids:
+            reaction_service.apply_reaction(self.room_id, message_id, self.user_id, '👍')
+        self.rejected = {(self.room_id, message_id) for message_id in message_ids[::5]}
+
+        keys = {(self.room_id, message_id) for message_id in message_ids}
+        self.assertEqual(FlushReactions().flush(batch_size=2), 16)
+        self.assertEqual(set(self.durable), keys - self.rejected)
+        self.assertEqual(set(redis_chat_service.take_dirty_reactions(100)[1]), self.rejected)
+
+        # Retried on the next pass
+        self.rejected = set()
+        self.assertEqual(FlushReactions().flush(batch_size=2), 4)
+        self.assertEqual(set(self.durable), keys)
+
+    def test_change_after_take_keeps_the_mark(self):
+        self.react()
+        _, taken = redis_chat_service.take_dirty_reactions(10)
+        self.react(user_id=str(uuid.uuid4()))
+        self.assertEqual(redis_chat_service.clear_dirty_reactions(
+            {key: state['version'] for key, state in taken.items()}), 0)
+        self.assertEqual(redis_chat_service.take_dirty_reactions(10)[1][(self.room_id, self.message_id)]['counts'],
+                         {'👍': 2})
+
+    def test_expired_state_is_cleared_without_writing(self):
+        self.react()
+        self.expire()
+        self.assertEqual(FlushReactions().flush(batch_size=10), 0)
+        self.assertEqual(self.durable, {})
+        self.assertEqual(redis_chat_service.take_dirty_reactions(10), (0, {}))
+
+
+class ReactionStateReadTests(SimpleTestCase):
+    def test_state_is_read_at_quorum(self):
+        # Redis is seeded from this read and the next flush overwrites counts and reactors with it
+        session = mock.Mock()
+        session.execute.return_value.one.return_value = mock.Mock(counts={'👍': 1}, reactors={'u:👍'})
+        with mock.patch.object(scylla_writer.connection, 'get_session', return_value=session), \
+                mock.patch.object(scylla_writer, '_prepare'):
+            self.assertEqual(scylla_writer.get_reaction_state('room', str(uuid.uuid4())), ({'👍': 1}, ['u:👍']))
+        self.assertEqual(session.execute.call_args.kwargs['execution_profile'], 'state_read')
@@ -0,0 +1,27 @@
+from unittest import mock
+import redis
+from django.test import SimpleTestCase
+from ..services import redis_pool
+
+
+class PoolStatsTests(SimpleTestCase):
+    def stats(self, pool):
+        client = redis.Redis(connection_pool=pool)
+        with mock.patch.dict(redis_pool._clients, {'default': client}, clear=True):
+            return redis_pool.pool_stats()['default']
+
+    def test_blocking_pool_usage(self):
+        pool = redis.BlockingConnectionPool(max_connections=4)
+        with mock.patch.object(redis.Connection, 'connect'):
+            connection = pool.get_connection()
+        stats = self.stats(pool)
+        pool.release(connection)
+        self.assertEqual(stats, {'max_connections': 4, 'created': 1, 'in_use': 1, 'utilisation': 0.25})
+
+    def test_missing_private_attributes_report_zero_usage(self):
+        for pool in (redis.BlockingConnectionPool(max_connections=4), redis.ConnectionPool(max_connections=4)):
+            for name in ('_connections', 'pool', '_created_connections', '_in_use_connections'):
+                if hasattr(pool, name):
+                    delattr(pool, name)
+            with self.subTest(pool=type(pool).__name__):
+                self.assertEqual(self.stats(pool), {'max_connections': 4, 'created': 0, 'in_use': 0, 'utilisation': 0.0})
@@ -0,0 +1,72 @@
+import uuid
+from unittest import mock
+from django.test import SimpleTestCase
+from ..management.commands.flush_room_counters import Command as FlushRoomCounters
+from ..services import scylla_writer
+from ..services.redis_service import redis_chat_service, room_key
+from .utils import FakeRedisMixin, requires_fakeredis
+
+
+class IncrementRoomCountersTests(SimpleTestCase):
+    def test_stops_at_first_failure_and_reports_applied_rooms(self):
+        session = mock.Mock()
+        session.execute.side_effect = [None, scylla_writer.OperationTimedOut('timed out'), None]
+        with mock.patch.object(scylla_writer.connection, 'get_session', return_value=session), \
+                mock.patch.object(scylla_writer, '_prepare'):
+            applied = scylla_writer.increment_room_counters({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(applied, ['a'])
+        self.assertEqual(session.execute.call_count, 2)
+
+    def test_totals_are_read_at_quorum(self):
+        # flush_room_counters re-syncs the mirror from this read right after incrementing
+        session = mock.Mock()
+        session.execute.return_value = [mock.Mock(room='a', message_count=3)]
+        with mock.patch.object(scylla_writer.connection, 'get_session', return_value=session), \
+                mock.patch.object(scylla_writer, '_prepare'):
+            self.assertEqual(scylla_writer.get_room_counters(['a']), {'a': 3})
+        self.assertEqual(session.execute.call_args.kwargs['execution_profile'], 'state_read')
+
+
+@requires_fakeredis
+class FlushRoomCountersTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rooms = [str(uuid.uuid4()) for _ in range(3)]
+        self.durable = {}
+
+    def increment(self, counts, fail_after=None):
+        applied = []
+        for room_id, count in counts.items():
+            if fail_after is not None and len(applied) == fail_after:
+                break
+            self.durable[room_id] = self.durable.get(room_id, 0) + count
+            applied.append(room_id)
+        return applied
+
+    def flush(self, fail_after=None):
+        command = 'chat.management.commands.flush_room_counters'
+        with mock.patch(f'{command}.increment_room_counters', lambda counts: self.increment(counts, fail_after)), \
+                mock.patch(f'{command}.get_room_counters', lambda room_ids: {r: self.durable[r] for r in room_ids}):
+            return FlushRoomCounters().flush(batch_size=10)
+
+    def test_partial_failure_restores_only_unapplied_rooms(self):
+        for index, room_id in enumerate(self.rooms, 1):
+            redis_chat_service.increment_message_count(room_id, index)
+
+        self.assertEqual(self.flush(fail_after=1), 1)
+        self.assertEqual(self.flush(), 2)
+        self.assertEqual(self.flush(), 0)
+
+        self.assertEqual(self.durable, {room_id: index for index, room_id in enumerate(self.rooms, 1)})
+        self.assertEqual(redis_chat_service.get_message_totals(self.rooms),
+                         {room_id: index for index, room_id in enumerate(self.rooms, 1)})
+
+    def test_missing_mirrors_load_with_one_query(self):
+        self.redis.set(room_key(self.rooms[0], 'stats', 'message_total'), 5)
+        self.redis.set(room_key(self.rooms[1], 'stats', 'message_count', 'pending'), 2)
+        with mock.patch.object(scylla_writer, 'get_room_counters',
+                               return_value={self.rooms[1]: 7}) as get_room_counters:
+            stats = redis_chat_service.get_rooms_stats(self.rooms)
+        get_room_counters.assert_called_once_with(self.rooms[1:])
+        self.assertEqual([stats[room_id]['total_messages'] for room_id in self.rooms], [5, 9, 0])
+        self.assertEqual(self.redis.get(room_key(self.rooms[2], 'stats', 'message_total')), '0')
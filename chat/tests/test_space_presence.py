@@ -0,0 +1,119 @@
+import time
+import uuid
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from ..management.commands.bench_redis_service import RoundTripCounter
+from ..models import ChatRoom, ChatRoomMembership
+from ..services.redis_service import redis_chat_service, space_key
+from .utils import FakeRedisMixin, make_room, make_user, requires_fakeredis
+
+
+class PatchedTimeMixin:
+    def setUp(self):
+        super().setUp()
+        self.now = time.time()
+        patcher = mock.patch('chat.services.redis_service.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+@requires_fakeredis
+class SpacePresenceTests(PatchedTimeMixin, FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.space_id = str(uuid.uuid4())
+        self.rooms = [str(uuid.uuid4()) for _ in range(3)]
+        self.user_id = str(uuid.uuid4())
+
+    def online(self):
+        return redis_chat_service.get_space_online_users(self.space_id)
+
+    def test_leaves_the_space_when_the_last_socket_closes(self):
+        redis_chat_service.set_user_online(self.rooms[0], self.user_id, self.space_id)
+        redis_chat_service.set_user_online(self.rooms[1], self.user_id, self.space_id)
+        redis_chat_service.set_user_online(self.rooms[1], self.user_id, self.space_id)  # A second tab
+
+        redis_chat_service.set_user_offline(self.rooms[0], self.user_id, self.space_id)
+        redis_chat_service.set_user_offline(self.rooms[1], self.user_id, self.space_id)
+        self.assertEqual(self.online(), [self.user_id])
+
+        redis_chat_service.set_user_offline(self.rooms[1], self.user_id, self.space_id)
+        self.assertEqual(self.online(), [])
+        self.assertFalse(self.redis.exists(space_key(self.space_id, 'online', 'connections')))
+
+    def test_close_after_expiry_does_not_go_negative(self):
+        redis_chat_service.set_user_online(self.rooms[0], self.user_id, self.space_id)
+        self.redis.delete(space_key(self.space_id, 'online', 'connections'))
+        redis_chat_service.set_user_offline(self.rooms[0], self.user_id, self.space_id)
+        self.assertFalse(self.redis.exists(space_key(self.space_id, 'online', 'connections')))
+
+        # The next socket counts as the only one again
+        redis_chat_service.set_user_online(self.rooms[0], self.user_id, self.space_id)
+        self.assertEqual(self.online(), [self.user_id])
+        redis_chat_service.set_user_offline(self.rooms[0], self.user_id, self.space_id)
+        self.assertEqual(self.online(), [])
+
+    def test_users_without_a_heartbeat_time_out(self):
+        stale = str(uuid.uuid4())
+        redis_chat_service.set_user_online(self.rooms[0], self.user_id, self.space_id)
+        redis_chat_service.set_user_online(self.rooms[0], stale, self.space_id)
+        self.now += redis_chat_service.PRESENCE_TIMEOUT - 1
+        redis_chat_service.presence_heartbeat(self.rooms[0], self.user_id, self.space_id)
+
+        self.now += 2
+        self.assertEqual(self.online(), [self.user_id])
+        # Pruned from the set, not only filtered from the reply
+        self.assertEqual(self.redis.zrange(space_key(self.space_id, 'online'), 0, -1), [self.user_id])
+
+    def test_rooms_list_only_users_online_in_the_space(self):
+        in_room = str(uuid.uuid4())
+        redis_chat_service.set_user_online(self.rooms[0], self.user_id, self.space_id)
+        redis_chat_service.set_user_online(self.rooms[1], in_room, self.space_id)
+        # Left the space's last socket, but the room entry has not expired yet
+        gone = str(uuid.uuid4())
+        redis_chat_service.set_user_online(self.rooms[0], gone)
+
+        presence = redis_chat_service.get_space_presence(self.space_id, self.rooms)
+        self.assertEqual(sorted(presence['online']), sorted([self.user_id, in_room]))
+        self.assertEqual(presence['rooms'], {self.rooms[0]: [self.user_id], self.rooms[1]: [in_room],
+                                             self.rooms[2]: []})
+
+    def test_one_round_trip_for_any_number_of_rooms(self):
+        for room_id in self.rooms:
+            redis_chat_service.set_user_online(room_id, self.user_id, self.space_id)
+        counter = RoundTripCounter(self.redis)
+        counter.install()
+        self.addCleanup(counter.uninstall)
+
+        redis_chat_service.get_space_presence(self.space_id, self.rooms)
+        self.assertEqual(counter.count, 1)
+
+
+@requires_fakeredis
+class SpacePresenceViewTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.other = make_user(), make_user()
+        self.room = make_room(members=[self.user, self.other])
+        self.private = ChatRoom.objects.create(name='private', space=self.room.space)
+        ChatRoomMembership.objects.create(chat_room=self.private, user=self.other)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_lists_the_space_and_the_requesters_rooms(self):
+        space_id = str(self.room.space_id)
+        redis_chat_service.set_user_online(str(self.room.id), str(self.other.user_id), space_id)
+        redis_chat_service.set_user_online(str(self.private.id), str(self.other.user_id), space_id)
+
+        response = self.client.get(f'/chat/{space_id}/chat-rooms/presence/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['online_users'], [str(self.other.user_id)])
+        self.assertEqual(response.data['online_count'], 1)
+        # Rooms the requester is not in are not reported
+        self.assertEqual(response.data['rooms'], {str(self.room.id): [str(self.other.user_id)]})
+
+    def test_non_members_are_refused(self):
+        self.client.force_authenticate(make_user())
+        response = self.client.get(f'/chat/{self.room.space_id}/chat-rooms/presence/')
+        self.assertEqual(response.status_code, 403)
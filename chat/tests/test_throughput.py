@@ -0,0 +1,91 @@
+import time
+import uuid
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from ..models import ChatRoomMembership
+from ..services.redis_service import redis_chat_service, room_key
+from .utils import LOCAL_SERVICES, FakeRedisMixin, connect_socket, make_room, make_user, requires_fakeredis
+
+
+@requires_fakeredis
+@LOCAL_SERVICES
+class RoomSocketCountTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin, self.member = make_user(), make_user()
+        self.room = make_room(members=[self.admin, self.member])
+        ChatRoomMembership.objects.filter(chat_room=self.room, user=self.admin).update(is_admin=True)
+
+    def sockets(self):
+        return redis_chat_service.get_room_throughput([self.room.id])[str(self.room.id)]['sockets']
+
+    def remove_member(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.delete(
+            f'/chat/{self.room.space_id}/chat-rooms/{self.room.id}/members/{self.member.user_id}/')
+        self.assertEqual(response.status_code, 204)
+
+    async def test_counts_open_sockets(self):
+        first = await connect_socket(self.admin, self.room)
+        second = await connect_socket(self.member, self.room)
+        self.assertEqual(await sync_to_async(self.sockets)(), 2)
+        await first.disconnect()
+        self.assertEqual(await sync_to_async(self.sockets)(), 1)
+        await second.disconnect()
+        self.assertEqual(await sync_to_async(self.sockets)(), 0)
+
+    async def test_removing_a_member_leaves_the_count_to_their_socket(self):
+        admin = await connect_socket(self.admin, self.room)
+        member = await connect_socket(self.member, self.room)
+        await sync_to_async(self.remove_member)()
+        self.assertEqual(await sync_to_async(self.sockets)(), 2)
+
+        # The removed member's socket closes itself, and only that takes it off the count
+        await member.receive_output(timeout=1)
+        await member.disconnect()
+        self.assertEqual(await sync_to_async(self.sockets)(), 1)
+        await admin.disconnect()
+        self.assertEqual(await sync_to_async(self.sockets)(), 0)
+
+
+@requires_fakeredis
+class SocketRegistryTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room_id, self.user_id = str(uuid.uuid4()), str(uuid.uuid4())
+        self.now = time.time()
+        patcher = mock.patch('chat.services.redis_service.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sockets(self):
+        return redis_chat_service.get_room_throughput([self.room_id])[self.room_id]['sockets']
+
+    def test_sockets_of_a_crashed_worker_age_out(self):
+        redis_chat_service.register_connection(self.user_id, 'alive', self.room_id)
+        redis_chat_service.register_connection(self.user_id, 'crashed', self.room_id)
+        self.now += redis_chat_service.PRESENCE_TIMEOUT - 1
+        redis_chat_service.presence_heartbeat(self.room_id, self.user_id, channel_name='alive')
+        self.assertEqual(self.sockets(), 2)
+
+        self.now += 2
+        self.assertEqual(self.sockets(), 1)
+        # The next connect prunes it for good
+        redis_chat_service.register_connection(self.user_id, 'new', self.room_id)
+        self.assertEqual(self.redis.zrange(room_key(self.room_id, 'sockets'), 0, -1), ['alive', 'new'])
+
+    def test_close_after_expiry_does_not_go_negative(self):
+        redis_chat_service.register_connection(self.user_id, 'socket', self.room_id)
+        self.redis.delete(room_key(self.room_id, 'sockets'))
+        redis_chat_service.unregister_connection(self.user_id, 'socket', self.room_id)
+        redis_chat_service.register_connection(self.user_id, 'next', self.room_id)
+        self.assertEqual(self.sockets(), 1)
+
+    def test_heartbeat_does_not_bring_back_a_closed_socket(self):
+        redis_chat_service.register_connection(self.user_id, 'socket', self.room_id)
+        redis_chat_service.unregister_connection(self.user_id, 'socket', self.room_id)
+        redis_chat_service.presence_heartbeat(self.room_id, self.user_id, channel_name='socket')
+        self.assertEqual(self.sockets(), 0)
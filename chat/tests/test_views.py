@@ -0,0 +1,20 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from ..models import ChatRoom, ChatRoomMembership
+from .utils import LOCAL_SERVICES, FakeRedisMixin, make_room, make_user, requires_fakeredis
+
+
+@requires_fakeredis
+@LOCAL_SERVICES
+class ChatRoomRecentViewTests(FakeRedisMixin, TestCase):
+    def test_lists_only_rooms_the_user_belongs_to(self):
+        user, other = make_user(), make_user()
+        joined = make_room(members=[user, other])
+        not_joined = ChatRoom.objects.create(name='private', space=joined.space)
+        ChatRoomMembership.objects.create(chat_room=not_joined, user=other)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/chat/{joined.space_id}/chat-rooms/recent/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([room['id'] for room in response.data], [str(joined.id)])
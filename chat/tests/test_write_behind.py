@@ -0,0 +1,57 @@
+import uuid
+from unittest import mock
+from django.test import SimpleTestCase
+from ..services.redis_service import redis_chat_service, room_key
+from .utils import FakeRedisMixin, requires_fakeredis
+
+GROUP = 'persist'
+
+
+@requires_fakeredis
+class RetireDrainedStreamsTests(FakeRedisMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room_id = str(uuid.uuid4())
+        redis_chat_service.ensure_stream_group(self.room_id, GROUP)
+
+    def enqueue(self):
+        redis_chat_service.enqueue_message(self.room_id, {'id': str(uuid.uuid4()), 'room': self.room_id})
+
+    def drain(self):
+        entries = redis_chat_service.read_message_streams([self.room_id], GROUP, 'worker', block_ms=0)
+        redis_chat_service.ack_messages(self.room_id, GROUP, [entry_id for entry_id, _ in entries[self.room_id]])
+
+    def test_keeps_rooms_with_entries(self):
+        self.enqueue()
+        self.assertEqual(redis_chat_service.retire_drained_streams([self.room_id], GROUP), [])
+        self.assertIn(self.room_id, redis_chat_service.get_stream_rooms())
+
+    def test_keeps_rooms_with_unacked_entries(self):
+        self.enqueue()
+        redis_chat_service.read_message_streams([self.room_id], GROUP, 'worker', block_ms=0)
+        self.redis.xtrim(room_key(self.room_id, 'stream'), maxlen=0)
+        self.assertEqual(redis_chat_service.retire_drained_streams([self.room_id], GROUP), [])
+
+    def test_retires_drained_room_until_next_message(self):
+        self.enqueue()
+        self.drain()
+        self.assertEqual(redis_chat_service.retire_drained_streams([self.room_id], GROUP), [self.room_id])
+        self.assertNotIn(self.room_id, redis_chat_service.get_stream_rooms())
+
+        self.enqueue()
+        self.assertIn(self.room_id, redis_chat_service.get_stream_rooms())
+
+    def test_message_racing_the_removal_keeps_the_room(self):
+        self.enqueue()
+        self.drain()
+        srem = self.redis.srem
+
+        def srem_then_enqueue(*args):
+            # The message's XADD lands after the check but before the set removal is re-checked
+            removed = srem(*args)
+            self.redis.xadd(room_key(self.room_id, 'stream'), {'data': '{}'})
+            return removed
+
+        with mock.patch.object(self.redis, 'srem', srem_then_enqueue):
+            self.assertEqual(redis_chat_service.retire_drained_streams([self.room_id], GROUP), [])
+        self.assertIn(self.room_id, redis_chat_service.get_stream_rooms())
@@ -0,0 +1,90 @@
+# chat/tests/utils.py - Shared fixtures: fakeredis in place of Redis and the memory MessageStore
+import json
+import unittest
+import uuid
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from outh.models import User
+from space.models import Space, SpaceMembership
+from ..models import ChatRoom, ChatRoomMembership
+from ..services import message_store
+from ..services.redis_service import redis_chat_service
+
+try:
+    import fakeredis
+except ImportError:  # Test-only dependency; Lua scripts also need lupa
+    fakeredis = None
+
+requires_fakeredis = unittest.skipUnless(fakeredis, 'fakeredis is not installed')
+
+LOCAL_SERVICES = override_settings(
+    CHAT_MESSAGE_STORE='memory',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+
+
+class MemoryStoreMixin:
+    """Give each test an empty memory MessageStore"""
+
+    def setUp(self):
+        super().setUp()
+        message_store._stores.pop('memory', None)
+        self.addCleanup(message_store._stores.pop, 'memory', None)
+
+
+class FakeRedisMixin(MemoryStoreMixin):
+    """Also point redis_chat_service at an empty fakeredis server"""
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        saved = dict(redis_chat_service.__dict__)
+        redis_chat_service.__init__(self.redis)
+        self.addCleanup(self._restore_service, saved)
+
+    @staticmethod
+    def _restore_service(saved):
+        redis_chat_service.__dict__.clear()
+        redis_chat_service.__dict__.update(saved)
+
+
+def make_user(name=None) -> User:
+    name = name or f"user{uuid.uuid4().hex[:8]}"
+    return User.objects.create(username=name, email=f"{name}@example.invalid")
+
+
+def make_room(members=(), space_members=()):
+    """A room in a new space; members join the room (and the space), space_members only the space"""
+    owner = members[0] if members else make_user()
+    space = Space.objects.create(name=f"space-{uuid.uuid4().hex[:8]}", created_by=owner)
+    room = ChatRoom.objects.create(name='room', space=space)
+    for user in (*members, *space_members):
+        SpaceMembership.objects.get_or_create(user=user, space=space)
+    for user in members:
+        ChatRoomMembership.objects.create(chat_room=room, user=user)
+    return room
+
+
+async def connect_socket(user, room):
+    """An open chat socket for user in room, past its connection_established frame"""
+    from galileo.asgi import application
+    token = await sync_to_async(lambda: str(AccessToken.for_user(user)))()
+    communicator = WebsocketCommunicator(application, f"/ws/chat/{room.space_id}/{room.id}/?token={token}")
+    connected, _ = await communicator.connect()
+    if not connected:
+        raise AssertionError('socket was refused')
+    frame = await communicator.receive_json_from()
+    if frame['type'] != 'connection_established':
+        raise AssertionError(f"unexpected first frame {frame['type']}")
+    return communicator
+
+
+async def received_frames(communicator, wait=0.2):
+    """Frames a socket received until it has been quiet for wait seconds"""
+    frames = []
+    while not await communicator.receive_nothing(timeout=wait, interval=0.01):
+        frames.append(json.loads(await communicator.receive_from()))
+    return frames
@@ -1,26 +1,34 @@
 # chat/views.py
-from datetime import datetime
+from datetime import datetime, timezone as dt_timezone
 import json
 import uuid
 import logging
-from cassandra.cqlengine import connection
-from cassandra import ConsistencyLevel
 from rest_framework import status, generics
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.authentication import SessionAuthentication
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.shortcuts import get_object_or_404, render
+from django.http import StreamingHttpResponse
 from outh.models import User  # Keep your custom User import
 from django.utils import timezone
 from django.core.cache import cache
 from django.conf import settings  # Correct import
-from .models import ChatRoom, ChatRoomMembership, MessageScylla
+from .models import ChatRoom, ChatRoomMembership
 from .serializers import ChatRoomSerializer, ChatRoomMembershipSerializer, MessageSerializer
 from .permissions import *
 from .services.redis_service import redis_chat_service
+from .services.redis_pool import pool_stats, redis_breaker
+from .services.circuit_breaker import breaker_states
+from .services.message_store import MessageStoreUnavailable, get_message_store
+from .services.export_service import stream_room_export
+from .services.reaction_service import apply_reaction, get_message_reactions, is_valid_emoji
+from .services.message_service import HOT_ROOM_CACHE_SECONDS, MessageRejected, create_message, is_hot_room
+from . import metrics
+from .idempotency import begin_request
+from .fanout import group_send_room_sync, notify_user_sync
 from space.models import Space, SpaceMembership  # Adjust if your app is named differently
 
 
@@ -58,12 +66,43 @@ class ChatRoomListView(generics.ListCreateAPIView):
 
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
+        if redis_breaker.is_open:
+            # Stats are omitted rather than reported as zeros while Redis is unreachable
+            return response
+        stats = redis_chat_service.get_rooms_stats([room_data['id'] for room_data in response.data])
         for room_data in response.data:
-            room_id = room_data['id']
-            room_stats = redis_chat_service.get_room_stats(room_id)
-            room_data['stats'] = room_stats
+            room_data['stats'] = stats[str(room_data['id'])]
         return response
 
+class ChatRoomRecentView(APIView):
+    """
+    List the user's chat rooms in a space, most recently active first, with previews and unread counts
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated, HasSpaceAccess]
+
+    def get(self, request, space_id):
+        # Only rooms the user belongs to; activity in other rooms of the space is not theirs to see
+        rooms = list(ChatRoom.objects.filter(space__space_id=space_id, is_active=True,
+                                             memberships__user=request.user).distinct())
+        summaries = redis_chat_service.get_room_summaries(
+            str(request.user.user_id), [str(room.id) for room in rooms])
+
+        results = []
+        for room in rooms:
+            summary = summaries.get(str(room.id), {})
+            room_data = ChatRoomSerializer(room).data
+            room_data['last_message'] = summary.get('last_message')
+            room_data['unread_count'] = summary.get('unread_count', 0)
+            room_data['last_activity'] = summary.get('last_activity') or room.created_at.timestamp()
+            results.append(room_data)
+
+        results.sort(key=lambda room_data: room_data['last_activity'], reverse=True)
+        for room_data in results:
+            room_data['last_activity'] = datetime.fromtimestamp(room_data['last_activity'], tz=dt_timezone.utc).isoformat()
+        return Response(results)
+
+
 class ChatRoomDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a chat room with real-time stats
@@ -81,6 +120,9 @@ class ChatRoomDetailView(generics.RetrieveUpdateDestroyAPIView):
     def retrieve(self, request, *args, **kwargs):
         response = super().retrieve(request, *args, **kwargs)
         room_id = kwargs.get('chat_room_id')
+        if redis_breaker.is_open:
+            response.data['degraded'] = True
+            return response
         response.data['stats'] = redis_chat_service.get_room_stats(room_id)
         response.data['online_users'] = redis_chat_service.get_online_users(room_id)
         response.data['typing_users'] = redis_chat_service.get_typing_users(room_id)
@@ -145,6 +187,13 @@ class ChatRoomMembershipView(APIView):
         if not created:
             membership.is_admin = request.data.get('is_admin', membership.is_admin)
             membership.save()
+        else:
+            self._notify(user.user_id, {
+                'type': 'room_access_granted',
+                'room_id': str(chat_room.id),
+                'space_id': str(space_id),
+                'room_name': chat_room.name,
+            })
 
         return Response({
             "id": str(membership.id),
@@ -181,10 +230,18 @@ class ChatRoomMembershipView(APIView):
             membership = ChatRoomMembership.objects.get(chat_room=chat_room, user=user)
             membership.delete()
             redis_chat_service.set_user_offline(chat_room_id, str(user_id))
+            # Sockets of the removed user connected to this room close themselves on this event
+            self._notify(user.user_id, {'type': 'room_access_revoked', 'room_id': str(chat_room.id)})
             return Response(status=status.HTTP_204_NO_CONTENT)
         except (User.DoesNotExist, ChatRoomMembership.DoesNotExist):
             return Response({"error": "Membership not found"}, status=status.HTTP_404_NOT_FOUND)
 
+    def _notify(self, user_id, event):
+        try:
+            notify_user_sync(str(user_id), event)
+        except Exception as e:
+            logger.error(f"Error notifying user {user_id}: {str(e)}")
+
 
 class MessageView(APIView):
     """
@@ -219,18 +276,21 @@ class MessageView(APIView):
         if not before_time:  # Only use cache for most recent messages
             cached_messages = cache.get(cache_key)
 
+        if not before_time:
+            redis_chat_service.mark_room_read(str(chat_room.id), str(request.user.user_id))
+
         if cached_messages and not before_time:
             logger.debug(f"Retrieved {len(cached_messages)} messages from cache")
             return Response({
-                'messages': cached_messages[:limit],
+                'messages': self._attach_reactions(chat_room_id, cached_messages[:limit]),
                 'source': 'cache',
                 'count': len(cached_messages[:limit]),
                 'has_more': len(cached_messages) >= limit
             })
 
-        # Fetch from ScyllaDB
+        # Fetch from the message store (ScyllaDB unless CHAT_MESSAGE_STORE says otherwise)
         try:
-            messages = MessageScylla.get_messages_for_room(
+            messages = get_message_store().get_room_messages(
                 chat_room.id,
                 limit=limit + 1,  # Fetch one extra to check if there are more
                 before_time=before_time
@@ -250,21 +310,30 @@ class MessageView(APIView):
                     'media': msg.media
                 })
 
+            # Streamed messages may not be in Scylla yet; merge them from the Redis recent list
+            if not before_time and getattr(settings, 'CHAT_WRITE_BEHIND', False):
+                messages_list = self._merge_unpersisted(chat_room_id, messages_list, limit)
+
             # Cache recent messages if this is the first page
             if not before_time and messages_list:
-                cache.set(cache_key, messages_list, timeout=300)  # 5 minutes
+                timeout = HOT_ROOM_CACHE_SECONDS if is_hot_room(chat_room.id) else 300  # 5 minutes
+                cache.set(cache_key, messages_list, timeout=timeout)
 
             has_more = len(messages) > limit
 
-            logger.debug(f"Retrieved {len(messages_list)} messages from ScyllaDB")
+            logger.debug(f"Retrieved {len(messages_list)} messages from the message store")
             return Response({
-                'messages': messages_list,
+                'messages': self._attach_reactions(chat_room_id, messages_list),
                 'source': 'database',
                 'count': len(messages_list),
                 'has_more': has_more,
                 'next_cursor': messages_list[-1]['created_at'] if messages_list and has_more else None
             })
 
+        except MessageStoreUnavailable as e:
+            logger.warning(f"Message store unavailable, serving cached history: {str(e)}")
+            return self._degraded_history(chat_room_id, limit, before_time)
+
         except Exception as e:
             logger.error(f"Error fetching messages: {str(e)}")
             return Response(
@@ -287,61 +356,29 @@ class MessageView(APIView):
         if isinstance(data, Response):  # Error response
             return data
 
-        # Validate message content
-        content = data.get('content', '').strip()
-        if not content and not data.get('media'):
-            return Response(
-                {"error": "Message must have content or media"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if len(content) > 2000:  # Message length limit
-            return Response(
-                {"error": "Message too long (max 2000 characters)"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        idempotency = begin_request(request, f"message:{chat_room.id}", data)
+        if isinstance(idempotency, Response):  # Malformed Idempotency-Key
+            return idempotency
+        replay = idempotency.replay()
+        if replay is not None:
+            return replay
+        return idempotency.finish(self._create_message(request, chat_room, data))
 
+    def _create_message(self, request, chat_room, data):
         try:
-            # Create message
-            msg_id = uuid.uuid4()
-            reply_to = data.get('reply_to')
-            if reply_to:
-                try:
-                    reply_to = uuid.UUID(reply_to)
-                except ValueError:
-                    return Response(
-                        {"error": "Invalid reply_to UUID"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-            message = MessageScylla.create(
-                id=msg_id,
-                room=str(chat_room.id),
-                user=str(request.user.user_id),
-                content=content,
-                created_at=timezone.now(),
-                reply_to=reply_to,
-                media=data.get('media', [])
-            )
+            message_data, queued = create_message(chat_room, request.user.user_id, data)
+            return Response(message_data, status=status.HTTP_202_ACCEPTED if queued else status.HTTP_201_CREATED)
 
-            # Prepare response
-            user_info = self._get_user_info(str(request.user.user_id))
-            response_data = {
-                'id': str(message.id),
-                'room': message.room,
-                'user': message.user,
-                'user_info': user_info,
-                'content': message.content,
-                'created_at': message.created_at.isoformat(),
-                'reply_to': str(message.reply_to) if message.reply_to else None,
-                'media': message.media
-            }
-
-            # Update caches
-            self._update_caches(chat_room_id, response_data)
-
-            logger.info(f"Message created: {msg_id} in room {chat_room_id}")
-            return Response(response_data, status=status.HTTP_201_CREATED)
+        except MessageRejected as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        except MessageStoreUnavailable as e:
+            logger.warning(f"Message store unavailable, message not created: {str(e)}")
+            return Response(
+                {"error": "Message storage temporarily unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(e.retry_after)}
+            )
 
         except Exception as e:
             logger.error(f"Error creating message: {str(e)}")
@@ -350,6 +387,31 @@ class MessageView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _attach_reactions(self, chat_room_id, messages_list):
+        """Add aggregated reaction counts to a page of messages (not cached with the page)"""
+        counts = get_message_reactions(str(chat_room_id), [msg['id'] for msg in messages_list])
+        return [dict(msg, reactions=counts.get(msg['id'], {})) for msg in messages_list]
+
+    def _degraded_history(self, chat_room_id, limit, before_time):
+        """History while Scylla is unavailable: the first page from the Redis recent list, nothing older"""
+        messages_list = [] if before_time else redis_chat_service.get_cached_messages(str(chat_room_id), limit)
+        return Response({
+            'messages': messages_list,
+            'source': 'cache',
+            'degraded': True,
+            'count': len(messages_list),
+            'has_more': False
+        })
+
+    def _merge_unpersisted(self, chat_room_id, messages_list, limit):
+        """Merge recently sent messages that the persist worker may not have written yet"""
+        seen = {msg['id'] for msg in messages_list}
+        recent = [msg for msg in redis_chat_service.get_cached_messages(str(chat_room_id), limit) if msg['id'] not in seen]
+        if not recent:
+            return messages_list
+        merged = sorted(messages_list + recent, key=lambda msg: msg['created_at'], reverse=True)
+        return merged[:limit]
+
     def _parse_request_data(self, request):
         """Parse and validate request data"""
         if not request.data and request.body:
@@ -387,16 +449,84 @@ class MessageView(APIView):
 
         return user_info
 
-    def _update_caches(self, chat_room_id, message_data):
-        """Update various caches after message creation"""
-        # Update Redis real-time features
-        redis_chat_service.cache_message(chat_room_id, message_data)
-        redis_chat_service.increment_message_count(chat_room_id)
 
-        # Invalidate recent messages cache
-        cache_key = f"room:{chat_room_id}:messages:recent"
-        cache.delete(cache_key)
 
+class MessageReactionView(APIView):
+    """
+    Add or remove the current user's reaction on a message
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsChatRoomMember]
+
+    def post(self, request, space_id, chat_room_id, message_id):
+        return self._react(request, chat_room_id, message_id, add=True)
+
+    def delete(self, request, space_id, chat_room_id, message_id):
+        return self._react(request, chat_room_id, message_id, add=False)
+
+    def _react(self, request, chat_room_id, message_id, add):
+        emoji = request.data.get('emoji') or request.query_params.get('emoji')
+        if not is_valid_emoji(emoji):
+            return Response({"error": "A valid emoji is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = apply_reaction(str(chat_room_id), str(message_id), str(request.user.user_id), emoji, add=add)
+        if result is None:
+            return Response({"error": "Error updating reaction"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        if result['changed']:
+            try:
+                group_send_room_sync(
+                    chat_room_id,
+                    {
+                        'type': 'reaction_delta',
+                        'message_id': result['message_id'],
+                        'emoji': emoji,
+                        'count': result['count'],
+                    }
+                )
+            except Exception as e:
+                logger.error(f"Error broadcasting reaction: {str(e)}")
+
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class MessageExportView(APIView):
+    """
+    Stream a room's full message history as gzip-compressed NDJSON
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsChatRoomMember]
+
+    def get(self, request, space_id, chat_room_id):
+        try:
+            chat_room = ChatRoom.objects.get(id=chat_room_id, space__space_id=space_id)
+        except ChatRoom.DoesNotExist:
+            return Response({"error": "Chat room not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', 1000)), 1), 5000)
+        except (ValueError, TypeError):
+            return Response({"error": "Invalid page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Fail before the first byte while the store is down; once streaming, errors abort the transfer
+        try:
+            get_message_store().get_room_messages(str(chat_room.id), limit=1)
+        except MessageStoreUnavailable as e:
+            logger.warning(f"Message store unavailable, export of room {chat_room.id} refused: {str(e)}")
+            return Response(
+                {"error": "Message storage temporarily unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(e.retry_after)}
+            )
+
+        logger.info(f"User {request.user.user_id} exporting history of room {chat_room.id}")
+        response = StreamingHttpResponse(
+            stream_room_export(str(chat_room.id), page_size=page_size),
+            content_type='application/gzip'
+        )
+        response['Content-Disposition'] = f'attachment; filename="room-{chat_room.id}.ndjson.gz"'
+        response['X-Accel-Buffering'] = 'no'  # Let nginx pass chunks through as they are produced
+        return response
 
 
 class ChatHealthView(APIView):
@@ -408,11 +538,19 @@ class ChatHealthView(APIView):
 
     def get(self, request):
         redis_health = redis_chat_service.health_check()
-        return Response({
-            'status': 'healthy' if redis_health['status'] == 'healthy' else 'degraded',
+        breakers = breaker_states()
+        healthy = redis_health['status'] == 'healthy' and all(b['state'] == 'closed' for b in breakers.values())
+        data = {
+            'status': 'healthy' if healthy else 'degraded',
             'redis': redis_health,
+            'circuit_breakers': breakers,
+            'metrics': metrics.snapshot(),
+            'redis_pools': pool_stats(),
             'timestamp': datetime.now().isoformat()
-        })
+        }
+        if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+            data['persist_worker'] = redis_chat_service.get_persist_metrics()
+        return Response(data)
 
 class RoomStatsView(APIView):
     """
@@ -428,12 +566,92 @@ class RoomStatsView(APIView):
             return Response({"error": "Chat room not found"}, status=status.HTTP_404_NOT_FOUND)
 
         stats = redis_chat_service.get_room_stats(chat_room_id)
+        throughput = redis_chat_service.get_room_throughput([chat_room_id]).get(str(chat_room_id), {})
         online_users = redis_chat_service.get_online_users(chat_room_id)
         typing_users = redis_chat_service.get_typing_users(chat_room_id)
         return Response({
             'room_id': chat_room_id,
             'stats': stats,
+            'throughput': throughput,
             'online_users': online_users,
             'typing_users': typing_users,
             'timestamp': datetime.now().isoformat()
-        })
\ No newline at end of file
+        })
+
+class HotRoomsView(APIView):
+    """
+    Busiest rooms across all spaces over the last minute or two, with their live throughput
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+
+        hot_rooms = redis_chat_service.get_hot_rooms(limit)
+        throughput = redis_chat_service.get_room_throughput([room_id for room_id, _ in hot_rooms])
+        room_ids = []
+        for room_id, _ in hot_rooms:
+            try:
+                room_ids.append(uuid.UUID(room_id))
+            except ValueError:
+                continue
+        rooms = {str(room['id']): room for room in ChatRoom.objects.filter(id__in=room_ids).values('id', 'name', 'space_id')}
+        return Response({
+            'rooms': [
+                {
+                    'room_id': room_id,
+                    'name': rooms.get(room_id, {}).get('name'),
+                    'space_id': str(rooms[room_id]['space_id']) if room_id in rooms else None,
+                    'recent_messages': count,
+                    **throughput.get(room_id, {}),
+                }
+                for room_id, count in hot_rooms
+            ],
+            'timestamp': datetime.now().isoformat()
+        })
+
+class SpacePresenceView(APIView):
+    """
+    Users online anywhere in a space, and which of them are online in each of the requester's rooms
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated, HasSpaceAccess]
+
+    def get(self, request, space_id):
+        room_ids = [str(room_id) for room_id in ChatRoom.objects.filter(
+            space__space_id=space_id, is_active=True, memberships__user=request.user
+        ).values_list('id', flat=True)]
+        presence = redis_chat_service.get_space_presence(str(space_id), room_ids)
+        return Response({
+            'space_id': str(space_id),
+            'online_users': presence['online'],
+            'online_count': len(presence['online']),
+            'rooms': presence['rooms'],
+            'timestamp': datetime.now().isoformat()
+        })
+
+
+class MentionsView(APIView):
+    """
+    The requester's mentions in a space, newest first
+    """
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAuthenticated, HasSpaceAccess]
+
+    def get(self, request, space_id):
+        try:
+            limit = min(int(request.query_params.get('limit', 50)), 100)
+            before = request.query_params.get('before')
+            before = float(before) if before else None
+        except ValueError:
+            return Response({"error": "Invalid limit or before"}, status=status.HTTP_400_BAD_REQUEST)
+
+        mentions = redis_chat_service.get_mentions(str(request.user.user_id), str(space_id), limit, before)
+        return Response({
+            'mentions': mentions,
+            'next_cursor': mentions[-1]['score'] if len(mentions) == limit else None
+        })
@@ -10,14 +10,16 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'galileo.settings')
 django.setup()
 
 # Import middleware and routing after Django setup
-from chat.middleware import JWTAuthMiddleware
+from chat.middleware import ConnectAdmissionMiddleware, JWTAuthMiddleware
 from chat.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
-    "websocket": JWTAuthMiddleware(
-        URLRouter(
-            websocket_urlpatterns
+    "websocket": ConnectAdmissionMiddleware(
+        JWTAuthMiddleware(
+            URLRouter(
+                websocket_urlpatterns
+            )
         )
     ),
 })
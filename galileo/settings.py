@@ -92,11 +92,17 @@ AUTHENTICATION_BACKENDS = (
 
 )
 ASGI_APPLICATION = 'galileo.asgi.application'
+# Comma-separated host:port list; with several hosts channels_redis spreads groups (and so the
+# chat fan-out shard groups) across the nodes by consistent hashing.
+CHANNEL_REDIS_HOSTS = [
+    (host.rsplit(':', 1)[0], int(host.rsplit(':', 1)[1]))
+    for host in config('CHANNEL_REDIS_HOSTS', default='127.0.0.1:6379').split(',')
+]
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            'hosts': [('127.0.0.1', 6379)],
+            'hosts': CHANNEL_REDIS_HOSTS,
         },
     },
 }
@@ -157,6 +163,8 @@ DATABASES = {
                 'replication_factor': 1
             },
             'connection': {
+                # Register only; the driver session is opened by the first query, not by django.setup()
+                'lazy_connect': True,
                 'retry_connect': True,
                 'consistency': 'LOCAL_QUORUM',
             }
@@ -247,4 +255,69 @@ from rest_framework_simplejwt.settings import api_settings
 api_settings.USER_ID_FIELD = 'user_id'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Chat
+# Write-behind mode: MessageView.post appends to a per-room Redis Stream and
+# `manage.py persist_messages` drains the streams into ScyllaDB.
+CHAT_WRITE_BEHIND = config('CHAT_WRITE_BEHIND', default=False, cast=bool)
+CHAT_STREAM_MAXLEN = 100000  # Approximate cap per room stream
+CHAT_REACTION_COALESCE_MS = 100  # Reaction updates within this window go out as one reaction_delta frame
+CHAT_BATCH_THRESHOLD = 50  # Messages/s per connection above which new messages are batched
+CHAT_BATCH_WINDOW_MS = 30  # How long messages are buffered before one messages_batch frame is sent
+CHAT_OUTBOUND_QUEUE_SIZE = 256  # Frames buffered per WebSocket before typing/presence frames are shed
+CHAT_FANOUT_SHARDS = 8  # Shard groups per large room
+CHAT_FANOUT_LARGE_ROOM_ONLINE = 1000  # Online users at which a room switches to sharded fan-out
+CHAT_FANOUT_HOT_ROOM_DELIVERIES = 20000  # Messages/s x online users at which a smaller room is sharded too
+CHAT_PRESENCE_TIMEOUT = 300  # Seconds without a heartbeat before a user counts as offline in a room or space
+CHAT_PRESENCE_HEARTBEAT_SECONDS = 60  # Minimum interval between presence refreshes per connection
+CHAT_PRESENCE_GRACE_SECONDS = 10  # user_left is held back this long; a reconnect within it broadcasts neither left nor joined
+CHAT_SERVER_PING_SECONDS = 30  # A socket silent this long is sent a ping frame (0 = no pings and no idle reaping)
+CHAT_IDLE_TIMEOUT_SECONDS = 90  # A socket silent this long is dropped from its groups and presence and closed; keep above 2x the ping interval
+CHAT_CONNECT_RATE = 200  # New sockets per second each worker admits before asking clients to retry later (0 = no limit)
+CHAT_CONNECT_BURST = 400  # Connects a worker admits at once before CHAT_CONNECT_RATE applies
+CHAT_CONNECT_RETRY_MIN_SECONDS = 1.0  # Shortest retry delay suggested to a rejected client; jitter is added on top
+CHAT_MENTION_SYNC_SECONDS = 1.0  # How often a process replays a space's member changes into its mention trie
+CHAT_MENTIONS_KEPT = 500  # Newest mentions kept per user per space
+CHAT_MODERATION_SYNC_SECONDS = 5.0  # How often a process checks whether a space's moderation terms changed
+CHAT_HOT_ROOM_MESSAGES_PER_SECOND = 5  # Room rate above which cached history expires instead of being dropped per message
+CHAT_HOT_ROOM_CACHE_SECONDS = 2  # How long cached history lives in such a room
+CHAT_IDEMPOTENCY_TTL = 86400  # Seconds a create's response is kept for replay under its Idempotency-Key / client_msg_id
+# Redis: one pool per alias per process, shared by the chat service, rate limiter and cache
+# (chat.services.redis_pool); the channel layer keeps its own asyncio pools on CHANNEL_REDIS_HOSTS.
+# Needs Redis 7.0 or later: idempotency claims use SET ... NX GET, which older servers reject.
+REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/0')
+REDIS_POOL = {
+    'max_connections': config('REDIS_POOL_SIZE', default=50, cast=int),
+    'timeout': 2,  # Seconds to wait for a free connection when the pool is exhausted
+    'socket_connect_timeout': 1,
+    'socket_timeout': config('REDIS_COMMAND_TIMEOUT', default=2, cast=float),
+    'socket_keepalive': True,
+    'health_check_interval': 30,
+    'retry_on_timeout': False,
+}
+# Consecutive connection failures/timeouts before Redis or Scylla calls fail fast, and seconds
+# before one probe call is let through again
+CHAT_CIRCUIT_BREAKER = {
+    'failure_threshold': 5,
+    'reset_timeout': 10,
+}
+CACHES = {
+    'default': {
+        'BACKEND': 'chat.services.redis_pool.SharedRedisCache',
+        'LOCATION': REDIS_URL,
+    },
+}
+# Redis Cluster: chat keys are hash-tagged per room/user, so the service runs unchanged against a cluster
+REDIS_CLUSTER = config('REDIS_CLUSTER', default=False, cast=bool)
+REDIS_CLUSTER_NODES = [
+    (host.rsplit(':', 1)[0], int(host.rsplit(':', 1)[1]))
+    for host in config('REDIS_CLUSTER_NODES', default='127.0.0.1:7000').split(',')
+]
+# ScyllaDB driver: token-aware routing within SCYLLA_LOCAL_DC (None = the first contacted DC) and
+# per-operation execution profiles (chat.scylla.DEFAULT_EXECUTION_PROFILES); override keys here.
+SCYLLA_LOCAL_DC = config('SCYLLA_LOCAL_DC', default=None)
+SCYLLA_EXECUTION_PROFILES = {}
+# Message history backend: 'scylla' in production; 'sqlite' (CHAT_MESSAGE_STORE_PATH, default
+# in-memory) or 'memory' run chat without a Scylla cluster, e.g. for benchmarks and CI.
+CHAT_MESSAGE_STORE = config('CHAT_MESSAGE_STORE', default='scylla')
+CHAT_MESSAGE_STORE_PATH = config('CHAT_MESSAGE_STORE_PATH', default=':memory:')
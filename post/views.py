@@ -11,6 +11,8 @@ from space.models import Space, SpaceMembership
 from space.authentication import SpaceJWTAuthentication
 from rest_framework.authentication import SessionAuthentication
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from chat.services.moderation_service import flag_for_review, moderate_content
+from chat.idempotency import begin_request
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,12 +41,31 @@ class CreatePostView(generics.CreateAPIView):
             logger.error(f"Invalid or missing SpaceJWT for space {space_id} at {timezone.now()}")
             return Response({"error": "Valid SpaceJWT required for this space"}, status=status.HTTP_403_FORBIDDEN)
 
+        idempotency = begin_request(request, f"post:{space.space_id}", request.data)
+        if isinstance(idempotency, Response):  # Malformed Idempotency-Key
+            return idempotency
+        replay = idempotency.replay()
+        if replay is not None:
+            logger.info(f"Replaying post creation for user {request.user.user_id} in space {space_id} at {timezone.now()}")
+            return replay
+        return idempotency.finish(self._create_post(request, space))
+
+    def _create_post(self, request, space):
+        space_id = space.space_id
         # Prepare request data
         data = request.data.copy()
+        moderation = moderate_content(space.space_id, data.get('content', ''))
+        if moderation.blocked:
+            logger.warning(f"Post by user {request.user.user_id} in space {space_id} blocked by moderation at {timezone.now()}")
+            return Response({"error": "Post contains blocked terms"}, status=status.HTTP_400_BAD_REQUEST)
+        if moderation.text:
+            data['content'] = moderation.text
         # Pass user and space directly to serializer
         serializer = self.get_serializer(data=data, context={'user': request.user, 'space': space})
         if serializer.is_valid():
             post = serializer.save(user=request.user, space=space)
+            if moderation.flagged:
+                flag_for_review(space.space_id, 'post', post.id, request.user.user_id, moderation)
             logger.info(f"Post created by user {request.user.user_id} in space {space_id} at {timezone.now()}")
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         logger.error(f"Post creation failed: {serializer.errors} at {timezone.now()}")